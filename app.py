@@ -9,28 +9,23 @@ from PIL import Image
 from datetime import datetime, time, timedelta
 import pytz
 import time as system_time
-import requests
-from threading import Thread
+from geocoding import GoogleGeocodingClient, OfflineReverseGeocoder, ReverseGeocodeCache, offline_address
+from gazetteer import Gazetteer
+from location_store import LocationBatchWriter, append_sheet_rows, sheet_has_keys
+from location_tracking import GEOLOCATION_JS, LocationScheduler, LocationWriter, TrackingSession
+from demo_lines import demo_line_rows, demo_lines_from_demos
+from sheet_schemas import (
+    ATTENDANCE, DEMO_LINES, DEMOS, LOCATIONS, SALES, TICKETS, TRAVEL_HOTEL, VISITS,
+    AttendanceRow, DemoRow, LocationRow, SalesRow, TicketRow, TravelHotelRow, VisitRow
+)
+from streamlit_autorefresh import st_autorefresh
+from streamlit_js_eval import streamlit_js_eval
 
 # Initialize Google Sheets connection
 conn = st.connection("gsheets", type=GSheetsConnection)
 
 # Location tracking constants
-LOCATION_SHEET_COLUMNS = [
-    "Timestamp",
-    "Employee Name",
-    "Employee Code",
-    "Designation",
-    "Latitude",
-    "Longitude",
-    "Accuracy (meters)",
-    "Location Type",
-    "Address",
-    "City",
-    "State",
-    "Country",
-    "Postal Code"
-]
+LOCATION_SHEET_COLUMNS = LOCATIONS.columns
 
 def get_ist_time():
     """Get current time in Indian Standard Time (IST)"""
@@ -126,145 +121,17 @@ if Products.empty or Outlet.empty or Person.empty or Distributors.empty:
     st.stop()
 
 # Constants for sheet columns (remain the same as in your original code)
-SALES_SHEET_COLUMNS = [
-    "Invoice Number",
-    "Invoice Date",
-    "Employee Name",
-    "Employee Code",
-    "Designation",
-    "Discount Category",
-    "Transaction Type",
-    "Outlet Name",
-    "Outlet Contact",
-    "Outlet Address",
-    "Outlet State",
-    "Outlet City",
-    "Distributor Firm Name",
-    "Distributor ID",
-    "Distributor Contact Person",
-    "Distributor Contact Number",
-    "Distributor Email",
-    "Distributor Territory",
-    "Product ID",
-    "Product Name",
-    "Product Category",
-    "Quantity",
-    "Unit Price",
-    "Product Discount (%)",
-    "Discounted Unit Price",
-    "Total Price",
-    "GST Rate",
-    "CGST Amount",
-    "SGST Amount",
-    "Grand Total",
-    "Overall Discount (%)",
-    "Amount Discount (INR)",
-    "Payment Status",
-    "Amount Paid",
-    "Payment Receipt Path",
-    "Employee Selfie Path",
-    "Invoice PDF Path",
-    "Remarks",
-    "Delivery Status"
-]
+SALES_SHEET_COLUMNS = SALES.columns
 
-VISIT_SHEET_COLUMNS = [
-    "Visit ID",
-    "Employee Name",
-    "Employee Code",
-    "Designation",
-    "Outlet Name",
-    "Outlet Contact",
-    "Outlet Address",
-    "Outlet State",
-    "Outlet City",
-    "Visit Date",
-    "Entry Time",
-    "Exit Time",
-    "Visit Duration (minutes)",
-    "Visit Purpose",
-    "Visit Notes",
-    "Visit Selfie Path",
-    "Visit Status",
-    "Remarks"
-]
+VISIT_SHEET_COLUMNS = VISITS.columns
 
-ATTENDANCE_SHEET_COLUMNS = [
-    "Attendance ID",
-    "Employee Name",
-    "Employee Code",
-    "Designation",
-    "Date",
-    "Status",
-    "Location Link",
-    "Leave Reason",
-    "Check-in Time",
-    "Check-in Date Time"
-]
+ATTENDANCE_SHEET_COLUMNS = ATTENDANCE.columns
 
-TICKET_SHEET_COLUMNS = [
-    "Ticket ID",
-    "Raised By (Employee Name)",
-    "Raised By (Employee Code)",
-    "Raised By (Designation)",
-    "Raised By (Email)",
-    "Raised By (Phone)",
-    "Category",
-    "Subject",
-    "Details",
-    "Status",
-    "Date Raised",
-    "Time Raised",
-    "Resolution Notes",
-    "Date Resolved",
-    "Priority"
-]
+TICKET_SHEET_COLUMNS = TICKETS.columns
 
-TRAVEL_HOTEL_COLUMNS = [
-    "Request ID",
-    "Request Type",
-    "Employee Name",
-    "Employee Code",
-    "Designation",
-    "Email",
-    "Phone",
-    "Adhara Number",
-    "Hotel Name",
-    "Check In Date",
-    "Check Out Date",
-    "Travel Mode",
-    "From Location",
-    "To Location",
-    "Booking Date",
-    "Remarks",
-    "Status",
-    "Date Requested",
-    "Time Requested"
-]
+TRAVEL_HOTEL_COLUMNS = TRAVEL_HOTEL.columns
 
-DEMO_SHEET_COLUMNS = [
-    "Demo ID",
-    "Employee Name",
-    "Employee Code",
-    "Designation",
-    "Partner Employee",
-    "Partner Employee Code",
-    "Outlet Name",
-    "Outlet Contact",
-    "Outlet Address",
-    "Outlet State",
-    "Outlet City",
-    "Demo Date",
-    "Check-in Time",
-    "Check-out Time",
-    "Check-in Date Time",
-    "Duration (minutes)",
-    "Outlet Review",
-    "Remarks",
-    "Status",
-    "Products",
-    "Quantities"
-]
+DEMO_SHEET_COLUMNS = DEMOS.columns
 
 TICKET_CATEGORIES = [
     "HR Department",
@@ -412,19 +279,17 @@ def safe_sheet_operation(operation, *args, **kwargs):
 # Data logging functions updated for Google Sheets
 def log_sales_to_gsheet(conn, sales_data):
     try:
-        # Read all existing data first
-        existing_sales_data = conn.read(worksheet="Sales", ttl=5)
-        existing_sales_data = existing_sales_data.dropna(how="all")
-        
-        # Ensure columns match
-        sales_data = sales_data.reindex(columns=SALES_SHEET_COLUMNS)
-        
-        # Concatenate and drop any potential duplicates
-        updated_sales_data = pd.concat([existing_sales_data, sales_data], ignore_index=True)
-        updated_sales_data = updated_sales_data.drop_duplicates(subset=["Invoice Number", "Product Name"], keep="last")
-        
-        # Write back all data
-        conn.update(worksheet="Sales", data=updated_sales_data)
+        numbers = sales_data["Invoice Number"].unique()
+        if sheet_has_keys(conn, "Sales", SALES_SHEET_COLUMNS, "Invoice Number", numbers) is False:
+            # A new invoice: append its lines without reading the sheet
+            append_sheet_rows(conn, "Sales", sales_data, SALES_SHEET_COLUMNS)
+        else:
+            # Re-logged (or unknown): merge so the new lines replace the old ones
+            existing_sales_data = conn.read(worksheet="Sales", ttl=5)
+            existing_sales_data = existing_sales_data.dropna(how="all")
+            updated_sales_data = pd.concat([existing_sales_data, sales_data], ignore_index=True)
+            updated_sales_data = updated_sales_data.drop_duplicates(subset=["Invoice Number", "Product Name"], keep="last")
+            conn.update(worksheet="Sales", data=updated_sales_data)
         st.success("Sales data successfully logged to Google Sheets!")
     except Exception as e:
         st.error(f"Error logging sales data: {e}")
@@ -432,15 +297,8 @@ def log_sales_to_gsheet(conn, sales_data):
 
 def log_visit_to_gsheet(conn, visit_data):
     try:
-        existing_visit_data = conn.read(worksheet="Visits", ttl=5)
-        existing_visit_data = existing_visit_data.dropna(how="all")
-        
-        visit_data = visit_data.reindex(columns=VISIT_SHEET_COLUMNS)
-        
-        updated_visit_data = pd.concat([existing_visit_data, visit_data], ignore_index=True)
-        updated_visit_data = updated_visit_data.drop_duplicates(subset=["Visit ID"], keep="last")
-        
-        conn.update(worksheet="Visits", data=updated_visit_data)
+        # Visit IDs are new on every visit, so the row is appended rather than merged
+        append_sheet_rows(conn, "Visits", visit_data, VISIT_SHEET_COLUMNS)
         st.success("Visit data successfully logged to Google Sheets!")
     except Exception as e:
         st.error(f"Error logging visit data: {e}")
@@ -448,58 +306,59 @@ def log_visit_to_gsheet(conn, visit_data):
 
 def log_attendance_to_gsheet(conn, attendance_data):
     try:
-        existing_data = conn.read(worksheet="Attendance", ttl=5)
-        existing_data = existing_data.dropna(how="all")
-        
-        attendance_data = attendance_data.reindex(columns=ATTENDANCE_SHEET_COLUMNS)
-        
-        updated_data = pd.concat([existing_data, attendance_data], ignore_index=True)
-        updated_data = updated_data.drop_duplicates(subset=["Attendance ID"], keep="last")
-        
-        conn.update(worksheet="Attendance", data=updated_data)
+        # New rows are appended; the rest of the sheet is not read back or rewritten
+        append_sheet_rows(conn, "Attendance", attendance_data, ATTENDANCE_SHEET_COLUMNS)
         return True, None
     except Exception as e:
         return False, str(e)
 
 def log_ticket_to_gsheet(conn, ticket_data):
     try:
-        existing_data = conn.read(worksheet="Tickets", usecols=list(range(len(TICKET_SHEET_COLUMNS))), ttl=5)
-        existing_data = existing_data.dropna(how="all")
-        updated_data = pd.concat([existing_data, ticket_data], ignore_index=True)
-        conn.update(worksheet="Tickets", data=updated_data)
+        # New rows are appended; the rest of the sheet is not read back or rewritten
+        append_sheet_rows(conn, "Tickets", ticket_data, TICKET_SHEET_COLUMNS)
         return True, None
     except Exception as e:
         return False, str(e)
 
 def log_travel_hotel_request(conn, request_data):
     try:
-        existing_data = conn.read(worksheet="TravelHotelRequests", usecols=list(range(len(TRAVEL_HOTEL_COLUMNS))), ttl=5)
-        existing_data = existing_data.dropna(how="all")
-        updated_data = pd.concat([existing_data, request_data], ignore_index=True)
-        conn.update(worksheet="TravelHotelRequests", data=updated_data)
+        # New rows are appended; the rest of the sheet is not read back or rewritten
+        append_sheet_rows(conn, "TravelHotelRequests", request_data, TRAVEL_HOTEL_COLUMNS)
         return True, None
     except Exception as e:
         return False, str(e)
 
 def log_location_to_gsheet(conn, location_data):
-    """Log location data to Google Sheets"""
+    """Buffer location data for EmployeeLocations; rows reach the sheet in batches.
+
+    Runs on the location writer thread, so errors are returned, not shown.
+    """
     try:
-        # Read existing location data
-        existing_data = conn.read(worksheet="EmployeeLocations", ttl=5)
-        existing_data = existing_data.dropna(how="all")
-        
-        # Convert to DataFrame with correct column order
-        location_df = pd.DataFrame([location_data], columns=LOCATION_SHEET_COLUMNS)
-        
-        # Concatenate with existing data
-        updated_data = pd.concat([existing_data, location_df], ignore_index=True)
-        
-        # Write to Google Sheets
-        conn.update(worksheet="EmployeeLocations", data=updated_data)
-        return True
+        get_employee_locations_writer().append(
+            location_data.employee_code,
+            system_time.time(),
+            float(location_data.latitude),
+            float(location_data.longitude),
+            location_data.accuracy,
+            location_data
+        )
+        return True, None
     except Exception as e:
-        st.error(f"Error logging location data: {e}")
-        return False
+        return False, f"Error logging location data: {e}"
+
+def employee_location_rows(batch):
+    """Turn a buffered batch of fixes into EmployeeLocations rows"""
+    rows = LOCATIONS.to_frame(batch['extra'])
+    rows["Latitude"] = batch['lat']
+    rows["Longitude"] = batch['lng']
+    return rows
+
+@st.cache_resource
+def get_employee_locations_writer():
+    """Process-wide buffer that appends EmployeeLocations fixes in batches"""
+    return LocationBatchWriter(
+        lambda batch: append_sheet_rows(conn, "EmployeeLocations", employee_location_rows(batch), LOCATION_SHEET_COLUMNS)
+    )
 
 def update_delivery_status(conn, invoice_number, product_name, new_status):
     try:
@@ -562,183 +421,216 @@ def get_current_location():
         st.error(f"Error getting location: {e}")
         return None
 
-def reverse_geocode(lat, lng, api_key):
-    """Convert latitude/longitude to address using Google Maps Geocoding API"""
+# Optional city/postal centroids (City, State, Postal Code, Latitude, Longitude)
+CITY_COORDINATES_FILE = "India City Coordinates.csv"
+# A past fix only vouches for its own neighbourhood, not the whole city or PIN area
+PAST_FIX_RADIUS_KM = 0.5
+
+@st.cache_resource
+def get_offline_geocoder():
+    """Local reverse-geocoding index: city centroids from CITY_COORDINATES_FILE, plus
+    past Google-geocoded fixes that only answer within PAST_FIX_RADIUS_KM"""
+    geocoder = OfflineReverseGeocoder()
+    gazetteer = Gazetteer('India City - State.csv')
+    geocoder.load_csv(CITY_COORDINATES_FILE, gazetteer)
     try:
-        url = f"https://maps.googleapis.com/maps/api/geocode/json?latlng={lat},{lng}&key={api_key}"
-        response = requests.get(url)
-        data = response.json()
+        history = conn.read(worksheet="EmployeeLocations", ttl=300)
+        history = LOCATIONS.decode_frame(history.dropna(how="all"))
+        # Rows this index answered itself would only echo an earlier fix further out
+        offline = [
+            offline_address(city, state, postal_code, country)
+            for city, state, postal_code, country in zip(history["City"], history["State"], history["Postal Code"], history["Country"])
+        ]
+        history = history[history["Address"].astype(str) != pd.Series(offline, index=history.index)]
+        geocoder.load_rows(history.to_dict('records'), gazetteer, radius_km=PAST_FIX_RADIUS_KM)
+    except Exception:
+        pass
+    return geocoder
+
+@st.cache_resource
+def get_geocode_cache():
+    """Persistent geohash-keyed cache (~150 m cells) of Google reverse-geocode results"""
+    return ReverseGeocodeCache("geocode_cache.sqlite3", precision=7)
+
+@st.cache_resource
+def get_google_geocoding_client(api_key):
+    return GoogleGeocodingClient(api_key)
+
+def reverse_geocode(lat, lng, api_key=None):
+    """Convert latitude/longitude to address: cached Google answers for the
+    ~150 m cell first, then the local index, then Google itself"""
+    geocode_cache = get_geocode_cache()
+    address_data = geocode_cache.get(lat, lng)
+    if address_data:
+        return address_data
+
+    address_data = get_offline_geocoder().reverse_geocode(lat, lng)
+    if address_data or not api_key:
+        return address_data
+
+    address_data = google_reverse_geocode(lat, lng, api_key)
+    if address_data:
+        geocode_cache.put(lat, lng, address_data)
+    return address_data
+
+def google_reverse_geocode(lat, lng, api_key):
+    """Convert latitude/longitude to address using Google Maps Geocoding API.
+
+    Request errors are raised to the caller: this runs on the location
+    writer thread, where st.error would show nothing.
+    """
+    data = get_google_geocoding_client(api_key).reverse_geocode(lat, lng)
+    
+    if data['status'] == 'OK':
+        result = data['results'][0]
+        address = result.get('formatted_address', '')
+        
+        # Extract address components
+        components = {
+            'street': '',
+            'city': '',
+            'state': '',
+            'country': '',
+            'postal_code': ''
+        }
         
-        if data['status'] == 'OK':
-            result = data['results'][0]
-            address = result.get('formatted_address', '')
-            
-            # Extract address components
-            components = {
-                'street': '',
-                'city': '',
-                'state': '',
-                'country': '',
-                'postal_code': ''
-            }
-            
-            for component in result['address_components']:
-                if 'route' in component['types']:
-                    components['street'] = component['long_name']
-                elif 'locality' in component['types']:
-                    components['city'] = component['long_name']
-                elif 'administrative_area_level_1' in component['types']:
-                    components['state'] = component['long_name']
-                elif 'country' in component['types']:
-                    components['country'] = component['long_name']
-                elif 'postal_code' in component['types']:
-                    components['postal_code'] = component['long_name']
-            
-            return {
-                'address': address,
-                'components': components
-            }
-        else:
-            return None
-    except Exception as e:
-        st.error(f"Error in reverse geocoding: {e}")
+        for component in result['address_components']:
+            if 'route' in component['types']:
+                components['street'] = component['long_name']
+            elif 'locality' in component['types']:
+                components['city'] = component['long_name']
+            elif 'administrative_area_level_1' in component['types']:
+                components['state'] = component['long_name']
+            elif 'country' in component['types']:
+                components['country'] = component['long_name']
+            elif 'postal_code' in component['types']:
+                components['postal_code'] = component['long_name']
+        
+        return {
+            'address': address,
+            'components': components
+        }
+    else:
         return None
 
-def record_location(employee_name, location_type="periodic"):
-    """Record employee location to Google Sheets with proper JavaScript communication"""
+def write_location_fix(fix):
+    """Background-writer handler: geocode a queued fix and append it to EmployeeLocations"""
+    employee_row = Person[Person['Employee Name'] == fix['employee_name']]
+    if employee_row.empty:
+        return False, f"Unknown employee {fix['employee_name']}"
+    
+    # A fix is still worth keeping without an address
+    geocode_error = None
     try:
-        # Trigger the JavaScript to get location
-        st.write(
-            '<div data-st-trigger-location style="display:none;"></div>',
-            unsafe_allow_html=True
-        )
-        
-        # Use a unique key to trigger the location collection
-        trigger_key = str(uuid.uuid4())
-        st.session_state.trigger_location = trigger_key
-        
-        # Inject JavaScript that will respond to our trigger
-        st.write(
-            f'<script>window.parent.postMessage({{isStreamlitMessage: true, type: "streamlit:setComponentValue", key: "trigger_location", value: "{trigger_key}"}}, "*");</script>',
-            unsafe_allow_html=True
-        )
-        
-        # Wait for location to be set (with timeout)
-        max_wait = 10  # seconds
-        wait_time = 0
-        
-        while 'location_data' not in st.session_state and wait_time < max_wait:
-            system_time.sleep(1)
-            wait_time += 1
-        
-        if 'location_data' not in st.session_state:
-            st.error("Could not retrieve location data (timeout)")
-            return False
-        
-        location = st.session_state.location_data
-        del st.session_state.location_data  # Clear for next use
-        
-        # Get employee details
-        employee_code = Person[Person['Employee Name'] == employee_name]['Employee Code'].values[0]
-        designation = Person[Person['Employee Name'] == employee_name]['Designation'].values[0]
-        
-        # Get current timestamp
-        timestamp = get_ist_time().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Reverse geocode to get address
-        api_key = st.secrets["google_maps"]["google_maps_api_key"]
-        address_data = reverse_geocode(location['lat'], location['lng'], api_key)
-        
-        if not address_data:
-            st.error("Could not retrieve address information")
-            return False
-        
-        # Prepare location data
-        location_data = {
-            "Timestamp": timestamp,
-            "Employee Name": employee_name,
-            "Employee Code": employee_code,
-            "Designation": designation,
-            "Latitude": location['lat'],
-            "Longitude": location['lng'],
-            "Accuracy (meters)": location.get('accuracy', ''),
-            "Location Type": location_type,
-            "Address": address_data['address'],
-            "City": address_data['components']['city'],
-            "State": address_data['components']['state'],
-            "Country": address_data['components']['country'],
-            "Postal Code": address_data['components']['postal_code']
+        address_data = reverse_geocode(fix['lat'], fix['lng'], fix.get('api_key'))
+    except Exception as e:
+        address_data = None
+        geocode_error = f"Error in reverse geocoding: {e}"
+    if not address_data:
+        address_data = {
+            'address': '',
+            'components': {'street': '', 'city': '', 'state': '', 'country': '', 'postal_code': ''}
         }
-        
-        # Log to Google Sheets
-        return log_location_to_gsheet(conn, location_data)
     
-    except Exception as e:
-        st.error(f"Error recording location: {e}")
+    location_data = LocationRow(
+        timestamp=fix['timestamp'],
+        employee_name=fix['employee_name'],
+        employee_code=employee_row['Employee Code'].values[0],
+        designation=employee_row['Designation'].values[0],
+        latitude=fix['lat'],
+        longitude=fix['lng'],
+        accuracy=fix.get('accuracy'),
+        location_type=fix['location_type'],
+        address=address_data['address'],
+        city=address_data['components']['city'],
+        state=address_data['components']['state'],
+        country=address_data['components']['country'],
+        postal_code=address_data['components']['postal_code']
+    )
+    written, error = log_location_to_gsheet(conn, location_data)
+    return written, error or geocode_error
+
+@st.cache_resource
+def get_location_writer():
+    """Process-wide queue and thread that persist location fixes off the script thread"""
+    return LocationWriter(write_location_fix)
+
+def record_location(employee_name, location_type="periodic", key=None):
+    """Request a browser location fix without blocking the script.
+    
+    streamlit_js_eval returns None until the browser answers and then reruns
+    the script with the fix, which is queued once for the background writer.
+    Returns True once the fix for `key` has been queued.
+    """
+    key = key or f"location_{location_type}_{employee_name}"
+    queued_key = f"{key}_queued"
+    if st.session_state.get(queued_key):
+        return True
+    
+    fix = streamlit_js_eval(js_expressions=GEOLOCATION_JS, key=key)
+    if not fix or fix.get('lat') is None or fix.get('lng') is None:
         return False
+    
+    queued = get_location_writer().submit({
+        "employee_name": employee_name,
+        "location_type": location_type,
+        "timestamp": get_ist_time().strftime("%Y-%m-%d %H:%M:%S"),
+        "lat": fix['lat'],
+        "lng": fix['lng'],
+        "accuracy": fix.get('accuracy'),
+        "api_key": st.secrets.get("google_maps", {}).get("google_maps_api_key")
+    })
+    st.session_state[queued_key] = queued
+    return queued
+
+# How often a logged-in employee's location is captured
+LOCATION_TRACKING_INTERVAL_SECONDS = 3600
+# Rerun this long after a slot falls due, so the scheduler thread has marked it first
+LOCATION_REFRESH_SLACK_SECONDS = 5
+LOCATION_CAPTURE_RETRY_SECONDS = 60
+
+@st.cache_resource
+def get_location_scheduler():
+    """Single process-wide scheduler for periodic location capture"""
+    return LocationScheduler(interval_seconds=LOCATION_TRACKING_INTERVAL_SECONDS)
 
 def start_location_tracking(employee_name):
     """Start periodic location tracking for an employee"""
-    if 'location_tracking' not in st.session_state:
-        st.session_state.location_tracking = True
-    
-    def tracking_loop():
-        while st.session_state.get('location_tracking', False):
-            # Record location every hour
-            record_location(employee_name, "periodic")
-            system_time.sleep(3600)  # Sleep for 1 hour
-    
-    # Start tracking in a separate thread
-    Thread(target=tracking_loop, daemon=True).start()
+    stop_location_tracking()
+    session = TrackingSession(employee_name)
+    # The session state holds the only strong reference to the handle
+    st.session_state.location_tracking = session
+    get_location_scheduler().register(session)
 
 def stop_location_tracking():
     """Stop periodic location tracking"""
-    if 'location_tracking' in st.session_state:
-        st.session_state.location_tracking = False
-
-def inject_location_js():
-    """Inject JavaScript to get geolocation from browser and handle the response"""
-    js_code = """
-    <script>
-    // Function to get current location
-    function getLocation() {
-        if (navigator.geolocation) {
-            navigator.geolocation.getCurrentPosition(
-                function(position) {
-                    const locationData = {
-                        lat: position.coords.latitude,
-                        lng: position.coords.longitude,
-                        accuracy: position.coords.accuracy
-                    };
-                    // Use Streamlit's setComponentValue to send data back
-                    window.parent.postMessage({
-                        isStreamlitMessage: true,
-                        type: 'streamlit:setComponentValue',
-                        api: window.frameElement.getAttribute('data-st-lib-version'),
-                        key: "location_data",
-                        value: JSON.stringify(locationData)
-                    }, '*');
-                },
-                function(error) {
-                    console.error("Error getting location:", error);
-                },
-                {enableHighAccuracy: true, timeout: 10000, maximumAge: 0}
-            );
-        } else {
-            console.error("Geolocation is not supported by this browser.");
-        }
-    }
+    session = st.session_state.get('location_tracking')
+    if isinstance(session, TrackingSession):
+        get_location_scheduler().unregister(session)
+    st.session_state.location_tracking = False
+
+def poll_location_tracking():
+    """Capture a fix on this rerun if the scheduler has marked the session due"""
+    session = st.session_state.get('location_tracking')
+    if not isinstance(session, TrackingSession):
+        return
     
-    // Listen for messages from Streamlit to trigger location collection
-    window.addEventListener('message', function(event) {
-        if (event.data.type === 'streamlit:setComponentValue' && 
-            event.data.key === "trigger_location") {
-            getLocation();
-        }
-    });
-    </script>
-    """
-    st.components.v1.html(js_code, height=0)
+    if session.is_due():
+        key = f"periodic_fix_{id(session)}_{session.due_slot}"
+        if record_location(session.employee_name, "periodic", key=key):
+            session.captured_slot = session.due_slot
+    
+    # Rerun the page just after the scheduler marks the next slot due, so an idle
+    # page captures on time; a fix still pending is retried every minute
+    if session.is_due():
+        delay = LOCATION_CAPTURE_RETRY_SECONDS
+        refresh_key = f"location_tracking_refresh_{session.due_slot}_retry"
+    else:
+        until_due = session.seconds_until_due()
+        delay = LOCATION_TRACKING_INTERVAL_SECONDS if until_due is None else until_due + LOCATION_REFRESH_SLACK_SECONDS
+        # A new key per slot remounts the timer with the delay measured from now
+        refresh_key = f"location_tracking_refresh_{session.due_slot}"
+    st_autorefresh(interval=int(delay * 1000), key=refresh_key)
 
 def demo_page():
     st.title("Demo Management")
@@ -833,48 +725,51 @@ def demo_page():
                 partner_employee_code = Person[Person['Employee Name'] == partner_employee]['Employee Code'].values[0]
                 
                 # Prepare demo data with proper data types
-                demo_data = {
-                    "Demo ID": demo_id,
-                    "Employee Name": selected_employee,
-                    "Employee Code": Person[Person['Employee Name'] == selected_employee]['Employee Code'].values[0],
-                    "Designation": Person[Person['Employee Name'] == selected_employee]['Designation'].values[0],
-                    "Partner Employee": partner_employee,
-                    "Partner Employee Code": partner_employee_code,
-                    "Outlet Name": outlet_name,
-                    "Outlet Contact": outlet_contact,
-                    "Outlet Address": outlet_address,
-                    "Outlet State": outlet_state,
-                    "Outlet City": outlet_city,
-                    "Demo Date": demo_date.strftime("%d-%m-%Y"),  # Selected date
-                    "Check-in Time": check_in_datetime.strftime("%H:%M:%S"),
-                    "Check-out Time": check_out_datetime.strftime("%H:%M:%S"),
-                    "Check-in Date Time": current_datetime.strftime("%d-%m-%Y %H:%M:%S"),  # Actual timestamp
-                    "Duration (minutes)": round(duration, 2),
-                    "Outlet Review": outlet_review,
-                    "Remarks": remarks,
-                    "Status": "Completed",
-                    "Products": "|".join(selected_products),  # Changed to pipe separator
-                    "Quantities": "|".join(quantities)  # Changed to pipe separator
-                }
+                demo_data = DemoRow(
+                    demo_id=demo_id,
+                    employee_name=selected_employee,
+                    employee_code=Person[Person['Employee Name'] == selected_employee]['Employee Code'].values[0],
+                    designation=Person[Person['Employee Name'] == selected_employee]['Designation'].values[0],
+                    partner_employee=partner_employee,
+                    partner_employee_code=partner_employee_code,
+                    outlet_name=outlet_name,
+                    outlet_contact=outlet_contact,
+                    outlet_address=outlet_address,
+                    outlet_state=outlet_state,
+                    outlet_city=outlet_city,
+                    demo_date=demo_date.strftime("%d-%m-%Y"),  # Selected date
+                    check_in_time=check_in_datetime.strftime("%H:%M:%S"),
+                    check_out_time=check_out_datetime.strftime("%H:%M:%S"),
+                    check_in_date_time=current_datetime.strftime("%d-%m-%Y %H:%M:%S"),  # Actual timestamp
+                    duration_minutes=round(duration, 2),
+                    outlet_review=outlet_review,
+                    remarks=remarks,
+                    status="Completed",
+                    products="|".join(selected_products),  # Changed to pipe separator
+                    quantities="|".join(quantities)  # Changed to pipe separator
+                )
                 
                 # Log to Google Sheets
                 try:
-                    existing_data = conn.read(worksheet="Demos", usecols=list(range(len(DEMO_SHEET_COLUMNS))), ttl=5)
-                    existing_data = existing_data.dropna(how="all")
-                    
                     # Convert to DataFrame with correct column order
-                    demo_df = pd.DataFrame([demo_data], columns=DEMO_SHEET_COLUMNS)
+                    demo_df = DEMOS.to_frame([demo_data])
                     
-                    # Concatenate with existing data
-                    updated_data = pd.concat([existing_data, demo_df], ignore_index=True)
-                    
-                    # Write to Google Sheets
-                    conn.update(worksheet="Demos", data=updated_data)
-                    
-                    st.success(f"Demo {demo_id} recorded successfully!")
-                    st.balloons()
+                    # Append to Google Sheets
+                    append_sheet_rows(conn, "Demos", demo_df, DEMO_SHEET_COLUMNS)
                 except Exception as e:
                     st.error(f"Failed to record demo: {str(e)}")
+                else:
+                    st.success(f"Demo {demo_id} recorded successfully!")
+                    st.balloons()
+                    # The demo is saved: a DemoLines failure must not invite a resubmit,
+                    # as its lines can be rebuilt from the Demos row's Products/Quantities
+                    try:
+                        # One DemoLines row per product, appended in a single batch
+                        product_ids = Products.drop_duplicates('Product Name').set_index('Product Name')['Product ID'].astype(str).to_dict()
+                        demo_lines = demo_line_rows(demo_id, selected_products, quantities, product_ids)
+                        append_sheet_rows(conn, "DemoLines", DEMO_LINES.to_frame(demo_lines), DEMO_LINES.columns)
+                    except Exception as e:
+                        st.warning(f"Demo products were not saved to DemoLines: {str(e)}")
             else:
                 st.error("Please fill all required fields (Outlet and at least one product).")
     
@@ -982,12 +877,13 @@ def demo_page():
                 st.metric("Review", str(demo_details['Outlet Review']))
             
             st.subheader("Products Demonstrated")
-            products = demo_details['Products'].split(", ")
-            quantities = demo_details['Quantities'].split(", ")
-            
+            # Products are pipe-joined (older rows used ", "); parse them into one row per product
+            product_ids = Products.drop_duplicates('Product Name').set_index('Product Name')['Product ID'].astype(str).to_dict()
+            product_names = {product_id: name for name, product_id in product_ids.items()}
+            demo_lines = demo_lines_from_demos(filtered_data[filtered_data['Demo ID'] == selected_demo].head(1), product_ids)
             product_df = pd.DataFrame({
-                "Product": products,
-                "Quantity": quantities
+                "Product": [product_names.get(line.product_id, line.product_id) for line in demo_lines],
+                "Quantity": [line.quantity for line in demo_lines]
             })
             
             st.dataframe(
@@ -1082,25 +978,25 @@ def support_ticket_page():
                         current_date = get_ist_time().strftime("%d-%m-%Y")
                         current_time = get_ist_time().strftime("%H:%M:%S")
                         
-                        ticket_data = {
-                            "Ticket ID": ticket_id,
-                            "Raised By (Employee Name)": selected_employee,
-                            "Raised By (Employee Code)": employee_code,
-                            "Raised By (Designation)": designation,
-                            "Raised By (Email)": employee_email.strip(),
-                            "Raised By (Phone)": employee_phone.strip(),
-                            "Category": category,
-                            "Subject": subject,
-                            "Details": details,
-                            "Status": "Open",
-                            "Date Raised": current_date,
-                            "Time Raised": current_time,
-                            "Resolution Notes": "",
-                            "Date Resolved": "",
-                            "Priority": priority
-                        }
+                        ticket_data = TicketRow(
+                            ticket_id=ticket_id,
+                            employee_name=selected_employee,
+                            employee_code=employee_code,
+                            designation=designation,
+                            email=employee_email.strip(),
+                            phone=employee_phone.strip(),
+                            category=category,
+                            subject=subject,
+                            details=details,
+                            status="Open",
+                            date_raised=current_date,
+                            time_raised=current_time,
+                            resolution_notes="",
+                            date_resolved="",
+                            priority=priority
+                        )
                         
-                        ticket_df = pd.DataFrame([ticket_data])
+                        ticket_df = TICKETS.to_frame([ticket_data])
                         success, error = log_ticket_to_gsheet(conn, ticket_df)
                         
                         if success:
@@ -1283,29 +1179,29 @@ def travel_hotel_page():
                         current_date = get_ist_time().strftime("%d-%m-%Y")
                         current_time = get_ist_time().strftime("%H:%M:%S")
                         
-                        request_data = {
-                            "Request ID": request_id,
-                            "Request Type": "Travel",
-                            "Employee Name": selected_employee,
-                            "Employee Code": employee_code,
-                            "Designation": designation,
-                            "Email": employee_email.strip(),
-                            "Phone": employee_phone.strip(),
-                            "Adhara Number": adhara_number.strip(),
-                            "Hotel Name": "",
-                            "Check In Date": "",
-                            "Check Out Date": "",
-                            "Travel Mode": travel_mode,
-                            "From Location": from_location,
-                            "To Location": to_location,
-                            "Booking Date": booking_date.strftime("%d-%m-%Y"),
-                            "Remarks": remarks,
-                            "Status": "Pending",
-                            "Date Requested": current_date,
-                            "Time Requested": current_time
-                        }
+                        request_data = TravelHotelRow(
+                            request_id=request_id,
+                            request_type="Travel",
+                            employee_name=selected_employee,
+                            employee_code=employee_code,
+                            designation=designation,
+                            email=employee_email.strip(),
+                            phone=employee_phone.strip(),
+                            adhara_number=adhara_number.strip(),
+                            hotel_name="",
+                            check_in_date="",
+                            check_out_date="",
+                            travel_mode=travel_mode,
+                            from_location=from_location,
+                            to_location=to_location,
+                            booking_date=booking_date.strftime("%d-%m-%Y"),
+                            remarks=remarks,
+                            status="Pending",
+                            date_requested=current_date,
+                            time_requested=current_time
+                        )
                         
-                        request_df = pd.DataFrame([request_data])
+                        request_df = TRAVEL_HOTEL.to_frame([request_data])
                         success, error = log_travel_hotel_request(conn, request_df)
                         
                         if success:
@@ -1375,29 +1271,29 @@ def travel_hotel_page():
                         current_date = get_ist_time().strftime("%d-%m-%Y")
                         current_time = get_ist_time().strftime("%H:%M:%S")
                         
-                        request_data = {
-                            "Request ID": request_id,
-                            "Request Type": "Hotel",
-                            "Employee Name": selected_employee,
-                            "Employee Code": employee_code,
-                            "Designation": designation,
-                            "Email": employee_email.strip(),
-                            "Phone": employee_phone.strip(),
-                            "Adhara Number": adhara_number.strip(),
-                            "Hotel Name": hotel_name,
-                            "Check In Date": check_in_date.strftime("%d-%m-%Y"),
-                            "Check Out Date": check_out_date.strftime("%d-%m-%Y"),
-                            "Travel Mode": "",
-                            "From Location": "",
-                            "To Location": "",
-                            "Booking Date": "",
-                            "Remarks": remarks,
-                            "Status": "Pending",
-                            "Date Requested": current_date,
-                            "Time Requested": current_time
-                        }
+                        request_data = TravelHotelRow(
+                            request_id=request_id,
+                            request_type="Hotel",
+                            employee_name=selected_employee,
+                            employee_code=employee_code,
+                            designation=designation,
+                            email=employee_email.strip(),
+                            phone=employee_phone.strip(),
+                            adhara_number=adhara_number.strip(),
+                            hotel_name=hotel_name,
+                            check_in_date=check_in_date.strftime("%d-%m-%Y"),
+                            check_out_date=check_out_date.strftime("%d-%m-%Y"),
+                            travel_mode="",
+                            from_location="",
+                            to_location="",
+                            booking_date="",
+                            remarks=remarks,
+                            status="Pending",
+                            date_requested=current_date,
+                            time_requested=current_time
+                        )
                         
-                        request_df = pd.DataFrame([request_data])
+                        request_df = TRAVEL_HOTEL.to_frame([request_data])
                         success, error = log_travel_hotel_request(conn, request_df)
                         
                         if success:
@@ -1650,52 +1546,52 @@ def generate_invoice(customer_name, gst_number, contact_number, address, state,
         discounted_unit_price = unit_price * (1 - prod_discount/100)
         item_total = discounted_unit_price * quantity
         
-        sales_data.append({
-            "Invoice Number": invoice_number,
-            "Invoice Date": current_date,
-            "Employee Name": employee_name,
-            "Employee Code": Person[Person['Employee Name'] == employee_name]['Employee Code'].values[0],
-            "Designation": Person[Person['Employee Name'] == employee_name]['Designation'].values[0],
-            "Discount Category": discount_category,
-            "Transaction Type": transaction_type,
-            "Outlet Name": customer_name,
-            "Outlet Contact": contact_number,
-            "Outlet Address": address,
-            "Outlet State": state,
-            "Outlet City": city,
-            "Distributor Firm Name": distributor_firm_name,
-            "Distributor ID": distributor_id,
-            "Distributor Contact Person": distributor_contact_person,
-            "Distributor Contact Number": distributor_contact_number,
-            "Distributor Email": distributor_email,
-            "Distributor Territory": distributor_territory,
-            "Product ID": product_data['Product ID'],
-            "Product Name": product,
-            "Product Category": product_data['Product Category'],
-            "Quantity": quantity,
-            "Unit Price": unit_price,
-            "Product Discount (%)": prod_discount,
-            "Discounted Unit Price": discounted_unit_price,
-            "Total Price": item_total,
-            "GST Rate": "18%",
-            "CGST Amount": (item_total * tax_rate) / 2,
-            "SGST Amount": (item_total * tax_rate) / 2,
-            "Grand Total": item_total + (item_total * tax_rate),
-            "Payment Status": payment_status,
-            "Amount Paid": amount_paid if payment_status == "paid" else 0,
-            "Payment Receipt Path": payment_receipt_path if payment_status == "paid" else "",
-            "Employee Selfie Path": employee_selfie_path,
-            "Invoice PDF Path": f"invoices/{invoice_number}.pdf",
-            "Remarks": remarks,
-            "Delivery Status": "pending"  # Default status is pending
-        })
+        sales_data.append(SalesRow(
+            invoice_number=invoice_number,
+            invoice_date=current_date,
+            employee_name=employee_name,
+            employee_code=Person[Person['Employee Name'] == employee_name]['Employee Code'].values[0],
+            designation=Person[Person['Employee Name'] == employee_name]['Designation'].values[0],
+            discount_category=discount_category,
+            transaction_type=transaction_type,
+            outlet_name=customer_name,
+            outlet_contact=contact_number,
+            outlet_address=address,
+            outlet_state=state,
+            outlet_city=city,
+            distributor_firm_name=distributor_firm_name,
+            distributor_id=distributor_id,
+            distributor_contact_person=distributor_contact_person,
+            distributor_contact_number=distributor_contact_number,
+            distributor_email=distributor_email,
+            distributor_territory=distributor_territory,
+            product_id=product_data['Product ID'],
+            product_name=product,
+            product_category=product_data['Product Category'],
+            quantity=quantity,
+            unit_price=unit_price,
+            product_discount=prod_discount,
+            discounted_unit_price=discounted_unit_price,
+            total_price=item_total,
+            gst_rate="18%",
+            cgst_amount=(item_total * tax_rate) / 2,
+            sgst_amount=(item_total * tax_rate) / 2,
+            grand_total=item_total + (item_total * tax_rate),
+            payment_status=payment_status,
+            amount_paid=amount_paid if payment_status == "paid" else 0,
+            payment_receipt_path=payment_receipt_path if payment_status == "paid" else "",
+            employee_selfie_path=employee_selfie_path,
+            invoice_pdf_path=f"invoices/{invoice_number}.pdf",
+            remarks=remarks,
+            delivery_status="pending"  # Default status is pending
+        ))
 
     # Save the PDF
     pdf_path = f"invoices/{invoice_number}.pdf"
     pdf.output(pdf_path)
     
     # Log sales data to Google Sheets
-    sales_df = pd.DataFrame(sales_data)
+    sales_df = SALES.to_frame(sales_data)
     log_sales_to_gsheet(conn, sales_df)
 
     return pdf, pdf_path
@@ -1707,28 +1603,28 @@ def record_visit(employee_name, outlet_name, outlet_contact, outlet_address, out
     
     duration = (exit_time - entry_time).total_seconds() / 60
     
-    visit_data = {
-        "Visit ID": visit_id,
-        "Employee Name": employee_name,
-        "Employee Code": Person[Person['Employee Name'] == employee_name]['Employee Code'].values[0],
-        "Designation": Person[Person['Employee Name'] == employee_name]['Designation'].values[0],
-        "Outlet Name": outlet_name,
-        "Outlet Contact": outlet_contact,
-        "Outlet Address": outlet_address,
-        "Outlet State": outlet_state,
-        "Outlet City": outlet_city,
-        "Visit Date": visit_date,
-        "Entry Time": entry_time.strftime("%H:%M:%S"),
-        "Exit Time": exit_time.strftime("%H:%M:%S"),
-        "Visit Duration (minutes)": round(duration, 2),
-        "Visit Purpose": visit_purpose,
-        "Visit Notes": visit_notes,
-        "Visit Selfie Path": visit_selfie_path,
-        "Visit Status": "completed",
-        "Remarks": remarks
-    }
+    visit_data = VisitRow(
+        visit_id=visit_id,
+        employee_name=employee_name,
+        employee_code=Person[Person['Employee Name'] == employee_name]['Employee Code'].values[0],
+        designation=Person[Person['Employee Name'] == employee_name]['Designation'].values[0],
+        outlet_name=outlet_name,
+        outlet_contact=outlet_contact,
+        outlet_address=outlet_address,
+        outlet_state=outlet_state,
+        outlet_city=outlet_city,
+        visit_date=visit_date,
+        entry_time=entry_time.strftime("%H:%M:%S"),
+        exit_time=exit_time.strftime("%H:%M:%S"),
+        duration_minutes=round(duration, 2),
+        visit_purpose=visit_purpose,
+        visit_notes=visit_notes,
+        visit_selfie_path=visit_selfie_path,
+        visit_status="completed",
+        remarks=remarks
+    )
     
-    visit_df = pd.DataFrame([visit_data])
+    visit_df = VISITS.to_frame([visit_data])
     log_visit_to_gsheet(conn, visit_df)
     
     return visit_id
@@ -1743,20 +1639,20 @@ def record_attendance(employee_name, status, location_link="", leave_reason=""):
         
         attendance_id = generate_attendance_id()
         
-        attendance_data = {
-            "Attendance ID": attendance_id,
-            "Employee Name": employee_name,
-            "Employee Code": employee_code,
-            "Designation": designation,
-            "Date": current_date,
-            "Status": status,
-            "Location Link": location_link,
-            "Leave Reason": leave_reason,
-            "Check-in Time": check_in_time,
-            "Check-in Date Time": current_datetime
-        }
+        attendance_data = AttendanceRow(
+            attendance_id=attendance_id,
+            employee_name=employee_name,
+            employee_code=employee_code,
+            designation=designation,
+            date=current_date,
+            status=status,
+            location_link=location_link,
+            leave_reason=leave_reason,
+            check_in_time=check_in_time,
+            check_in_date_time=current_datetime
+        )
         
-        attendance_df = pd.DataFrame([attendance_data])
+        attendance_df = ATTENDANCE.to_frame([attendance_data])
         
         success, error = log_attendance_to_gsheet(conn, attendance_df)
         
@@ -1825,6 +1721,7 @@ def add_back_button():
     """, unsafe_allow_html=True)
     
     if st.button("← logout", key="back_button"):
+        stop_location_tracking()
         st.session_state.authenticated = False
         st.session_state.selected_mode = None
         st.rerun()
@@ -1841,18 +1738,6 @@ def main():
     if 'get_location' not in st.session_state:
         st.session_state.get_location = False
 
-    # Inject JavaScript for location tracking
-    inject_location_js()
-
-    if 'location_data' not in st.session_state:
-        try:
-            # This will capture the location data sent from JavaScript
-            location_json = st.query_params().get("location_data", [None])[0]
-            if location_json:
-                st.session_state.location_data = json.loads(location_json)
-        except:
-            pass
-
 
     if not st.session_state.authenticated:
         display_login_header()
@@ -1882,25 +1767,24 @@ def main():
                 
                 if login_button:
                     if authenticate_employee(employee_name, passkey):
-                        # Inject the JavaScript for location tracking
-                        inject_location_js()
+                        st.session_state.authenticated = True
+                        st.session_state.employee_name = employee_name
                         
-                        # Record login location
-                        location_recorded = record_location(employee_name, "login")
+                        # The login fix is captured asynchronously on the following reruns
+                        st.session_state.login_fix_key = f"login_fix_{uuid.uuid4().hex[:8]}"
                         
-                        if location_recorded:
-                            st.session_state.authenticated = True
-                            st.session_state.employee_name = employee_name
-                            
-                            # Start periodic location tracking
-                            start_location_tracking(employee_name)
-                            
-                            st.rerun()
-                        else:
-                            st.error("Failed to record login location. Please try again.")
+                        # Start periodic location tracking
+                        start_location_tracking(employee_name)
+                        
+                        st.rerun()
                     else:
                         st.error("Invalid Password. Please try again.")
     else:
+        if st.session_state.get('login_fix_key'):
+            if record_location(st.session_state.employee_name, "login", key=st.session_state.login_fix_key):
+                st.session_state.login_fix_key = None
+        poll_location_tracking()
+        
         st.title("Select Mode")
         col1, col2, col3, col4, col5, col6, col7 = st.columns(7)
         
@@ -1939,6 +1823,9 @@ def main():
                 st.session_state.selected_mode = "Demo"
                 st.rerun()
         
+        if is_admin(st.session_state.employee_name):
+            show_geocoding_stats()
+        
         if st.session_state.selected_mode:
             add_back_button()
             
@@ -2497,6 +2384,31 @@ def visit_page():
             except Exception as e:
                 st.error(f"Error retrieving visit data: {e}")
 
+def is_admin(employee_name):
+    """Admins are the Employee Codes listed under `admin_employee_codes` in the app secrets"""
+    try:
+        admin_codes = {str(code) for code in st.secrets.get("admin_employee_codes", [])}
+    except Exception:
+        return False
+    employee_row = Person[Person['Employee Name'] == employee_name]
+    return not employee_row.empty and str(employee_row['Employee Code'].values[0]) in admin_codes
+
+def show_geocoding_stats():
+    """Report how many Google Geocoding calls the cache has saved"""
+    cache_stats = get_geocode_cache().stats()
+    with st.expander("Location service stats"):
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Cache Hit Ratio", f"{cache_stats['hit_ratio']:.0%}")
+        col2.metric("API Calls Saved", cache_stats['saved_api_calls'])
+        col3.metric("Cached Areas", cache_stats['entries'])
+        # The writer threads keep their errors for the script thread to show
+        writer = get_location_writer()
+        if writer.last_error:
+            st.warning(f"Last location fix error: {writer.last_error} ({writer.failed} fixes not saved)")
+        batch_stats = get_employee_locations_writer().stats()
+        if batch_stats['last_error']:
+            st.warning(f"Last EmployeeLocations write error: {batch_stats['last_error']} ({batch_stats['pending']} rows waiting)")
+
 def attendance_page():
     st.title("Attendance Management")
     selected_employee = st.session_state.employee_name
@@ -0,0 +1,152 @@
+import sqlite3
+import threading
+
+import pandas as pd
+
+STATUS_COLUMNS = {"Present": "present", "Half Day": "half_day", "Leave": "leave"}
+
+
+class AttendanceRollup:
+    """Daily attendance totals keyed by (date, zone, employee), kept in SQLite.
+
+    Each attendance record is folded in once, on write, and the Attendance IDs
+    already counted are remembered, so re-adding rows (for example when
+    syncing from the sheet) never double counts. Reports read the rollup,
+    which grows with days x employees instead of with every record ever made.
+    Dates are stored as YYYY-MM-DD so ranges are plain string comparisons.
+    """
+
+    def __init__(self, path="attendance_rollup.sqlite3"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS attendance_daily ("
+            "date TEXT NOT NULL, zone TEXT NOT NULL, employee_code TEXT NOT NULL, "
+            "present INTEGER NOT NULL, half_day INTEGER NOT NULL, leave INTEGER NOT NULL, records INTEGER NOT NULL, "
+            "first_check_in INTEGER, PRIMARY KEY (date, zone, employee_code))"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS attendance_ids (attendance_id TEXT PRIMARY KEY)")
+        self._db.commit()
+
+    def _seen(self, ids):
+        seen = set()
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            seen.update(row[0] for row in self._db.execute(
+                f"SELECT attendance_id FROM attendance_ids WHERE attendance_id IN ({placeholders})", chunk
+            ))
+        return seen
+
+    def add(self, records, zones):
+        """Fold Attendance sheet rows into the rollup; returns how many were new.
+
+        `records` has the Attendance sheet columns; `zones` maps Employee Code
+        to Zone (employees without one are filed under "UNASSIGNED").
+        """
+        records = records.dropna(subset=["Attendance ID"]).drop_duplicates("Attendance ID")
+        if records.empty:
+            return 0
+        with self._lock:
+            ids = records["Attendance ID"].astype(str)
+            fresh = records[~ids.isin(self._seen(ids.tolist()))]
+            if fresh.empty:
+                return 0
+
+            codes = fresh["Employee Code"].astype(str)
+            check_in = pd.to_datetime(fresh["Check-in Time"].astype(str), format="%H:%M:%S", errors="coerce")
+            # A leave entry's time is when it was filed, not a check-in
+            check_in = check_in.where((fresh["Status"] != "Leave").to_numpy())
+            frame = pd.DataFrame({
+                "date": pd.to_datetime(fresh["Date"].astype(str).str.strip(), format="%d-%m-%Y", errors="coerce").dt.strftime("%Y-%m-%d"),
+                "zone": codes.map(zones).fillna("UNASSIGNED").astype(str),
+                "employee_code": codes,
+                "records": 1,
+                "first_check_in": check_in.dt.hour * 60 + check_in.dt.minute
+            })
+            for status, column in STATUS_COLUMNS.items():
+                frame[column] = (fresh["Status"] == status).astype(int).to_numpy()
+            frame = frame.dropna(subset=["date"])
+            daily = frame.groupby(["date", "zone", "employee_code"], as_index=False).agg(
+                present=("present", "sum"), half_day=("half_day", "sum"), leave=("leave", "sum"),
+                records=("records", "sum"), first_check_in=("first_check_in", "min")
+            )
+
+            self._db.executemany(
+                "INSERT INTO attendance_daily (date, zone, employee_code, present, half_day, leave, records, first_check_in) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (date, zone, employee_code) DO UPDATE SET "
+                "present = present + excluded.present, half_day = half_day + excluded.half_day, "
+                "leave = leave + excluded.leave, records = records + excluded.records, "
+                "first_check_in = MIN(COALESCE(first_check_in, excluded.first_check_in), "
+                "COALESCE(excluded.first_check_in, first_check_in))",
+                [
+                    (row.date, row.zone, row.employee_code, int(row.present), int(row.half_day), int(row.leave),
+                     int(row.records), None if pd.isna(row.first_check_in) else int(row.first_check_in))
+                    for row in daily.itertuples(index=False)
+                ]
+            )
+            self._db.executemany(
+                "INSERT OR IGNORE INTO attendance_ids (attendance_id) VALUES (?)",
+                [(attendance_id,) for attendance_id in fresh["Attendance ID"].astype(str)]
+            )
+            self._db.commit()
+            return len(fresh)
+
+    def version(self):
+        """Number of attendance records folded in; changes whenever the rollup does"""
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM attendance_ids").fetchone()[0]
+
+    def has_record(self, employee_code, date):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM attendance_daily WHERE employee_code = ? AND date = ? LIMIT 1",
+                (str(employee_code), date.strftime("%Y-%m-%d"))
+            ).fetchone()
+        return row is not None
+
+    def daily(self, start_date, end_date, zone=None):
+        """Rollup rows between two dates (inclusive), optionally for one zone"""
+        query = "SELECT * FROM attendance_daily WHERE date BETWEEN ? AND ?"
+        params = [start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")]
+        if zone:
+            query += " AND zone = ?"
+            params.append(zone)
+        with self._lock:
+            return pd.read_sql_query(query + " ORDER BY date, zone, employee_code", self._db, params=params)
+
+    def summary(self, start_date, end_date, zone=None):
+        """Per-employee Present/Half Day/Leave totals and average first check-in"""
+        query = (
+            "SELECT zone, employee_code, SUM(present) AS present, SUM(half_day) AS half_day, SUM(leave) AS leave, "
+            "COUNT(*) AS days, AVG(first_check_in) AS avg_check_in "
+            "FROM attendance_daily WHERE date BETWEEN ? AND ?"
+        )
+        params = [start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")]
+        if zone:
+            query += " AND zone = ?"
+            params.append(zone)
+        with self._lock:
+            frame = pd.read_sql_query(query + " GROUP BY zone, employee_code ORDER BY zone, employee_code", self._db, params=params)
+        minutes = frame["avg_check_in"].round()
+        frame["avg_check_in"] = [
+            "" if pd.isna(m) else f"{int(m) // 60:02d}:{int(m) % 60:02d}" for m in minutes
+        ]
+        return frame.rename(columns={
+            "zone": "Zone", "employee_code": "Employee Code", "present": "Present", "half_day": "Half Day",
+            "leave": "Leave", "days": "Days Recorded", "avg_check_in": "Avg Check-in"
+        })
+
+    def check_in_distribution(self, start_date, end_date, zone=None):
+        """Number of employee-days by hour of first check-in"""
+        query = (
+            "SELECT first_check_in / 60 AS hour, COUNT(*) AS employees FROM attendance_daily "
+            "WHERE date BETWEEN ? AND ? AND first_check_in IS NOT NULL"
+        )
+        params = [start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")]
+        if zone:
+            query += " AND zone = ?"
+            params.append(zone)
+        with self._lock:
+            return pd.read_sql_query(query + " GROUP BY hour ORDER BY hour", self._db, params=params)
@@ -0,0 +1,56 @@
+"""Bulk invoice regeneration for month-end accounts runs.
+
+Reads line items from an export of the Sales sheet and re-renders the PDFs
+without writing anything back to Google Sheets.
+
+    python batch_invoices.py --sales-csv Sales.csv --from 01-10-2025 --to 31-10-2025 --zip october.zip
+    python batch_invoices.py --sales-csv Sales.csv INV-20251001-1A2B3C4D INV-20251002-5E6F7A8B
+"""
+import argparse
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from invoice_render import outlet_gst_numbers, regenerate_invoices
+
+
+def parse_date(value):
+    return datetime.strptime(value, "%d-%m-%Y")
+
+def main():
+    parser = argparse.ArgumentParser(description="Regenerate invoice PDFs from cached Sales data")
+    parser.add_argument("invoices", nargs="*", help="Invoice numbers to regenerate")
+    parser.add_argument("--sales-csv", required=True, help="CSV export of the Sales worksheet")
+    parser.add_argument("--from", dest="start_date", type=parse_date, help="First invoice date (DD-MM-YYYY)")
+    parser.add_argument("--to", dest="end_date", type=parse_date, help="Last invoice date (DD-MM-YYYY)")
+    parser.add_argument("--outlets-csv", default="Invoice - Outlet.csv", help="Outlet master list, for customer GSTINs")
+    parser.add_argument("--output-dir", default="invoices", help="Directory for the regenerated PDFs")
+    parser.add_argument("--zip", dest="zip_path", help="Write all PDFs into this zip archive instead")
+    parser.add_argument("--workers", type=int, default=None, help="Number of rendering processes")
+    args = parser.parse_args()
+
+    if not args.invoices and args.start_date is None and args.end_date is None:
+        parser.error("give invoice numbers or a --from/--to date range")
+
+    sales_data = pd.read_csv(args.sales_csv, dtype={"Invoice Number": str})
+    gst_numbers = None
+    if os.path.exists(args.outlets_csv):
+        gst_numbers = outlet_gst_numbers(pd.read_csv(args.outlets_csv, dtype={"GST": str}))
+    rendered = regenerate_invoices(
+        sales_data,
+        invoice_numbers=args.invoices,
+        start_date=args.start_date,
+        end_date=args.end_date,
+        output_dir=args.output_dir,
+        zip_path=args.zip_path,
+        max_workers=args.workers,
+        gst_numbers=gst_numbers
+    )
+
+    destination = args.zip_path or args.output_dir
+    print(f"Regenerated {len(rendered)} invoice(s) into {destination}")
+
+
+if __name__ == "__main__":
+    main()
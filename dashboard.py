@@ -0,0 +1,65 @@
+import plotly.express as px
+
+
+def sales_trend_figure(daily_sales):
+    trend = daily_sales.sort_values("Date")
+    figure = px.line(trend, x="Date", y="Grand Total", markers=True, title="Daily Sales")
+    figure.update_layout(yaxis_title="Revenue (₹)", xaxis_title=None)
+    return figure
+
+
+def zone_leaderboard_figure(employee_sales, zones):
+    by_zone = employee_sales.assign(Zone=employee_sales["Employee Code"].map(zones).fillna("UNASSIGNED"))
+    by_zone = by_zone.groupby("Zone", as_index=False)[["Grand Total", "Quantity"]].sum().sort_values("Grand Total")
+    figure = px.bar(by_zone, x="Grand Total", y="Zone", orientation="h", text_auto=".3s", title="Zone Leaderboard")
+    figure.update_layout(xaxis_title="Revenue (₹)", yaxis_title=None)
+    return figure
+
+
+def product_mix_figure(product_sales, products):
+    catalogue = products.drop_duplicates("Product ID").set_index("Product ID")
+    mix = product_sales.assign(
+        Category=product_sales["Product ID"].map(catalogue["Product Category"]).fillna("Other"),
+        Product=product_sales["Product ID"].map(catalogue["Product Name"]).fillna(product_sales["Product ID"])
+    )
+    mix = mix[mix["Grand Total"] > 0]
+    return px.treemap(mix, path=["Category", "Product"], values="Grand Total", title="Product Mix")
+
+
+def demo_conversion_figure(conversions, names):
+    frame = conversions.assign(Employee=conversions["Employee Code"].map(names).fillna(conversions["Employee Code"]))
+    frame = frame.head(20).melt(id_vars=["Employee"], value_vars=["Demos", "Converted"], var_name="Outcome", value_name="Count")
+    figure = px.bar(frame, x="Employee", y="Count", color="Outcome", barmode="group", title="Demo Conversion")
+    figure.update_layout(xaxis_title=None)
+    return figure
+
+
+def attendance_heatmap_figure(attendance_daily):
+    frame = attendance_daily.assign(attended=attendance_daily["present"] + 0.5 * attendance_daily["half_day"])
+    grid = frame.pivot_table(index="zone", columns="date", values="attended", aggfunc="sum", fill_value=0)
+    figure = px.imshow(grid, aspect="auto", color_continuous_scale="Greens", title="Attendance by Zone and Day")
+    figure.update_layout(xaxis_title=None, yaxis_title=None, coloraxis_colorbar_title="Present")
+    return figure
+
+
+def build_dashboard(cube, rollup, conversions, products, zones, names, start_date, end_date):
+    """Every dashboard figure as plotly JSON, built only from pre-aggregated tables.
+
+    `conversions` is the period's per-employee demo conversion table
+    (DemoConversionEngine.employee_rates).
+    """
+    figures = {}
+    daily_sales = cube.query(("day",), start_date, end_date)
+    if not daily_sales.empty:
+        figures["sales_trend"] = sales_trend_figure(daily_sales)
+        figures["zone_leaderboard"] = zone_leaderboard_figure(cube.query(("employee",), start_date, end_date), zones)
+        figures["product_mix"] = product_mix_figure(cube.query(("product",), start_date, end_date), products)
+
+    if conversions is not None and not conversions.empty:
+        figures["demo_conversion"] = demo_conversion_figure(conversions, names)
+
+    attendance_daily = rollup.daily(start_date, end_date)
+    if not attendance_daily.empty:
+        figures["attendance_heatmap"] = attendance_heatmap_figure(attendance_daily)
+
+    return {name: figure.to_json() for name, figure in figures.items()}
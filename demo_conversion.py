@@ -0,0 +1,162 @@
+import threading
+
+import pandas as pd
+
+from outlet_index import normalize_name
+
+# A demo counts as converted if its outlet buys within this many days
+DEMO_CONVERSION_DAYS = 30
+
+
+def _dates(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        # Already parsed, e.g. the Sales History read; re-parsing ISO text dayfirst would swap day and month
+        return pd.Series(values).astype("datetime64[ns]")
+    return pd.to_datetime(pd.Series(values, dtype=object).astype(str).str.strip(), dayfirst=True, errors="coerce").astype("datetime64[ns]")
+
+
+def _match(events, sales, by, tolerance):
+    """Date of the first sale on or after each event with the same `by` keys (NaT if none within tolerance)"""
+    if events.empty or sales.empty:
+        return pd.Series(pd.NaT, index=events.index, dtype="datetime64[ns]")
+    lookup = events[by + ["date"]].astype({key: str for key in by}).reset_index().sort_values("date")
+    matched = pd.merge_asof(
+        lookup, sales[by + ["date", "sale_date"]].astype({key: str for key in by}).sort_values("date"),
+        on="date", by=by, direction="forward", tolerance=tolerance
+    ).set_index("index")
+    return matched["sale_date"].reindex(events.index)
+
+
+class DemoConversionEngine:
+    """Joins demos to later sales at the same outlet, incrementally.
+
+    A demo converts if its outlet has any sale within `window_days` on or
+    after the demo date; a demo line (demo, product) converts if that product
+    is sold there in the window. Sales are kept date-sorted per outlet and
+    per (outlet, product) and every join is a forward merge_asof, so:
+
+    - new demos are matched against all sales seen so far, and
+    - new sales are matched only against demos that have not converted yet,
+      since earlier sales already failed to convert them.
+
+    Rates are then counts over the per-demo flags, optionally for a date range.
+    """
+
+    def __init__(self, window_days=DEMO_CONVERSION_DAYS):
+        self.window = pd.Timedelta(days=window_days)
+        self._lock = threading.Lock()
+        self._demos = pd.DataFrame({
+            "demo_id": pd.Series(dtype=object), "employee": pd.Series(dtype=object),
+            "outlet": pd.Series(dtype=object), "date": pd.Series(dtype="datetime64[ns]"),
+            "converted_on": pd.Series(dtype="datetime64[ns]")
+        })
+        self._lines = pd.DataFrame({
+            "demo_id": pd.Series(dtype=object), "product": pd.Series(dtype=object),
+            "employee": pd.Series(dtype=object), "outlet": pd.Series(dtype=object),
+            "date": pd.Series(dtype="datetime64[ns]"), "converted_on": pd.Series(dtype="datetime64[ns]")
+        })
+        self._sales = pd.DataFrame({
+            "outlet": pd.Series(dtype=object), "product": pd.Series(dtype=object),
+            "date": pd.Series(dtype="datetime64[ns]"), "sale_date": pd.Series(dtype="datetime64[ns]")
+        })
+        self._seen_sales = set()
+        self._sales_fingerprint = None
+
+    @property
+    def version(self):
+        """Changes whenever demos, lines or sales are added"""
+        return len(self._demos), len(self._lines), len(self._seen_sales)
+
+    def add_demos(self, demos, lines):
+        """Fold new demos in: `demos` has the Demos sheet columns, `lines` has Demo ID and Product ID"""
+        demos = demos.dropna(subset=["Demo ID"]).drop_duplicates("Demo ID")
+        with self._lock:
+            demos = demos[~demos["Demo ID"].astype(str).isin(self._demos["demo_id"])]
+            if demos.empty:
+                return 0
+            new = pd.DataFrame({
+                "demo_id": demos["Demo ID"].astype(str).to_numpy(),
+                "employee": demos["Employee Code"].astype(str).to_numpy(),
+                "outlet": demos["Outlet Name"].map(normalize_name).to_numpy(),
+                "date": _dates(demos["Demo Date"]).to_numpy()
+            }).dropna(subset=["date"])
+            new["converted_on"] = _match(new, self._sales, ["outlet"], self.window).to_numpy()
+
+            new_lines = pd.DataFrame({
+                "demo_id": lines["Demo ID"].astype(str).to_numpy(),
+                "product": lines["Product ID"].astype(str).to_numpy()
+            }).drop_duplicates()
+            new_lines = new_lines.merge(new[["demo_id", "employee", "outlet", "date"]], on="demo_id")
+            new_lines["converted_on"] = _match(new_lines, self._sales, ["outlet", "product"], self.window).to_numpy()
+
+            self._demos = pd.concat([self._demos, new], ignore_index=True)
+            self._lines = pd.concat([self._lines, new_lines], ignore_index=True)
+            return len(new)
+
+    def add_sales(self, sales):
+        """Fold new Sales sheet rows in, converting any waiting demos they close"""
+        sales = sales.dropna(how="all")
+        keys = list(zip(sales["Invoice Number"].astype(str), sales["Product ID"].astype(str)))
+        with self._lock:
+            fresh = [key not in self._seen_sales for key in keys]
+            sales = sales[fresh]
+            if sales.empty:
+                return 0
+            self._seen_sales.update(key for key, is_fresh in zip(keys, fresh) if is_fresh)
+            dates = _dates(sales["Invoice Date"])
+            new = pd.DataFrame({
+                "outlet": sales["Outlet Name"].map(normalize_name).to_numpy(),
+                "product": sales["Product ID"].astype(str).to_numpy(),
+                "date": dates.to_numpy(),
+                "sale_date": dates.to_numpy()
+            }).dropna(subset=["date"])
+
+            # Only demos still waiting can be converted by these sales
+            for table, by in ((self._demos, ["outlet"]), (self._lines, ["outlet", "product"])):
+                waiting = table["converted_on"].isna()
+                if waiting.any():
+                    table.loc[waiting, "converted_on"] = _match(table[waiting], new, by, self.window)
+
+            self._sales = pd.concat([self._sales, new], ignore_index=True)
+            return len(new)
+
+    def refresh_sales(self, sales, fingerprint):
+        """Fold in a whole Sales sheet read if its fingerprint changed since the
+        last one, e.g. invoices written by another app; returns how many rows were new"""
+        if fingerprint == self._sales_fingerprint:
+            return 0
+        added = self.add_sales(sales)
+        self._sales_fingerprint = fingerprint
+        return added
+
+    def _window(self, table, start_date, end_date):
+        mask = pd.Series(True, index=table.index)
+        if start_date is not None:
+            mask &= table["date"] >= pd.Timestamp(start_date)
+        if end_date is not None:
+            mask &= table["date"] <= pd.Timestamp(end_date)
+        return table[mask]
+
+    @staticmethod
+    def _rates(table, key, column):
+        converted = table["converted_on"].notna()
+        result = pd.DataFrame({
+            column: table[key].value_counts(sort=False),
+            "Converted": table.loc[converted, key].value_counts(sort=False)
+        }).fillna(0).astype(int)
+        result["Conversion %"] = (100 * result["Converted"] / result[column]).round(1)
+        return result
+
+    def employee_rates(self, start_date=None, end_date=None):
+        """Demos, converted demos and conversion % per Employee Code"""
+        with self._lock:
+            demos = self._window(self._demos, start_date, end_date)
+        result = self._rates(demos, "employee", "Demos").rename_axis("Employee Code").reset_index()
+        return result.sort_values("Demos", ascending=False, ignore_index=True)
+
+    def product_rates(self, start_date=None, end_date=None):
+        """Times demonstrated, converted and conversion % per Product ID"""
+        with self._lock:
+            lines = self._window(self._lines, start_date, end_date)
+        result = self._rates(lines, "product", "Demos").rename_axis("Product ID").reset_index()
+        return result.sort_values("Demos", ascending=False, ignore_index=True)
@@ -0,0 +1,136 @@
+import sqlite3
+import threading
+
+import pandas as pd
+
+from sheet_schemas import DEMO_LINES, DemoLineRow
+
+
+def split_demo_field(value):
+    """Split a legacy Demos Products/Quantities cell.
+
+    Current rows join with "|"; older ones used ", ", which is only used as
+    the separator when the cell has no "|" at all.
+    """
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return []
+    text = str(value).strip()
+    if not text:
+        return []
+    parts = text.split("|") if "|" in text else text.split(", ")
+    return [part.strip() for part in parts]
+
+
+def demo_line_rows(demo_id, products, quantities, product_ids):
+    """DemoLines rows for one demo; `product_ids` maps Product Name to Product ID"""
+    rows = []
+    for product, quantity in zip(products, quantities):
+        try:
+            quantity = int(float(quantity))
+        except (TypeError, ValueError):
+            quantity = 1
+        rows.append(DemoLineRow(
+            demo_id=str(demo_id),
+            product_id=str(product_ids.get(product, product)),
+            quantity=quantity
+        ))
+    return rows
+
+
+def demo_lines_from_demos(demos, product_ids):
+    """DemoLines rows parsed once from the legacy Products/Quantities columns of Demos rows"""
+    rows = []
+    demos = demos.dropna(subset=["Demo ID"])
+    for demo_id, products, quantities in zip(demos["Demo ID"], demos["Products"], demos["Quantities"]):
+        products = split_demo_field(products)
+        quantities = split_demo_field(quantities)
+        quantities += ["1"] * (len(products) - len(quantities))
+        rows.extend(demo_line_rows(demo_id, products, quantities, product_ids))
+    return rows
+
+
+class DemoLineStore:
+    """DemoLines (Demo ID, Product ID, Quantity) kept in SQLite and indexed by Product ID.
+
+    A per-product total of demos and units is updated in the same
+    transaction as each new line, so product analytics read one row per
+    product instead of re-splitting every Demos row. Lines are keyed by
+    (Demo ID, Product ID), so re-adding them never double counts.
+    """
+
+    def __init__(self, path="demo_lines.sqlite3"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS demo_lines ("
+            "demo_id TEXT NOT NULL, product_id TEXT NOT NULL, quantity INTEGER NOT NULL, "
+            "PRIMARY KEY (demo_id, product_id))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS demo_lines_product ON demo_lines (product_id)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS demo_product_totals ("
+            "product_id TEXT PRIMARY KEY, demos INTEGER NOT NULL, quantity INTEGER NOT NULL)"
+        )
+        self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM demo_lines").fetchone()[0]
+
+    def add(self, rows):
+        """Store DemoLineRow records; returns how many were new"""
+        added = 0
+        with self._lock:
+            for row in rows:
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO demo_lines (demo_id, product_id, quantity) VALUES (?, ?, ?)",
+                    (row.demo_id, row.product_id, int(row.quantity))
+                )
+                if not cursor.rowcount:
+                    continue
+                self._db.execute(
+                    "INSERT INTO demo_product_totals (product_id, demos, quantity) VALUES (?, 1, ?) "
+                    "ON CONFLICT (product_id) DO UPDATE SET demos = demos + 1, quantity = quantity + excluded.quantity",
+                    (row.product_id, int(row.quantity))
+                )
+                added += 1
+            self._db.commit()
+        return added
+
+    def add_frame(self, frame):
+        """Store DemoLines sheet rows"""
+        return self.add(DEMO_LINES.from_frame(frame.dropna(how="all")))
+
+    def lines(self, demo_id):
+        """One demo's products and quantities"""
+        with self._lock:
+            frame = pd.read_sql_query(
+                "SELECT product_id, quantity FROM demo_lines WHERE demo_id = ? ORDER BY rowid",
+                self._db, params=[str(demo_id)]
+            )
+        return frame.rename(columns={"product_id": "Product ID", "quantity": "Quantity"})
+
+    def frame(self):
+        """Every stored line as Demo ID / Product ID / Quantity columns"""
+        with self._lock:
+            frame = pd.read_sql_query("SELECT demo_id, product_id, quantity FROM demo_lines", self._db)
+        return frame.rename(columns={"demo_id": "Demo ID", "product_id": "Product ID", "quantity": "Quantity"})
+
+    def product_totals(self, product_ids=None):
+        """Demos and units demonstrated per Product ID, most demonstrated first"""
+        query = "SELECT product_id, demos, quantity FROM demo_product_totals"
+        params = []
+        if product_ids is not None:
+            product_ids = [str(p) for p in product_ids]
+            query += f" WHERE product_id IN ({','.join('?' * len(product_ids))})"
+            params = product_ids
+        with self._lock:
+            frame = pd.read_sql_query(query + " ORDER BY demos DESC, quantity DESC", self._db, params=params)
+        return frame.rename(columns={"product_id": "Product ID", "demos": "Demos", "quantity": "Quantity"})
+
+    def demo_ids(self, product_id):
+        """Demos that featured one product, straight from the Product ID index"""
+        with self._lock:
+            return [row[0] for row in self._db.execute(
+                "SELECT demo_id FROM demo_lines WHERE product_id = ?", (str(product_id),)
+            )]
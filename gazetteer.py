@@ -0,0 +1,115 @@
+import csv
+import re
+
+# Fix-ups for State values in India City - State.csv
+STATE_FIXES = {
+    "Jammu and Kashma«r": "Jammu & Kashmir",
+    "Jammu and Kashmir": "Jammu & Kashmir"
+}
+IGNORED_STATES = {"Other"}
+
+_END = ""  # trie key holding the (city, state) entries that end at a node
+
+
+def normalize_place(value):
+    """Lower-case a place name and collapse everything but letters/digits to single spaces"""
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", str(value or "").lower()).split())
+
+
+class Gazetteer:
+    """Offline city/state lookup built from India City - State.csv.
+
+    Cities live in a character trie keyed by normalized name, so autocomplete
+    costs O(len(prefix)) to find the subtree plus the matches returned.
+    Cities are inserted alphabetically, which keeps every node's children
+    (and therefore the results) in alphabetical order.
+    """
+
+    def __init__(self, path="India City - State.csv"):
+        self._root = {}
+        self.state_cities = {}
+        self._state_keys = {}
+
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = []
+            for row in csv.DictReader(f):
+                city = (row.get("City") or "").strip()
+                state = (row.get("State") or "").strip()
+                state = STATE_FIXES.get(state, state)
+                if city and state and state not in IGNORED_STATES:
+                    rows.append((normalize_place(city), city, state))
+
+        for key, city, state in sorted(rows):
+            node = self._root
+            for char in key:
+                node = node.setdefault(char, {})
+            entries = node.setdefault(_END, [])
+            if (city, state) not in entries:
+                entries.append((city, state))
+                self.state_cities.setdefault(state, []).append(city)
+                self._state_keys[normalize_place(state)] = state
+
+    def states(self):
+        return sorted(self.state_cities)
+
+    def canonical_state(self, state):
+        return self._state_keys.get(normalize_place(state))
+
+    def _node(self, key):
+        node = self._root
+        for char in key:
+            node = node.get(char)
+            if node is None:
+                return None
+        return node
+
+    def autocomplete(self, prefix, state=None, limit=10):
+        """Return up to `limit` (city, state) pairs whose name starts with `prefix`"""
+        node = self._node(normalize_place(prefix))
+        if node is None:
+            return []
+        state = self.canonical_state(state) if state else None
+
+        results = []
+        stack = [node]
+        while stack and len(results) < limit:
+            current = stack.pop()
+            for city, city_state in current.get(_END, []):
+                if state is None or city_state == state:
+                    results.append((city, city_state))
+                    if len(results) >= limit:
+                        break
+            # Push children in reverse so they pop in alphabetical order
+            stack.extend(child for char, child in reversed(list(current.items())) if char != _END)
+        return results
+
+    def lookup(self, city):
+        """All (city, state) pairs with exactly this normalized name"""
+        node = self._node(normalize_place(city))
+        return list(node.get(_END, [])) if node else []
+
+    def validate(self, state, city):
+        """Check a manually entered State/City pair.
+
+        Returns (canonical state, canonical city, message); message is None
+        when the city is listed under the given state, otherwise a hint.
+        """
+        canonical_state = self.canonical_state(state) if state else None
+        matches = self.lookup(city)
+
+        for match_city, match_state in matches:
+            if canonical_state is None or match_state == canonical_state:
+                return match_state, match_city, None
+
+        if matches:
+            listed = ", ".join(sorted({s for _, s in matches}))
+            return canonical_state, city, f"'{city}' is listed under {listed}"
+
+        suggestions = []
+        key = normalize_place(city)
+        while key and not suggestions:
+            suggestions = self.autocomplete(key, state=canonical_state, limit=5)
+            key = key[:-1]
+        if suggestions:
+            return canonical_state, city, "City not found. Did you mean: " + ", ".join(c for c, _ in suggestions) + "?"
+        return canonical_state, city, "City not found in the city list"
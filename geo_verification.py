@@ -0,0 +1,196 @@
+import math
+import os
+
+import numpy as np
+import pandas as pd
+
+from geocoding import haversine_m_array
+from outlet_index import normalize_name
+
+OUTLET_COORDINATES_FILE = "Outlet Coordinates.csv"
+OUTLET_COORDINATES_COLUMNS = ["Shop Name", "City", "State", "Latitude", "Longitude"]
+
+# Records further than this from the claimed (or any) outlet are flagged
+VERIFY_RADIUS_M = 300
+# Visits and demos carry no coordinates; use the employee's fix closest in time within this window
+FIX_TOLERANCE_SECONDS = 30 * 60
+
+_CELL_ROW = 10_000_000  # key = lat cell * _CELL_ROW + lng cell
+
+
+def outlet_key(name, city):
+    return normalize_name(name) + "|" + normalize_name(city)
+
+
+def load_outlet_coordinates(path=OUTLET_COORDINATES_FILE):
+    """Outlet coordinate table (see geocode_outlets.py); empty if it has not been built"""
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=OUTLET_COORDINATES_COLUMNS)
+    frame = pd.read_csv(path)
+    frame["Latitude"] = pd.to_numeric(frame["Latitude"], errors="coerce")
+    frame["Longitude"] = pd.to_numeric(frame["Longitude"], errors="coerce")
+    return frame.dropna(subset=["Latitude", "Longitude"]).reset_index(drop=True)
+
+
+class OutletSpatialIndex:
+    """Uniform-grid index over outlet coordinates for batched nearest-outlet queries.
+
+    Outlets are sorted by grid-cell key and the cell is at least `radius_m`
+    wide at every latitude in the table, so the nearest outlet within
+    `radius_m` of a point is always in the 3 x 3 block of cells around it.
+    `nearest` gathers those candidates for all points at once with
+    searchsorted and measures them in a single vectorised haversine.
+    """
+
+    def __init__(self, coordinates, radius_m=1000):
+        self.coordinates = coordinates.reset_index(drop=True)
+        self.radius_m = radius_m
+        lat = self.coordinates["Latitude"].to_numpy(dtype=np.float64)
+        lng = self.coordinates["Longitude"].to_numpy(dtype=np.float64)
+        max_lat = min(float(np.abs(lat).max()) if len(lat) else 0.0, 85.0)
+        self.cell_deg = radius_m / (111320 * math.cos(math.radians(max_lat)))
+
+        keys = self._keys(lat, lng)
+        order = np.argsort(keys, kind="stable")
+        self._keys_sorted = keys[order]
+        self._ids = order
+        self._lat = lat[order]
+        self._lng = lng[order]
+        self._claimed = {
+            outlet_key(name, city): i
+            for i, (name, city) in enumerate(zip(self.coordinates["Shop Name"], self.coordinates["City"]))
+        }
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def _cells(self, lat, lng):
+        return np.floor(lat / self.cell_deg).astype(np.int64), np.floor(lng / self.cell_deg).astype(np.int64)
+
+    def _keys(self, lat, lng):
+        cell_lat, cell_lng = self._cells(lat, lng)
+        return cell_lat * _CELL_ROW + cell_lng
+
+    def nearest(self, lat, lng):
+        """Nearest outlet for every point: (outlet row positions, distances in metres).
+
+        Points without coordinates, or with no outlet within `radius_m`, get
+        position -1 and distance NaN.
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        count = len(lat)
+        ids = np.full(count, -1, dtype=np.int64)
+        distances = np.full(count, np.nan)
+        valid = ~(np.isnan(lat) | np.isnan(lng))
+        if not count or not len(self._keys_sorted) or not valid.any():
+            return ids, distances
+
+        points = np.flatnonzero(valid)
+        cell_lat, cell_lng = self._cells(lat[points], lng[points])
+        query_parts, candidate_parts = [], []
+        for d_lat in (-1, 0, 1):
+            for d_lng in (-1, 0, 1):
+                keys = (cell_lat + d_lat) * _CELL_ROW + (cell_lng + d_lng)
+                start = np.searchsorted(self._keys_sorted, keys, side="left")
+                sizes = np.searchsorted(self._keys_sorted, keys, side="right") - start
+                total = int(sizes.sum())
+                if not total:
+                    continue
+                # Expand each [start, start + size) range into candidate positions
+                offsets = np.arange(total) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+                query_parts.append(np.repeat(points, sizes))
+                candidate_parts.append(np.repeat(start, sizes) + offsets)
+        if not query_parts:
+            return ids, distances
+
+        queries = np.concatenate(query_parts)
+        candidates = np.concatenate(candidate_parts)
+        candidate_distances = haversine_m_array(lat[queries], lng[queries], self._lat[candidates], self._lng[candidates])
+        order = np.lexsort((candidate_distances, queries))
+        queries, candidates, candidate_distances = queries[order], candidates[order], candidate_distances[order]
+        first = np.r_[True, queries[1:] != queries[:-1]]
+        within = first & (candidate_distances <= self.radius_m)
+        ids[queries[within]] = self._ids[candidates[within]]
+        distances[queries[within]] = candidate_distances[within]
+        return ids, distances
+
+    def claimed(self, names, cities):
+        """Row positions of the named outlets (-1 where the outlet has no coordinates)"""
+        return np.array([self._claimed.get(outlet_key(n, c), -1) for n, c in zip(names, cities)], dtype=np.int64)
+
+
+def to_seconds(values, fmt):
+    """Parse date/time strings with `fmt` into float seconds (NaN when unparseable)"""
+    stamps = pd.to_datetime(pd.Series(values, dtype=object).astype(str).str.strip(), format=fmt, errors="coerce")
+    return ((stamps - pd.Timestamp(0)) / pd.Timedelta(seconds=1)).to_numpy(dtype=np.float64)
+
+
+def parse_maps_links(links):
+    """Latitude/longitude columns from 'https://maps.google.com/?q=lat,lng' links"""
+    parts = pd.Series(links, dtype=object).astype(str).str.extract(r"q=(-?\d+(?:\.\d+)?),\s*(-?\d+(?:\.\d+)?)")
+    return pd.to_numeric(parts[0], errors="coerce").to_numpy(), pd.to_numeric(parts[1], errors="coerce").to_numpy()
+
+
+def attach_nearest_fixes(events, fixes, tolerance_seconds=FIX_TOLERANCE_SECONDS):
+    """Add Latitude/Longitude to events from each employee's fix closest in time.
+
+    `events` needs Employee Code and ts (seconds); `fixes` is the dict
+    returned by route_analytics.load_fixes. One merge_asof covers all events.
+    """
+    events = events.reset_index(drop=True)
+    fix_frame = pd.DataFrame({
+        "Employee Code": fixes["employee_codes"][fixes["employee"]],
+        "ts": fixes["ts"],
+        "Latitude": fixes["lat"],
+        "Longitude": fixes["lng"]
+    }).sort_values("ts")
+    lookup = events[["Employee Code", "ts"]].astype({"Employee Code": str}).reset_index()
+    lookup = lookup.dropna(subset=["ts"]).sort_values("ts")
+    matched = pd.merge_asof(
+        lookup, fix_frame.astype({"Employee Code": str}), on="ts", by="Employee Code",
+        direction="nearest", tolerance=float(tolerance_seconds)
+    ).set_index("index")
+    events["Latitude"] = matched["Latitude"].reindex(events.index)
+    events["Longitude"] = matched["Longitude"].reindex(events.index)
+    return events
+
+
+def verify_locations(records, index, radius_m=VERIFY_RADIUS_M):
+    """Match every record to its nearest outlet and flag suspicious ones.
+
+    `records` needs Latitude/Longitude and optionally Outlet Name/Outlet City
+    (the outlet the employee claimed). Adds Nearest Outlet, Distance (m),
+    Distance to Claimed Outlet (m) and Flag columns.
+    """
+    records = records.reset_index(drop=True).copy()
+    lat = records["Latitude"].to_numpy(dtype=np.float64)
+    lng = records["Longitude"].to_numpy(dtype=np.float64)
+    nearest_ids, nearest_distances = index.nearest(lat, lng)
+
+    names = index.coordinates["Shop Name"].to_numpy(dtype=object)
+    found = nearest_ids >= 0
+    records["Nearest Outlet"] = ""
+    records.loc[found, "Nearest Outlet"] = names[nearest_ids[found]]
+    records["Distance (m)"] = np.round(nearest_distances)
+
+    claimed_distance = np.full(len(records), np.nan)
+    if "Outlet Name" in records and len(index):
+        claimed_ids = index.claimed(records["Outlet Name"], records.get("Outlet City", pd.Series("", index=records.index)))
+        known = (claimed_ids >= 0) & ~np.isnan(lat) & ~np.isnan(lng)
+        claimed_distance[known] = haversine_m_array(
+            lat[known], lng[known],
+            index.coordinates["Latitude"].to_numpy()[claimed_ids[known]],
+            index.coordinates["Longitude"].to_numpy()[claimed_ids[known]]
+        )
+    records["Distance to Claimed Outlet (m)"] = np.round(claimed_distance)
+
+    located = ~(np.isnan(lat) | np.isnan(lng))
+    far_from_claimed = claimed_distance > radius_m
+    no_outlet_near = located & (~found | (nearest_distances > radius_m))
+    records["Flag"] = np.select(
+        [~located, far_from_claimed, np.isnan(claimed_distance) & no_outlet_near],
+        ["No location", "Away from claimed outlet", "No outlet nearby"],
+        default="OK"
+    )
+    return records
@@ -0,0 +1,59 @@
+"""Build the outlet coordinate table used by visit geo-verification.
+
+Geocodes every outlet in the Outlet master that is not yet in
+Outlet Coordinates.csv and appends it, so each outlet costs one API call
+ever. Rows can also be corrected by hand with on-site coordinates.
+
+    python geocode_outlets.py --api-key KEY
+    python geocode_outlets.py --limit 200
+"""
+import argparse
+import os
+
+import pandas as pd
+
+from geo_verification import OUTLET_COORDINATES_COLUMNS, OUTLET_COORDINATES_FILE, load_outlet_coordinates, outlet_key
+from geocoding import GoogleGeocodingClient
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Geocode outlets missing from the outlet coordinate table")
+    parser.add_argument("--outlets-csv", default="Invoice - Outlet.csv", help="Outlet master list")
+    parser.add_argument("--output", default=OUTLET_COORDINATES_FILE, help="Outlet coordinate table to extend")
+    parser.add_argument("--api-key", default=os.environ.get("GOOGLE_MAPS_API_KEY"), help="Google Geocoding API key")
+    parser.add_argument("--limit", type=int, default=None, help="Geocode at most this many outlets")
+    args = parser.parse_args()
+
+    if not args.api_key:
+        parser.error("give --api-key or set GOOGLE_MAPS_API_KEY")
+
+    outlets = pd.read_csv(args.outlets_csv)
+    coordinates = load_outlet_coordinates(args.output)
+    known = {outlet_key(n, c) for n, c in zip(coordinates["Shop Name"], coordinates["City"])}
+    pending = [
+        row for _, row in outlets.iterrows()
+        if str(row["Shop Name"]) != "Primary" and outlet_key(row["Shop Name"], row["City"]) not in known
+    ][:args.limit]
+
+    client = GoogleGeocodingClient(args.api_key)
+    rows, failed = [], 0
+    for row in pending:
+        address = ", ".join(str(v) for v in [row["Shop Name"], row["Address"], row["City"], row["State"], "India"] if pd.notna(v))
+        try:
+            data = client.geocode(address)
+        except Exception:
+            data = {}
+        if data.get("status") != "OK":
+            failed += 1
+            continue
+        location = data["results"][0]["geometry"]["location"]
+        rows.append([row["Shop Name"], row["City"], row["State"], location["lat"], location["lng"]])
+
+    if rows:
+        new_rows = pd.DataFrame(rows, columns=OUTLET_COORDINATES_COLUMNS)
+        new_rows.to_csv(args.output, mode="a", header=not os.path.exists(args.output), index=False)
+    print(f"Geocoded {len(rows)} outlet(s), {failed} failed, {len(known)} already known")
+
+
+if __name__ == "__main__":
+    main()
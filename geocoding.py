@@ -0,0 +1,280 @@
+import csv
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+EARTH_RADIUS_M = 6371008.8
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in metres between two points"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def haversine_m_array(lat1, lng1, lat2, lng2):
+    """Element-wise haversine_m over NumPy arrays (or broadcastable scalars)"""
+    phi1, phi2 = np.radians(lat1), np.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = np.radians(np.asarray(lng2) - np.asarray(lng1))
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash_encode(lat, lng, precision=7):
+    """Standard geohash; precision 7 is a cell of roughly 150 m x 150 m"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        value, bounds = (lng, lng_range) if even else (lat, lat_range)
+        mid = (bounds[0] + bounds[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            bounds[0] = mid
+        else:
+            bits <<= 1
+            bounds[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def _float(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(number) else number
+
+
+def offline_address(city, state, postal_code="", country="India"):
+    """The address line OfflineReverseGeocoder builds for a place"""
+    return ", ".join(str(part) for part in [city, state, postal_code, country] if part)
+
+
+class OfflineReverseGeocoder:
+    """Nearest-place reverse geocoder over a local list of city/postal centroids.
+
+    Places are bucketed in a fixed lat/lng grid (`cell_deg` degrees per cell),
+    so a lookup only measures distances to places in the surrounding cells.
+    Each place answers for fixes within its own radius: `max_distance_km`
+    for centroids, much less for single geocoded points (`radius_km`), which
+    only say where one spot is. A fix outside every radius is a miss.
+    """
+
+    def __init__(self, cell_deg=0.1, max_distance_km=25):
+        self.cell_deg = cell_deg
+        self.max_distance_m = max_distance_km * 1000
+        self._cells = {}
+        self._keys = set()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _cell(self, lat, lng):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg))
+
+    def add(self, lat, lng, city, state, postal_code="", country="India", radius_km=None):
+        """Add one place, answering within `radius_km` (default `max_distance_km`);
+        duplicates (same rounded point and place) are ignored"""
+        lat, lng = _float(lat), _float(lng)
+        if lat is None or lng is None or not city:
+            return False
+        key = (round(lat, 4), round(lng, 4), str(city), str(state), str(postal_code or ""))
+        if key in self._keys:
+            return False
+        self._keys.add(key)
+        radius_m = self.max_distance_m if radius_km is None else min(radius_km * 1000, self.max_distance_m)
+        self._cells.setdefault(self._cell(lat, lng), []).append(
+            (lat, lng, str(city), str(state), str(postal_code or ""), str(country or "India"), radius_m)
+        )
+        return True
+
+    def load_rows(self, rows, gazetteer=None, radius_km=None):
+        """Add places from dict rows with Latitude, Longitude, City, State and
+        optionally Postal Code / Country columns. When a Gazetteer is given,
+        city/state spellings are canonicalised against India City - State.csv.
+        """
+        added = 0
+        for row in rows:
+            city = str(row.get("City") or "").strip()
+            state = str(row.get("State") or "").strip()
+            if gazetteer is not None and city:
+                canonical_state, canonical_city, message = gazetteer.validate(state, city)
+                if message is None:
+                    state, city = canonical_state, canonical_city
+            if self.add(row.get("Latitude"), row.get("Longitude"), city, state,
+                        row.get("Postal Code", ""), row.get("Country", "India"), radius_km):
+                added += 1
+        return added
+
+    def load_csv(self, path, gazetteer=None):
+        if not os.path.exists(path):
+            return 0
+        with open(path, newline="", encoding="utf-8") as f:
+            return self.load_rows(csv.DictReader(f), gazetteer)
+
+    def nearest(self, lat, lng):
+        """Return (distance in metres, place tuple) for the closest place whose radius covers the fix, or None"""
+        lat, lng = _float(lat), _float(lng)
+        if lat is None or lng is None:
+            return None
+        cell_lat, cell_lng = self._cell(lat, lng)
+        # Narrowest side of a cell at this latitude, in metres
+        cell_m = self.cell_deg * 111000 * max(math.cos(math.radians(lat)), 0.01)
+        max_rings = int(math.ceil(self.max_distance_m / cell_m)) + 1
+        best = None
+        for ring in range(max_rings + 1):
+            for d_lat in range(-ring, ring + 1):
+                for d_lng in range(-ring, ring + 1):
+                    if max(abs(d_lat), abs(d_lng)) != ring:
+                        continue
+                    for place in self._cells.get((cell_lat + d_lat, cell_lng + d_lng), ()):
+                        distance = haversine_m(lat, lng, place[0], place[1])
+                        if distance <= place[6] and (best is None or distance < best[0]):
+                            best = (distance, place)
+            # Anything in a further ring is at least `ring` whole cells away
+            if best is not None and best[0] <= ring * cell_m:
+                break
+        if best is None or best[0] > self.max_distance_m:
+            return None
+        return best
+
+    def reverse_geocode(self, lat, lng):
+        """Same result shape as the Google-based reverse_geocode, or None on a miss"""
+        match = self.nearest(lat, lng)
+        if match is None:
+            return None
+        _, (_, _, city, state, postal_code, country, _) = match
+        return {
+            'address': offline_address(city, state, postal_code, country),
+            'components': {
+                'street': '',
+                'city': city,
+                'state': state,
+                'country': country,
+                'postal_code': postal_code
+            }
+        }
+
+
+class ReverseGeocodeCache:
+    """Disk-backed reverse-geocode results keyed by geohash.
+
+    Entries older than `ttl_seconds` are treated as misses, and once more
+    than `max_entries` are stored the least recently used ones are evicted.
+    The SQLite file survives restarts and is shared by every session.
+    """
+
+    def __init__(self, path="geocode_cache.sqlite3", precision=7, ttl_seconds=30 * 24 * 3600, max_entries=50000):
+        self.precision = precision
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS geocode ("
+            "geohash TEXT PRIMARY KEY, result TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS geocode_last_used ON geocode (last_used)")
+        self._db.commit()
+
+    def key(self, lat, lng):
+        return geohash_encode(float(lat), float(lng), self.precision)
+
+    def get(self, lat, lng):
+        key = self.key(lat, lng)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT result, created FROM geocode WHERE geohash = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._db.execute("DELETE FROM geocode WHERE geohash = ?", (key,))
+                    self._db.commit()
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE geocode SET last_used = ? WHERE geohash = ?", (now, key))
+            self._db.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, lat, lng, result):
+        key = self.key(lat, lng)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO geocode (geohash, result, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(result), now, now)
+            )
+            count = self._db.execute("SELECT COUNT(*) FROM geocode").fetchone()[0]
+            if count > self.max_entries:
+                self._db.execute(
+                    "DELETE FROM geocode WHERE geohash IN (SELECT geohash FROM geocode ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,)
+                )
+            self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            entries = self._db.execute("SELECT COUNT(*) FROM geocode").fetchone()[0]
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "saved_api_calls": self.hits,
+                "entries": entries
+            }
+
+
+class GoogleGeocodingClient:
+    """Google Geocoding API client with a pooled keep-alive session and timeouts"""
+
+    URL = "https://maps.googleapis.com/maps/api/geocode/json"
+
+    def __init__(self, api_key, timeout=(3.05, 10), pool_size=10, retries=2):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.calls = 0
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+        self.session.mount("https://", adapter)
+
+    def reverse_geocode(self, lat, lng):
+        """Raw Geocoding API response for a point"""
+        self.calls += 1
+        response = self.session.get(
+            self.URL,
+            params={"latlng": f"{lat},{lng}", "key": self.api_key},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def geocode(self, address, region="in"):
+        """Raw Geocoding API response for a free-form address"""
+        self.calls += 1
+        response = self.session.get(
+            self.URL,
+            params={"address": address, "region": region, "key": self.api_key},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
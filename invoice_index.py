@@ -0,0 +1,281 @@
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+from invoice_render import with_gst_number
+from sheet_schemas import SALES
+
+HEADER_COLUMNS = {
+    "invoice_number": "Invoice Number",
+    "invoice_date": "Invoice Date",
+    "outlet_name": "Outlet Name",
+    "employee_code": "Employee Code",
+    "grand_total": "Grand Total",
+    "quantity": "Quantity",
+    "lines": "Lines",
+    "payment_status": "Payment Status",
+    "delivery_status": "Delivery Status"
+}
+
+
+# Sales columns the headers and offsets are built from; a change to any of them means a resync
+FINGERPRINT_COLUMNS = [
+    "Invoice Number", "Invoice Date", "Outlet Name", "Employee Code",
+    "Grand Total", "Quantity", "Payment Status", "Delivery Status"
+]
+
+
+def _text(values):
+    return values.fillna("").astype(str).str.strip()
+
+
+def _like(text):
+    """Escape LIKE wildcards so user text matches literally (used with ESCAPE '\\')"""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def sales_fingerprint(sales):
+    """Row count plus a hash of the indexed Sales columns, for a sheet read as returned by conn.read.
+
+    Cells are conformed to the Sales schema first, so the frame an app
+    writes and the same rows read back give the same fingerprint.
+    """
+    sales = SALES.decode_frame(sales.dropna(how="all"))[FINGERPRINT_COLUMNS]
+    digest = int(pd.util.hash_pandas_object(sales.astype(str), index=False).sum())
+    return f"{len(sales)}:{digest}"
+
+
+class InvoiceIndex:
+    """One header row per invoice plus the Sales sheet rows holding its lines, in SQLite.
+
+    Headers (date, outlet, employee, totals, payment and delivery status) are
+    written when the invoice is, so invoice lists are a single indexed query
+    instead of a groupby over every Sales line. `invoice_lines` maps each
+    invoice to the positions of its line items in the Sales sheet (after
+    dropping blank rows), so a detail view is one `iloc` into the sheet.
+    Dates are stored as YYYY-MM-DD so ranges are plain string comparisons.
+    """
+
+    def __init__(self, path="invoice_index.sqlite3"):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS invoice_headers ("
+            "invoice_number TEXT PRIMARY KEY, invoice_date TEXT, outlet_name TEXT, employee_code TEXT, "
+            "grand_total REAL NOT NULL, quantity REAL NOT NULL, lines INTEGER NOT NULL, "
+            "payment_status TEXT, delivery_status TEXT)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS invoice_headers_employee ON invoice_headers (employee_code, invoice_date)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS invoice_lines ("
+            "invoice_number TEXT NOT NULL, line INTEGER NOT NULL, sheet_row INTEGER NOT NULL, "
+            "PRIMARY KEY (invoice_number, line))"
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS index_state (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM invoice_headers").fetchone()[0]
+
+    @staticmethod
+    def _build(sales, positions):
+        """Header rows and (invoice, line, sheet row) offsets for the Sales rows at `positions`.
+
+        Lines are put in invoice order with a stable argsort of the factorized
+        invoice numbers; totals are bincounts and every other header field
+        comes from the invoice's first line.
+        """
+        rows = sales.iloc[positions]
+        codes, invoices = pd.factorize(_text(rows["Invoice Number"]).to_numpy())
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes, minlength=len(invoices))
+        starts = np.cumsum(counts) - counts
+        first = order[starts]
+
+        dates = rows["Invoice Date"]
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = pd.to_datetime(_text(dates), dayfirst=True, errors="coerce")
+        dates = dates.dt.strftime("%Y-%m-%d")
+        grand_total = pd.to_numeric(rows["Grand Total"], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+        quantity = pd.to_numeric(rows["Quantity"], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+        headers = pd.DataFrame({
+            "invoice_number": invoices,
+            "invoice_date": dates.to_numpy(dtype=object)[first],
+            "outlet_name": _text(rows["Outlet Name"]).to_numpy()[first],
+            "employee_code": _text(rows["Employee Code"]).to_numpy()[first],
+            "grand_total": np.round(np.bincount(codes, weights=grand_total, minlength=len(invoices)), 2),
+            "quantity": np.bincount(codes, weights=quantity, minlength=len(invoices)),
+            "lines": counts,
+            "payment_status": _text(rows["Payment Status"]).to_numpy()[first],
+            "delivery_status": _text(rows["Delivery Status"]).to_numpy()[first]
+        })
+        lines = pd.DataFrame({
+            "invoice_number": invoices[codes[order]],
+            "line": np.arange(len(order)) - np.repeat(starts, counts),
+            "sheet_row": np.asarray(positions)[order]
+        })
+        return headers, lines
+
+    def _write(self, headers, lines):
+        self._db.executemany(
+            "INSERT OR REPLACE INTO invoice_headers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (row.invoice_number, None if pd.isna(row.invoice_date) else row.invoice_date, row.outlet_name,
+                 row.employee_code, float(row.grand_total), float(row.quantity), int(row.lines),
+                 row.payment_status, row.delivery_status)
+                for row in headers.itertuples(index=False)
+            ]
+        )
+        self._db.executemany(
+            "INSERT INTO invoice_lines (invoice_number, line, sheet_row) VALUES (?, ?, ?)",
+            [(row.invoice_number, int(row.line), int(row.sheet_row)) for row in lines.itertuples(index=False)]
+        )
+
+    def _set_fingerprint(self, fingerprint):
+        self._db.execute("INSERT OR REPLACE INTO index_state VALUES ('fingerprint', ?)", (fingerprint,))
+
+    @property
+    def fingerprint(self):
+        """Fingerprint of the Sales sheet the index was last built or updated from"""
+        with self._lock:
+            row = self._db.execute("SELECT value FROM index_state WHERE key = 'fingerprint'").fetchone()
+        return row[0] if row else None
+
+    def sync(self, sales, fingerprint=None):
+        """Rebuild every header and line offset from the whole Sales sheet.
+
+        Pass the `sales_fingerprint` of the raw read when `sales` has already
+        been converted (dates parsed and so on).
+        """
+        sales = sales.dropna(how="all")
+        if fingerprint is None:
+            fingerprint = sales_fingerprint(sales)
+        headers, lines = self._build(sales, np.arange(len(sales)))
+        with self._lock:
+            self._db.execute("DELETE FROM invoice_headers")
+            self._db.execute("DELETE FROM invoice_lines")
+            self._write(headers, lines)
+            self._set_fingerprint(fingerprint)
+            self._db.commit()
+        return len(headers)
+
+    def refresh(self, sales, fingerprint):
+        """Resync if the Sales sheet changed since the index last saw it, e.g.
+        invoices written or edited by another app; returns whether it did"""
+        if fingerprint == self.fingerprint:
+            return False
+        self.sync(sales, fingerprint)
+        return True
+
+    def record(self, sales, invoice_numbers):
+        """Refresh the headers and line offsets of the given invoices after a write.
+
+        `sales` is the Sales sheet exactly as written (blank rows dropped);
+        only the rows of `invoice_numbers` are re-read from it.
+        """
+        sales = sales.dropna(how="all")
+        invoice_numbers = sorted({str(n).strip() for n in invoice_numbers})
+        positions = np.flatnonzero(_text(sales["Invoice Number"]).isin(invoice_numbers).to_numpy())
+        headers, lines = self._build(sales, positions)
+        fingerprint = sales_fingerprint(sales)
+        with self._lock:
+            self._db.executemany("DELETE FROM invoice_lines WHERE invoice_number = ?", [(n,) for n in invoice_numbers])
+            self._write(headers, lines)
+            self._set_fingerprint(fingerprint)
+            self._db.commit()
+        return len(headers)
+
+    def set_delivery_status(self, invoice_number, status):
+        with self._lock:
+            self._db.execute(
+                "UPDATE invoice_headers SET delivery_status = ? WHERE invoice_number = ?",
+                (status, str(invoice_number))
+            )
+            self._db.commit()
+
+    def headers(self, employee_code=None, invoice_number=None, invoice_date=None, outlet_name=None, invoice_prefix=None):
+        """Invoice headers, newest first, optionally narrowed like the Sales History filters.
+
+        `invoice_number` and `outlet_name` are case-insensitive substrings,
+        `invoice_date` an exact date and `invoice_prefix` a leading match.
+        """
+        query = "SELECT * FROM invoice_headers WHERE 1 = 1"
+        params = []
+        if employee_code is not None:
+            query += " AND employee_code = ?"
+            params.append(str(employee_code))
+        if invoice_number:
+            query += " AND invoice_number LIKE ? ESCAPE '\\'"
+            params.append(f"%{_like(invoice_number.strip())}%")
+        if invoice_prefix:
+            query += " AND invoice_number LIKE ? ESCAPE '\\'"
+            params.append(f"{_like(invoice_prefix.strip())}%")
+        if invoice_date:
+            query += " AND invoice_date = ?"
+            params.append(invoice_date.strftime("%Y-%m-%d"))
+        if outlet_name:
+            query += " AND outlet_name LIKE ? ESCAPE '\\'"
+            params.append(f"%{_like(outlet_name.strip())}%")
+        with self._lock:
+            frame = pd.read_sql_query(query + " ORDER BY invoice_date DESC, invoice_number DESC", self._db, params=params)
+        frame["invoice_date"] = pd.to_datetime(frame["invoice_date"], format="%Y-%m-%d", errors="coerce")
+        return frame.rename(columns=HEADER_COLUMNS)
+
+    def header(self, invoice_number):
+        """One invoice's header as a dict, or None"""
+        with self._lock:
+            frame = pd.read_sql_query(
+                "SELECT * FROM invoice_headers WHERE invoice_number = ?", self._db, params=[str(invoice_number)]
+            )
+        if frame.empty:
+            return None
+        frame["invoice_date"] = pd.to_datetime(frame["invoice_date"], format="%Y-%m-%d", errors="coerce")
+        return frame.rename(columns=HEADER_COLUMNS).iloc[0].to_dict()
+
+    def line_rows(self, invoice_numbers):
+        """Sales sheet row positions of the invoices' lines, grouped by invoice in the order given"""
+        invoice_numbers = [str(n) for n in invoice_numbers]
+        rank = {n: i for i, n in enumerate(invoice_numbers)}
+        found = []
+        with self._lock:
+            for start in range(0, len(invoice_numbers), 500):
+                chunk = invoice_numbers[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                found.extend(self._db.execute(
+                    f"SELECT invoice_number, line, sheet_row FROM invoice_lines WHERE invoice_number IN ({placeholders})", chunk
+                ))
+        found.sort(key=lambda row: (rank[row[0]], row[1]))
+        return np.array([row[2] for row in found], dtype=np.int64)
+
+    def lines(self, sales, invoice_numbers):
+        """Line items of the invoices straight from the Sales sheet by offset.
+
+        `sales` is the sheet with blank rows dropped. Returns None when the
+        offsets no longer match it (the sheet was edited elsewhere), so the
+        caller can `sync` and try again.
+        """
+        positions = self.line_rows(invoice_numbers)
+        if len(positions) and positions.max() >= len(sales):
+            return None
+        rows = sales.iloc[positions]
+        if not _text(rows["Invoice Number"]).isin([str(n) for n in invoice_numbers]).all():
+            return None
+        return rows
+
+    def iter_invoices(self, sales, invoice_numbers, gst_numbers=None):
+        """Yield (invoice number, header, line items) like invoice_render.iter_invoice_groups,
+        slicing each invoice's lines by offset instead of grouping the sheet"""
+        rows = self.lines(sales, invoice_numbers)
+        if rows is None:
+            return
+        # line_rows keeps each invoice's lines together, in the order asked for
+        numbers = _text(rows["Invoice Number"]).to_numpy()
+        bounds = np.flatnonzero(np.r_[True, numbers[1:] != numbers[:-1], True])
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            line_items = rows.iloc[start:end].to_dict("records")
+            yield numbers[start], with_gst_number(line_items[0], gst_numbers), line_items
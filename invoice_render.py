@@ -0,0 +1,563 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import pandas as pd
+from fpdf import FPDF
+from PyPDF2 import PdfReader, PdfWriter
+
+from outlet_index import normalize_name
+
+# Company Details with ALLGEN TRADING logo
+company_name = "BIOLUME SKIN SCIENCE PRIVATE LIMITED"
+company_address = """Ground Floor Rampal Awana Complex,
+Rampal Awana Complex, Indra Market,
+Sector-27, Atta, Noida, Gautam Buddha Nagar,
+Uttar Pradesh 201301
+GSTIN/UIN: 09AALCB9426H1ZA
+State Name: Uttar Pradesh, Code: 09
+"""
+company_logo = 'ALLGEN TRADING logo.png'
+bank_details = """
+Disclaimer: This Proforma Invoice is for estimation purposes only and is not a demand for payment.
+Prices, taxes, and availability are subject to change. Final billing may vary.
+Goods/services will be delivered only after confirmation and payment. No legal obligation is created by this document.
+"""
+
+TAX_RATE = 0.18  # 18% GST
+
+# Bump when the PDF layout, company details or logo change, so cached invoices are re-rendered
+INVOICE_TEMPLATE_VERSION = 1
+
+# Invoices per merged PDF; a PdfWriter holds every page it is given until it is written
+MERGED_CHUNK_INVOICES = 200
+
+# Single background writer so saving a PDF copy never delays the download
+_pdf_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="invoice-writer")
+
+# Custom PDF class
+class PDF(FPDF):
+    def header(self):
+        if company_logo:
+            try:
+                self.image(company_logo, 10, 8, 33)
+            except:
+                pass
+
+        self.set_font('Arial', 'B', 16)
+        self.cell(0, 10, company_name, ln=True, align='C')
+        self.set_font('Arial', '', 10)
+        self.multi_cell(0, 5, company_address, align='C')
+
+        self.set_font('Arial', 'B', 14)
+        self.cell(0, 10, 'Proforma Invoice', ln=True, align='C')
+        self.line(10, 50, 200, 50)
+        self.ln(1)
+
+
+def _text(value, default=""):
+    """Return a printable string, treating empty sheet cells as blank"""
+    if value is None:
+        return default
+    try:
+        if pd.isna(value):
+            return default
+    except (TypeError, ValueError):
+        pass
+    return str(value)
+
+def _number(value, default=0.0):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return default
+    return default if pd.isna(number) else number
+
+def _date_text(value):
+    if hasattr(value, "strftime") and not pd.isna(value):
+        return value.strftime("%d-%m-%Y")
+    return _text(value)
+
+
+def build_invoice_pdf(header, line_items):
+    """Draw a proforma invoice.
+
+    `header` and each entry of `line_items` are keyed by Sales sheet column
+    names, so rows read back from the Sales sheet can be passed straight in.
+    """
+    pdf = PDF()
+    pdf.alias_nb_pages()
+    pdf.add_page()
+
+    transaction_type = _text(header.get("Transaction Type"))
+    payment_status = _text(header.get("Payment Status"))
+    distributor_firm_name = _text(header.get("Distributor Firm Name"))
+
+    # Transaction Type
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(0, 10, f"Transaction Type: {transaction_type.upper()}", ln=True)
+
+    # Sales Person
+    pdf.ln(0)
+    pdf.set_font("Arial", 'B', 10)
+    pdf.cell(0, 10, f"Sales Person: {_text(header.get('Employee Name'))}", ln=True, align='L')
+
+    # Distributor details if available
+    if distributor_firm_name:
+        pdf.cell(0, 10, f"Distributor: {distributor_firm_name} ({_text(header.get('Distributor ID'))})", ln=True, align='L')
+        pdf.cell(0, 10, f"Contact: {_text(header.get('Distributor Contact Person'))} | {_text(header.get('Distributor Contact Number'))}", ln=True, align='L')
+        pdf.cell(0, 10, f"Territory: {_text(header.get('Distributor Territory'))}", ln=True, align='L')
+
+    pdf.ln(5)
+
+    # Customer details
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(0, 10, "Bill To:", ln=True)
+    pdf.set_font("Arial", '', 10)
+    pdf.cell(100, 6, f"Name: {_text(header.get('Outlet Name'))}")
+    pdf.cell(90, 6, f"Date: {_date_text(header.get('Invoice Date'))}", ln=True, align='R')
+    pdf.cell(100, 6, f"GSTIN/UN: {_text(header.get('GST Number'))}")
+    pdf.cell(90, 6, f"Contact: {_text(header.get('Outlet Contact'))}", ln=True, align='R')
+    pdf.cell(100, 6, "Address: ", ln=True)
+    pdf.multi_cell(0, 6, _text(header.get('Outlet Address')))
+    pdf.ln(1)
+
+    # Invoice number
+    pdf.set_font("Arial", 'B', 10)
+    pdf.cell(0, 10, f"Invoice Number: {_text(header.get('Invoice Number'))}", ln=True)
+    pdf.ln(5)
+
+    # Table header
+    pdf.set_fill_color(200, 220, 255)
+    pdf.set_font("Arial", 'B', 10)
+    pdf.cell(10, 10, "S.No", border=1, align='C', fill=True)
+    pdf.cell(70, 10, "Product Name", border=1, align='C', fill=True)
+    pdf.cell(20, 10, "HSN/SAC", border=1, align='C', fill=True)
+    pdf.cell(20, 10, "Qty", border=1, align='C', fill=True)
+    pdf.cell(25, 10, "Rate (INR)", border=1, align='C', fill=True)
+    pdf.cell(25, 10, "Discount (%)", border=1, align='C', fill=True)
+    pdf.cell(25, 10, "Amount (INR)", border=1, align='C', fill=True)
+    pdf.ln()
+
+    # Table rows
+    pdf.set_font('Arial', '', 10)
+    subtotal = 0
+    for idx, item in enumerate(line_items):
+        unit_price = _number(item.get("Unit Price"))
+        prod_discount = _number(item.get("Product Discount (%)"))
+        quantity = int(_number(item.get("Quantity"), 0))
+
+        # Apply product discount
+        discounted_unit_price = unit_price * (1 - prod_discount/100)
+        item_total = discounted_unit_price * quantity
+        subtotal += item_total
+
+        pdf.cell(10, 8, str(idx + 1), border=1)
+        pdf.cell(70, 8, _text(item.get("Product Name")), border=1)
+        pdf.cell(20, 8, "3304", border=1, align='C')
+        pdf.cell(20, 8, str(quantity), border=1, align='C')
+        pdf.cell(25, 8, f"{unit_price:.2f}", border=1, align='R')
+        pdf.cell(25, 8, f"{prod_discount:.2f}%", border=1, align='R')
+        pdf.cell(25, 8, f"{item_total:.2f}", border=1, align='R')
+        pdf.ln()
+
+    # Calculate taxes
+    tax_amount = subtotal * TAX_RATE
+    cgst_amount = tax_amount / 2
+    sgst_amount = tax_amount / 2
+    grand_total = subtotal + tax_amount
+
+    # Display totals
+    pdf.ln(10)
+    pdf.set_font('Arial', 'B', 10)
+    pdf.cell(160, 10, "Subtotal", border=0, align='R')
+    pdf.cell(30, 10, f"{subtotal:.2f}", border=1, align='R')
+    pdf.ln()
+
+    pdf.cell(160, 10, "Taxable Amount", border=0, align='R')
+    pdf.cell(30, 10, f"{subtotal:.2f}", border=1, align='R')
+    pdf.ln()
+
+    pdf.cell(160, 10, "CGST (9%)", border=0, align='R')
+    pdf.cell(30, 10, f"{cgst_amount:.2f}", border=1, align='R')
+    pdf.ln()
+
+    pdf.cell(160, 10, "SGST (9%)", border=0, align='R')
+    pdf.cell(30, 10, f"{sgst_amount:.2f}", border=1, align='R')
+    pdf.ln()
+
+    pdf.cell(160, 10, "Grand Total", border=0, align='R')
+    pdf.cell(30, 10, f"{grand_total:.2f} INR", border=1, align='R', fill=True)
+    pdf.ln(10)
+
+    # Payment Status
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(0, 10, f"Payment Status: {payment_status.upper()}", ln=True)
+    if payment_status == "paid":
+        pdf.cell(0, 10, f"Amount Paid: {_text(header.get('Amount Paid'))} INR", ln=True)
+    pdf.ln(10)
+
+    # Details
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(0, 10, "Details:", ln=True)
+    pdf.set_font("Arial", '', 10)
+    pdf.multi_cell(0, 5, bank_details)
+
+    return pdf
+
+def pdf_to_bytes(pdf):
+    """Serialize an FPDF document without touching the disk"""
+    data = pdf.output(dest='S')
+    if isinstance(data, str):
+        # fpdf 1.x returns a latin-1 string, fpdf2 returns a bytearray
+        data = data.encode('latin-1')
+    return bytes(data)
+
+
+def render_invoice(line_items, header):
+    """Render an invoice to PDF bytes in memory with no disk or network I/O"""
+    return pdf_to_bytes(build_invoice_pdf(header, line_items))
+
+
+# Fields that change what a rendered invoice looks like
+INVOICE_HEADER_FIELDS = [
+    "Invoice Number", "Invoice Date", "Employee Name", "Transaction Type",
+    "Outlet Name", "GST Number", "Outlet Contact", "Outlet Address",
+    "Distributor Firm Name", "Distributor ID", "Distributor Contact Person",
+    "Distributor Contact Number", "Distributor Territory",
+    "Payment Status", "Amount Paid"
+]
+INVOICE_LINE_FIELDS = ["Product Name", "Quantity", "Unit Price", "Product Discount (%)"]
+
+def invoice_cache_key(line_items, header):
+    """Hash the template version, tax rate, rendered header fields and line items into a cache key"""
+    payload = {
+        "template": [INVOICE_TEMPLATE_VERSION, TAX_RATE],
+        "header": [_date_text(header.get(f)) if f == "Invoice Date" else _text(header.get(f)) for f in INVOICE_HEADER_FIELDS],
+        "lines": [
+            [_text(item.get("Product Name")), int(_number(item.get("Quantity"), 0)),
+             _number(item.get("Unit Price")), _number(item.get("Product Discount (%)"))]
+            for item in line_items
+        ]
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+class InvoicePDFCache:
+    """Content-addressed on-disk cache of rendered invoice PDFs with an LRU size cap"""
+
+    def __init__(self, directory=os.path.join("invoices", "cache"), max_bytes=200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self._total_bytes = 0
+
+        os.makedirs(directory, exist_ok=True)
+        files = []
+        for name in os.listdir(directory):
+            if name.endswith(".pdf"):
+                stat = os.stat(os.path.join(directory, name))
+                files.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._total_bytes += size
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pdf")
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        try:
+            with open(self._path(key), "rb") as f:
+                pdf_bytes = f.read()
+            os.utime(self._path(key))
+        except OSError:
+            with self._lock:
+                self._total_bytes -= self._entries.pop(key, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return pdf_bytes
+
+    def put(self, key, pdf_bytes):
+        write_pdf(pdf_bytes, self._path(key))
+        evicted = []
+        with self._lock:
+            self._total_bytes += len(pdf_bytes) - self._entries.pop(key, 0)
+            self._entries[key] = len(pdf_bytes)
+            while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+                old_key, size = self._entries.popitem(last=False)
+                self._total_bytes -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "size_bytes": self._total_bytes
+            }
+
+def render_invoice_cached(line_items, header, cache, renderer=render_invoice):
+    """Return cached PDF bytes for unchanged invoice inputs, rendering only on a miss"""
+    key = invoice_cache_key(line_items, header)
+    pdf_bytes = cache.get(key)
+    if pdf_bytes is None:
+        pdf_bytes = renderer(line_items, header)
+        cache.put(key, pdf_bytes)
+    return pdf_bytes
+
+
+class RenderQueueFull(Exception):
+    """Raised when the rendering pool already has its maximum queue of jobs"""
+
+
+class RenderJob:
+    def __init__(self, pool, ticket, future):
+        self._pool = pool
+        self.ticket = ticket
+        self.future = future
+
+    def queue_position(self):
+        """1-based position among jobs still waiting for a worker, or 0 once running"""
+        return self._pool.queue_position(self.ticket)
+
+    def done(self):
+        return self.future.done()
+
+    def wait(self, timeout=None):
+        wait([self.future], timeout=timeout)
+
+    def result(self, timeout=None):
+        return self.future.result(timeout=timeout)
+
+
+class RenderPool:
+    """Bounded worker pool for invoice rendering.
+
+    At most `max_workers` PDFs are drawn at once and at most `max_queue` more
+    may wait; further submissions raise RenderQueueFull instead of piling up.
+    """
+
+    def __init__(self, max_workers=2, max_queue=16):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="invoice-render")
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._waiting = OrderedDict()  # tickets not yet picked up by a worker
+        self._next_ticket = 0
+
+    def submit(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            raise RenderQueueFull("Invoice rendering is busy right now. Please try again in a moment.")
+
+        with self._lock:
+            ticket = self._next_ticket
+            self._next_ticket += 1
+            self._waiting[ticket] = True
+
+        def run():
+            with self._lock:
+                self._waiting.pop(ticket, None)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self._slots.release()
+
+        try:
+            future = self._executor.submit(run)
+        except Exception:
+            with self._lock:
+                self._waiting.pop(ticket, None)
+            self._slots.release()
+            raise
+        return RenderJob(self, ticket, future)
+
+    def queue_position(self, ticket):
+        with self._lock:
+            if ticket not in self._waiting:
+                return 0
+            for position, waiting_ticket in enumerate(self._waiting, start=1):
+                if waiting_ticket == ticket:
+                    return position
+        return 0
+
+    def queue_length(self):
+        with self._lock:
+            return len(self._waiting)
+
+
+def write_pdf(pdf_bytes, pdf_path):
+    """Write PDF bytes atomically so a half-written file is never served"""
+    tmp_path = f"{pdf_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(pdf_bytes)
+    os.replace(tmp_path, pdf_path)
+
+def save_pdf_async(pdf_bytes, pdf_path):
+    """Queue a PDF copy for writing on the background writer and return its Future"""
+    return _pdf_writer.submit(write_pdf, pdf_bytes, pdf_path)
+
+
+def outlet_gst_numbers(outlets):
+    """GST numbers from the Outlet master keyed by normalized Shop Name.
+
+    The Sales sheet has no GST column, so headers rebuilt from Sales rows
+    take the outlet's GSTIN from here.
+    """
+    gst = outlets["GST"].fillna("").astype(str).str.strip()
+    return {
+        normalize_name(name): number
+        for name, number in zip(outlets["Shop Name"], gst) if number and number.lower() != "nan"
+    }
+
+def with_gst_number(header, gst_numbers):
+    """The header with 'GST Number' filled from `gst_numbers` when it has none"""
+    if not gst_numbers or _text(header.get("GST Number")):
+        return header
+    return {**header, "GST Number": gst_numbers.get(normalize_name(header.get("Outlet Name")), "")}
+
+def iter_invoice_groups(sales_data, invoice_numbers=None, start_date=None, end_date=None, invoice_prefix=None,
+                        gst_numbers=None):
+    """Yield (invoice number, header, line items) for each invoice in the Sales rows.
+
+    Rows are selected by an explicit list of invoice numbers, an invoice number
+    prefix and/or an inclusive Invoice Date range; the first row of each
+    invoice is its header, with the GSTIN looked up in `gst_numbers`
+    (see outlet_gst_numbers).
+    """
+    rows = sales_data.dropna(how="all").copy()
+    rows['Invoice Number'] = rows['Invoice Number'].astype(str)
+
+    if invoice_numbers:
+        rows = rows[rows['Invoice Number'].isin([str(n) for n in invoice_numbers])]
+
+    if invoice_prefix:
+        rows = rows[rows['Invoice Number'].str.upper().str.startswith(invoice_prefix.strip().upper())]
+
+    if start_date is not None or end_date is not None:
+        invoice_dates = pd.to_datetime(rows['Invoice Date'], dayfirst=True, errors='coerce')
+        mask = invoice_dates.notna()
+        if start_date is not None:
+            mask &= invoice_dates >= pd.Timestamp(start_date)
+        if end_date is not None:
+            mask &= invoice_dates < pd.Timestamp(end_date) + pd.Timedelta(days=1)
+        rows = rows[mask]
+
+    for invoice_number, invoice_rows in rows.groupby('Invoice Number', sort=False):
+        line_items = invoice_rows.to_dict('records')
+        yield invoice_number, with_gst_number(line_items[0], gst_numbers), line_items
+
+def iter_rendered_invoices(invoice_groups, renderer=render_invoice):
+    """Lazily turn invoice groups into (invoice number, PDF bytes), one at a time"""
+    for invoice_number, header, line_items in invoice_groups:
+        yield invoice_number, renderer(line_items, header)
+
+def write_invoices_zip(rendered_invoices, fileobj):
+    """Stream rendered invoices into a zip archive; only one PDF is held in memory at a time"""
+    count = 0
+    with zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED) as archive:
+        for invoice_number, pdf_bytes in rendered_invoices:
+            archive.writestr(f"{invoice_number}.pdf", pdf_bytes)
+            count += 1
+    return count
+
+def write_invoices_merged(rendered_invoices, fileobj, chunk_size=MERGED_CHUNK_INVOICES):
+    """Merge rendered invoices into PDFs of at most `chunk_size` invoices each.
+
+    A merged PDF is only written once all its pages are in, so memory grows
+    with the invoices in one chunk, not with the whole export. A single
+    chunk is written to `fileobj` as a PDF; more than one are written as
+    merged_001.pdf, merged_002.pdf, ... in a zip archive.
+    Returns (invoices merged, number of merged PDFs).
+    """
+    count = parts = 0
+    archive = None
+    writer = PdfWriter()
+    for _, pdf_bytes in rendered_invoices:
+        if count and count % chunk_size == 0:
+            if archive is None:
+                archive = zipfile.ZipFile(fileobj, "w", zipfile.ZIP_DEFLATED)
+            parts += 1
+            _write_merged_part(archive, parts, writer)
+            writer = PdfWriter()
+        for page in PdfReader(io.BytesIO(pdf_bytes)).pages:
+            writer.add_page(page)
+        count += 1
+
+    if not count:
+        return 0, 0
+    parts += 1
+    if archive is None:
+        writer.write(fileobj)
+    else:
+        _write_merged_part(archive, parts, writer)
+        archive.close()
+    return count, parts
+
+def _write_merged_part(archive, part, writer):
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    archive.writestr(f"merged_{part:03d}.pdf", buffer.getvalue())
+
+
+def _render_invoice_job(job):
+    """Process-pool worker: render one invoice and optionally write it to disk"""
+    invoice_number, header, line_items, pdf_path = job
+    pdf_bytes = render_invoice(line_items, header)
+    if pdf_path:
+        write_pdf(pdf_bytes, pdf_path)
+        return invoice_number, pdf_path, None
+    return invoice_number, pdf_path, pdf_bytes
+
+def regenerate_invoices(sales_data, invoice_numbers=None, start_date=None, end_date=None,
+                        output_dir="invoices", zip_path=None, max_workers=None, gst_numbers=None):
+    """Re-render invoices from cached Sales rows across a process pool.
+
+    Nothing is written back to Google Sheets. PDFs go to `output_dir`, or into
+    a single archive at `zip_path` when one is given. Returns the list of
+    invoice numbers rendered.
+    """
+    jobs = []
+    for invoice_number, header, line_items in iter_invoice_groups(sales_data, invoice_numbers, start_date, end_date, gst_numbers=gst_numbers):
+        pdf_path = None if zip_path else os.path.join(output_dir, f"{invoice_number}.pdf")
+        jobs.append((invoice_number, header, line_items, pdf_path))
+
+    if not jobs:
+        return []
+
+    if not zip_path:
+        os.makedirs(output_dir, exist_ok=True)
+
+    rendered = []
+    archive = zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) if zip_path else None
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for invoice_number, pdf_path, pdf_bytes in executor.map(_render_invoice_job, jobs, chunksize=8):
+                if archive is not None:
+                    archive.writestr(f"{invoice_number}.pdf", pdf_bytes)
+                rendered.append(invoice_number)
+    finally:
+        if archive is not None:
+            archive.close()
+
+    return rendered
@@ -18,7 +18,7 @@ st.set_page_config(page_title="Location Logger", layout="centered")
 def display_location_logger():
     """Renders the live-location tracker/browser component."""
     st.title("📍 Location Logger")
-    st.markdown("This app tracks your location every minute (for demo). Data stays in the browser.")
+    st.markdown("This app tracks your location every minute while you move and every few minutes while you stay put (for demo). Data stays in the browser.")
     components.html(
         """
         <!DOCTYPE html>
@@ -29,27 +29,61 @@ def display_location_logger():
             <div id="status">Waiting for location...</div>
             <ul id="history"></ul>
             <script>
+                // Movement-aware sampling: a fix within MIN_DISTANCE_M of the last kept
+                // one is dropped and only extends the current stay; stays of at least
+                // DWELL_MIN_MS are kept as one dwell entry. Sampling runs every minute
+                // while moving and every STATIONARY_MS while staying put.
+                const MIN_DISTANCE_M = 100, DWELL_MIN_MS = 10*60*1000;
+                const MOVING_MS = 60*1000, STATIONARY_MS = 5*60*1000;
                 const locationHistory = [];
+                let last = null, moving = true;
+                function haversine(lat1, lng1, lat2, lng2) {
+                    const rad = Math.PI / 180, dLat = (lat2 - lat1) * rad, dLng = (lng2 - lng1) * rad;
+                    const a = Math.sin(dLat/2)**2 + Math.cos(lat1*rad) * Math.cos(lat2*rad) * Math.sin(dLng/2)**2;
+                    return 2 * 6371008.8 * Math.asin(Math.sqrt(a));
+                }
+                function keep(lat, lng, now, dwellMin) {
+                    locationHistory.push({time:new Date(now).toLocaleTimeString(),latitude:lat,longitude:lng,dwell:dwellMin,link:`https://maps.google.com/?q=${lat},${lng}`});
+                }
                 function sendLocation() {
                     if (!navigator.geolocation) return;
                     navigator.geolocation.getCurrentPosition(pos => {
-                        const ts = new Date().toLocaleTimeString();
+                        const now = Date.now();
                         const lat = pos.coords.latitude, lng = pos.coords.longitude;
-                        locationHistory.push({time:ts,latitude:lat,longitude:lng,link:`https://maps.google.com/?q=${lat},${lng}`});
+                        if (last) {
+                            const threshold = Math.max(MIN_DISTANCE_M, pos.coords.accuracy || 0);
+                            if (haversine(last.lat, last.lng, lat, lng) < threshold) {
+                                last.seen = now;
+                                moving = false;
+                                scheduleNext();
+                                return;
+                            }
+                            if (last.seen - last.ts >= DWELL_MIN_MS) {
+                                keep(last.lat, last.lng, last.ts, Math.round((last.seen - last.ts) / 60000));
+                            }
+                            moving = true;
+                        }
+                        last = {lat, lng, ts: now, seen: now};
+                        keep(lat, lng, now, null);
                         updateLocationList();
-                    });
+                        scheduleNext();
+                    }, () => scheduleNext());
+                }
+                function scheduleNext() {
+                    setTimeout(sendLocation, moving ? MOVING_MS : STATIONARY_MS);
                 }
                 function updateLocationList() {
                     const ul = document.getElementById("history");
                     ul.innerHTML = "";
                     locationHistory.forEach(loc => {
                         const li = document.createElement("li");
-                        li.innerHTML = `<strong>[${loc.time}]</strong> Lat: ${loc.latitude.toFixed(5)}, Lng: ${loc.longitude.toFixed(5)} - <a href="${loc.link}" target="_blank">Map</a>`;
+                        const dwell = loc.dwell ? ` - stayed ${loc.dwell} min` : "";
+                        li.innerHTML = `<strong>[${loc.time}]</strong> Lat: ${loc.latitude.toFixed(5)}, Lng: ${loc.longitude.toFixed(5)}${dwell} - <a href="${loc.link}" target="_blank">Map</a>`;
                         ul.appendChild(li);
                     });
                     document.getElementById("status").innerText = `Last updated: ${locationHistory.slice(-1)[0].time}`;
                 }
-                window.onload = () => { sendLocation(); setInterval(sendLocation, 60*1000); };
+                window.onload = () => { sendLocation(); };
             </script>
         </body>
         </html>
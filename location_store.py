@@ -0,0 +1,364 @@
+import atexit
+import threading
+import time
+import warnings
+from importlib import metadata
+
+import numpy as np
+import pandas as pd
+
+from geocoding import haversine_m
+
+
+class LocationRingBuffer:
+    """Fixed-size columnar buffer of location fixes.
+
+    Timestamps, coordinates and accuracy are kept in preallocated NumPy
+    arrays and the employee as an index into `employee_codes`, so buffering a
+    fix never allocates a row object. Anything non-numeric a sheet row needs
+    (address, location type, ...) rides along in the `extra` column.
+    When the buffer is full the oldest fix is overwritten and counted.
+    """
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.ts = np.zeros(capacity, dtype=np.float64)
+        self.lat = np.zeros(capacity, dtype=np.float64)
+        self.lng = np.zeros(capacity, dtype=np.float64)
+        self.accuracy = np.full(capacity, np.nan, dtype=np.float32)
+        self.employee = np.zeros(capacity, dtype=np.int32)
+        self.extra = np.empty(capacity, dtype=object)
+        self.employee_codes = []
+        self._employee_ids = {}
+        self.overwritten = 0
+        self._start = 0
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def _employee_id(self, employee_code):
+        employee_code = str(employee_code)
+        employee_id = self._employee_ids.get(employee_code)
+        if employee_id is None:
+            employee_id = len(self.employee_codes)
+            self.employee_codes.append(employee_code)
+            self._employee_ids[employee_code] = employee_id
+        return employee_id
+
+    def append(self, employee_code, ts, lat, lng, accuracy=None, extra=None):
+        with self._lock:
+            if self._size == self.capacity:
+                self._start = (self._start + 1) % self.capacity
+                self._size -= 1
+                self.overwritten += 1
+            slot = (self._start + self._size) % self.capacity
+            self.ts[slot] = ts
+            self.lat[slot] = lat
+            self.lng[slot] = lng
+            self.accuracy[slot] = np.nan if accuracy in (None, "") else accuracy
+            self.employee[slot] = self._employee_id(employee_code)
+            self.extra[slot] = extra
+            self._size += 1
+
+    def oldest_ts(self):
+        with self._lock:
+            return float(self.ts[self._start]) if self._size else None
+
+    def peek(self, limit=None):
+        """Copy the oldest `limit` fixes (all by default) as a dict of columns"""
+        with self._lock:
+            count = self._size if limit is None else min(limit, self._size)
+            slots = (self._start + np.arange(count)) % self.capacity
+            return {
+                "ts": self.ts[slots],
+                "lat": self.lat[slots],
+                "lng": self.lng[slots],
+                "accuracy": self.accuracy[slots],
+                "employee_code": np.array(self.employee_codes, dtype=object)[self.employee[slots]]
+                if count else np.empty(0, dtype=object),
+                "extra": self.extra[slots]
+            }
+
+    def discard(self, count):
+        """Drop the oldest `count` fixes once they have been persisted"""
+        with self._lock:
+            count = min(count, self._size)
+            slots = (self._start + np.arange(count)) % self.capacity
+            self.extra[slots] = None
+            self._start = (self._start + count) % self.capacity
+            self._size -= count
+
+
+class LocationBatchWriter:
+    """Flushes a LocationRingBuffer to an append-only sink in batches.
+
+    `sink(batch)` receives the column dict from `peek` and returns True once
+    the rows are stored; only then are they discarded from the buffer, so a
+    failed flush is retried with the next one. A daemon thread flushes when
+    `batch_size` fixes are waiting or the oldest has waited `flush_interval`
+    seconds, and whatever is left is flushed at interpreter exit.
+    """
+
+    def __init__(self, sink, capacity=4096, batch_size=50, flush_interval=60):
+        self.sink = sink
+        self.buffer = LocationRingBuffer(capacity)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.flushed_rows = 0
+        self.batches = 0
+        self.failures = 0
+        self.last_error = None
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="location-batch-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.flush)
+
+    def append(self, employee_code, ts, lat, lng, accuracy=None, extra=None):
+        self.buffer.append(employee_code, ts, lat, lng, accuracy, extra)
+        if len(self.buffer) >= self.batch_size:
+            self._wake.set()
+
+    def pending(self):
+        return len(self.buffer)
+
+    def flush(self):
+        """Write everything buffered so far; returns the number of rows stored"""
+        with self._flush_lock:
+            stored = 0
+            while len(self.buffer):
+                batch = self.buffer.peek(self.batch_size * 10)
+                count = len(batch["ts"])
+                try:
+                    ok = self.sink(batch)
+                except Exception as e:
+                    ok = False
+                    self.last_error = str(e)
+                if not ok:
+                    self.failures += 1
+                    break
+                self.buffer.discard(count)
+                self.batches += 1
+                self.flushed_rows += count
+                stored += count
+            return stored
+
+    def _due(self):
+        if len(self.buffer) >= self.batch_size:
+            return True
+        oldest = self.buffer.oldest_ts()
+        return oldest is not None and time.time() - oldest >= self.flush_interval
+
+    def _run(self):
+        while True:
+            self._wake.wait(timeout=min(self.flush_interval, 5))
+            self._wake.clear()
+            if self._due():
+                self.flush()
+
+    def stats(self):
+        return {
+            "pending": len(self.buffer),
+            "flushed_rows": self.flushed_rows,
+            "batches": self.batches,
+            "failures": self.failures,
+            "overwritten": self.buffer.overwritten,
+            "last_error": self.last_error
+        }
+
+
+class MovementFilter:
+    """Server-side acceptance filter for sampled location fixes.
+
+    A fix within `min_distance_m` of the employee's last stored fix (or
+    within the fix's own accuracy radius, if that is larger) is dropped and
+    only extends the current stay. When the employee moves on, a stay of at
+    least `dwell_min_seconds` is stored as one dwell record at the old spot.
+    `interval` tells callers how often to sample: `moving_interval` after a
+    move, `stationary_interval` while the employee stays put.
+    """
+
+    def __init__(self, min_distance_m=100, dwell_min_seconds=600, moving_interval=300, stationary_interval=1800):
+        self.min_distance_m = min_distance_m
+        self.dwell_min_seconds = dwell_min_seconds
+        self.moving_interval = moving_interval
+        self.stationary_interval = stationary_interval
+        self.accepted = 0
+        self.dropped = 0
+        self.dwells = 0
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key, ts, lat, lng, accuracy=None, force=False):
+        """Feed one fix; returns the records to store as (ts, lat, lng, dwell_seconds)
+        tuples, where dwell_seconds is None for an ordinary fix. `force` stores
+        the fix even if the employee has not moved (e.g. at login).
+        """
+        with self._lock:
+            last = self._last.get(key)
+            records = []
+            if last is not None:
+                distance = haversine_m(last["lat"], last["lng"], lat, lng)
+                threshold = max(self.min_distance_m, accuracy or 0)
+                if distance < threshold and not force:
+                    last["seen"] = ts
+                    last["moving"] = False
+                    self.dropped += 1
+                    return records
+                records.extend(self._dwell(last))
+                moving = distance >= threshold
+            else:
+                moving = True
+            self._last[key] = {"ts": ts, "lat": lat, "lng": lng, "seen": ts, "moving": moving}
+            self.accepted += 1
+            records.append((ts, lat, lng, None))
+            return records
+
+    def close(self, key):
+        """Forget an employee (e.g. at logout), returning their pending dwell record if any"""
+        with self._lock:
+            last = self._last.pop(key, None)
+            return self._dwell(last) if last is not None else []
+
+    def _dwell(self, last):
+        stay = last["seen"] - last["ts"]
+        if stay < self.dwell_min_seconds:
+            return []
+        self.dwells += 1
+        return [(last["ts"], last["lat"], last["lng"], stay)]
+
+    def interval(self, key):
+        """Seconds until the next fix should be sampled for this key"""
+        last = self._last.get(key)
+        if last is None or last["moving"]:
+            return self.moving_interval
+        return self.stationary_interval
+
+    def stats(self):
+        seen = self.accepted + self.dropped
+        return {
+            "accepted": self.accepted,
+            "dropped": self.dropped,
+            "dwells": self.dwells,
+            "drop_ratio": self.dropped / seen if seen else 0.0
+        }
+
+
+# st-gsheets-connection releases whose (private) worksheet selector open_worksheet has been checked against
+GSHEETS_CONNECTION_VERSIONS = ("0.1.",)
+
+
+def _gsheets_connection_version():
+    try:
+        return metadata.version("st-gsheets-connection")
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def open_worksheet(conn, worksheet):
+    """The gspread Worksheet behind a GSheetsConnection, or None to fall back to read + update.
+
+    st-gsheets-connection has no public way to reach gspread, so this is the
+    one place that uses its private `_select_worksheet`, and only on the
+    releases listed in GSHEETS_CONNECTION_VERSIONS. Read-only (public URL)
+    connections have no selector and also get None.
+    """
+    select_worksheet = getattr(conn.client, "_select_worksheet", None)
+    if select_worksheet is None:
+        return None
+    version = _gsheets_connection_version()
+    if version is None or not version.startswith(GSHEETS_CONNECTION_VERSIONS):
+        warnings.warn(
+            f"st-gsheets-connection {version} is not a checked release; sheet writes fall back to read + update"
+        )
+        return None
+    return select_worksheet(worksheet=worksheet)
+
+
+def append_sheet_rows(conn, worksheet, rows, columns):
+    """Append a DataFrame of rows to a worksheet.
+
+    With a service-account connection (see open_worksheet) this is a single
+    gspread append, so the cost is proportional to the batch, not the sheet.
+    Otherwise it falls back to read + concat + update.
+    """
+    rows = rows.reindex(columns=columns)
+    sheet = open_worksheet(conn, worksheet)
+    if sheet is not None:
+        values = rows.astype(object).where(rows.notna(), "").values.tolist()
+        sheet.append_rows(values, value_input_option="USER_ENTERED")
+        return True
+
+    existing = conn.read(worksheet=worksheet, ttl=5)
+    existing = existing.dropna(how="all")
+    conn.update(worksheet=worksheet, data=pd.concat([existing, rows], ignore_index=True))
+    return True
+
+
+def sheet_has_keys(conn, worksheet, columns, key_column, keys):
+    """Whether any of `keys` is already in a worksheet's `key_column`.
+
+    With a service-account connection (see open_worksheet) only that one
+    column is fetched. Returns None when it cannot tell without reading the
+    whole sheet, so the caller can fall back to read + merge.
+    """
+    sheet = open_worksheet(conn, worksheet)
+    if sheet is None:
+        return None
+    present = {str(value).strip() for value in sheet.col_values(columns.index(key_column) + 1)[1:]}
+    return any(str(key).strip() in present for key in keys)
+
+
+def _a1(row, col):
+    """1-based (row, column) to an A1 cell reference"""
+    letters = ""
+    while col:
+        col, remainder = divmod(col - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return f"{letters}{row}"
+
+
+def update_sheet_row(conn, worksheet, columns, key_column, key, values, position=None):
+    """Write some cells of the row whose `key_column` holds `key`.
+
+    `values` maps column name to value and `position` is where the row was
+    last seen (0 = first row under the header). The row is only written
+    after the sheet confirms it holds `key`: the cell at `position` is
+    checked first, then the key column is searched, so rows moved or
+    removed by other apps never take the update. With a service-account
+    connection (see open_worksheet) only the key cell and the changed cells
+    are touched; otherwise it falls back to read + update. Returns the row position
+    written; raises ValueError if `key` is not in the sheet.
+    """
+    key = str(key)
+    key_col = columns.index(key_column) + 1
+    sheet = open_worksheet(conn, worksheet)
+    if sheet is not None:
+        row = None
+        if position is not None and str(sheet.cell(position + 2, key_col).value or "").strip() == key:
+            row = position + 2
+        else:
+            found = sheet.find(key, in_column=key_col)
+            if found is not None:
+                row = found.row
+        if row is None or row < 2:
+            raise ValueError(f"{key_column} {key} not found in {worksheet}")
+        sheet.batch_update(
+            [{"range": _a1(row, columns.index(column) + 1), "values": [[value]]} for column, value in values.items()],
+            value_input_option="USER_ENTERED"
+        )
+        return row - 2
+
+    existing = conn.read(worksheet=worksheet, usecols=list(range(len(columns))), ttl=0)
+    existing = existing.dropna(how="all").reset_index(drop=True)
+    matches = (existing[key_column].astype(str).str.strip() == key).to_numpy().nonzero()[0]
+    if not len(matches):
+        raise ValueError(f"{key_column} {key} not found in {worksheet}")
+    for column, value in values.items():
+        # An all-blank column reads back as float64, which will not take text
+        existing[column] = existing[column].astype(object)
+        existing.iat[matches[0], existing.columns.get_loc(column)] = value
+    conn.update(worksheet=worksheet, data=existing)
+    return int(matches[0])
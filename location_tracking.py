@@ -0,0 +1,150 @@
+import heapq
+import queue
+import threading
+import time
+import weakref
+
+# Browser-side geolocation request; resolves with nulls instead of rejecting
+GEOLOCATION_JS = """
+    new Promise((resolve) => {
+        if (navigator.geolocation) {
+            navigator.geolocation.getCurrentPosition(
+                pos => resolve({lat: pos.coords.latitude, lng: pos.coords.longitude, accuracy: pos.coords.accuracy, ts: Date.now()}),
+                err => resolve({lat: null, lng: null, accuracy: null, ts: Date.now()}),
+                {enableHighAccuracy: true, timeout: 10000, maximumAge: 0}
+            );
+        } else {
+            resolve({lat: null, lng: null, accuracy: null, ts: Date.now()});
+        }
+    });
+"""
+
+
+class LocationWriter:
+    """Background consumer of location fixes.
+
+    Pages hand fixes to `submit`, which only enqueues them; a single daemon
+    thread calls `handler(fix)` for each one, so geocoding and sheet writes
+    never run on a Streamlit script thread. The handler returns
+    `(written, error)` like the sheet writers (an error may accompany a
+    written fix, e.g. one saved without an address) or raises; errors are
+    kept in `last_error` for the script thread to show.
+    """
+
+    def __init__(self, handler, max_pending=1000):
+        self.handler = handler
+        self.written = 0
+        self.failed = 0
+        self.dropped = 0
+        self.last_error = None
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="location-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, fix):
+        """Queue a fix without blocking; returns False if the queue is full"""
+        try:
+            self._queue.put_nowait(fix)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            fix = self._queue.get()
+            try:
+                written, error = self.handler(fix)
+                if written:
+                    self.written += 1
+                else:
+                    self.failed += 1
+                if error:
+                    self.last_error = error
+            except Exception as e:
+                self.failed += 1
+                self.last_error = str(e)
+            finally:
+                self._queue.task_done()
+
+
+class TrackingSession:
+    """Per-login tracking handle.
+
+    The only strong reference lives in the user's st.session_state; the
+    scheduler holds it weakly, so an abandoned session simply drops out.
+    """
+
+    def __init__(self, employee_name):
+        self.employee_name = employee_name
+        self.due_slot = 0       # bumped by the scheduler each time a fix is due
+        self.captured_slot = 0  # last slot the session captured a fix for
+        self.next_due = None    # time.monotonic() at which the scheduler marks the next slot due
+        self.active = True
+
+    def is_due(self):
+        return self.active and self.due_slot > self.captured_slot
+
+    def seconds_until_due(self):
+        """Seconds until the scheduler marks the next slot due, or None if not scheduled"""
+        if self.next_due is None:
+            return None
+        return max(0.0, self.next_due - time.monotonic())
+
+
+class LocationScheduler:
+    """One process-wide timer for periodic location capture.
+
+    Sessions sit in a heap ordered by their next due time. A single daemon
+    thread sleeps until the earliest entry, marks that session due and
+    re-queues it, so the cost is O(log n) per tick in the number of active
+    sessions and no thread is ever created per user.
+    """
+
+    def __init__(self, interval_seconds=3600):
+        self.interval_seconds = interval_seconds
+        self._heap = []
+        self._sequence = 0
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="location-scheduler", daemon=True)
+        self._thread.start()
+
+    def register(self, session, first_due_in=None):
+        delay = self.interval_seconds if first_due_in is None else first_due_in
+        with self._condition:
+            self._push(time.monotonic() + delay, session)
+            self._condition.notify()
+
+    def unregister(self, session):
+        # Removed lazily the next time its heap entry comes up
+        session.active = False
+
+    def active_sessions(self):
+        with self._condition:
+            return sum(1 for _, _, ref in self._heap if ref() is not None and ref().active)
+
+    def _push(self, due, session):
+        session.next_due = due
+        self._sequence += 1
+        heapq.heappush(self._heap, (due, self._sequence, weakref.ref(session)))
+
+    def _run(self):
+        with self._condition:
+            while True:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                due, _, ref = self._heap[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(timeout=delay)
+                    continue
+                heapq.heappop(self._heap)
+                session = ref()
+                if session is None or not session.active:
+                    continue
+                session.due_slot += 1
+                self._push(max(due, time.monotonic()) + self.interval_seconds, session)
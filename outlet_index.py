@@ -0,0 +1,97 @@
+import bisect
+import re
+
+import pandas as pd
+
+
+def normalize_name(value):
+    """Lower-case and collapse punctuation/whitespace for prefix matching"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    return " ".join(re.sub(r"[^0-9a-z]+", " ", str(value).lower()).split())
+
+
+class OutletIndex:
+    """Server-side search index over the Outlet master list.
+
+    Outlets are identified by their row position in the frame, so a picked
+    outlet resolves with a single iloc lookup instead of a Shop Name scan.
+    Search uses a sorted (word, outlet id) list: every word of a shop name is
+    a key, and a query matches names having a word starting with each query word.
+    """
+
+    def __init__(self, outlets):
+        self.outlets = outlets.reset_index(drop=True)
+        names = [normalize_name(n) for n in self.outlets['Shop Name']]
+
+        # Outlet ids in alphabetical order, used when there is no query
+        self._name_order = sorted(range(len(names)), key=lambda i: names[i])
+        self._rank = {outlet_id: rank for rank, outlet_id in enumerate(self._name_order)}
+
+        entries = sorted(
+            (word, outlet_id)
+            for outlet_id, name in enumerate(names)
+            for word in set(name.split())
+        )
+        self._words = [word for word, _ in entries]
+        self._word_ids = [outlet_id for _, outlet_id in entries]
+        self._names = names
+
+        self._states = self.outlets['State'].fillna("").astype(str).str.strip().tolist()
+        self._cities = self.outlets['City'].fillna("").astype(str).str.strip().tolist()
+
+    def __len__(self):
+        return len(self.outlets)
+
+    def _prefix_ids(self, prefix):
+        start = bisect.bisect_left(self._words, prefix)
+        end = bisect.bisect_left(self._words, prefix + "\uffff")
+        return set(self._word_ids[start:end])
+
+    def search(self, query="", limit=50, scope=None, state=None, city=None):
+        """Return up to `limit` outlet ids matching the query, in name order.
+
+        `scope` optionally restricts results to a collection of outlet ids
+        (for example an employee's territory); `state`/`city` filter exactly.
+        """
+        words = normalize_name(query).split()
+        if words:
+            # Longer words are usually more selective, so intersect them first
+            candidates = None
+            for word in sorted(words, key=len, reverse=True):
+                ids = self._prefix_ids(word)
+                candidates = ids if candidates is None else candidates & ids
+                if not candidates:
+                    return []
+            ordered = sorted(candidates, key=self._rank.__getitem__)
+        else:
+            ordered = self._name_order
+
+        if scope is not None and not isinstance(scope, (set, frozenset)):
+            scope = set(int(i) for i in scope)
+
+        results = []
+        for outlet_id in ordered:
+            if scope is not None and outlet_id not in scope:
+                continue
+            if state and self._states[outlet_id] != state:
+                continue
+            if city and self._cities[outlet_id] != city:
+                continue
+            results.append(outlet_id)
+            if len(results) >= limit:
+                break
+        return results
+
+    def row(self, outlet_id):
+        return self.outlets.iloc[int(outlet_id)]
+
+    def label(self, outlet_id):
+        outlet_id = int(outlet_id)
+        name = self.outlets.at[outlet_id, 'Shop Name']
+        city = self._cities[outlet_id]
+        return f"{name} ({city})" if city else str(name)
+
+    def states(self, scope=None):
+        ids = range(len(self._states)) if scope is None else scope
+        return sorted({self._states[i] for i in ids if self._states[i]})
@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+
+from geocoding import haversine_m_array
+
+# A step shorter than this between consecutive fixes counts as staying put
+STOP_RADIUS_M = 150
+# A stay shorter than this is not reported as a stop
+MIN_STOP_SECONDS = 10 * 60
+# Stops in the same grid cell of this size (about 200 m) form one dwell cluster
+CLUSTER_CELL_DEG = 0.002
+
+
+def load_fixes(history, date=None):
+    """Parse LocationHistory rows into NumPy columns sorted by employee, then time.
+
+    `date` (a date/datetime) keeps only that day's fixes. Returns a dict with
+    `employee` (int position into `employee_codes`), `ts` (seconds), `lat`,
+    `lng` and `stay` (seconds covered by a dwell record, else 0).
+    """
+    frame = history.dropna(how="all")
+    if date is not None and not frame.empty:
+        frame = frame[frame['Date'].astype(str).str.strip() == date.strftime("%d-%m-%Y")]
+
+    stamps = pd.to_datetime(
+        frame['Date'].astype(str).str.strip() + " " + frame['Time'].astype(str).str.strip(),
+        format="%d-%m-%Y %H:%M", errors="coerce"
+    )
+    lat = pd.to_numeric(frame['Latitude'], errors="coerce")
+    lng = pd.to_numeric(frame['Longitude'], errors="coerce")
+    if 'Dwell Minutes' in frame:
+        stay = pd.to_numeric(frame['Dwell Minutes'], errors="coerce").fillna(0) * 60
+    else:
+        stay = pd.Series(0.0, index=frame.index)
+    valid = (stamps.notna() & lat.notna() & lng.notna()).to_numpy()
+
+    employee, employee_codes = pd.factorize(frame['Employee Code'].astype(str).to_numpy()[valid])
+    ts = ((stamps[valid] - pd.Timestamp(0)) / pd.Timedelta(seconds=1)).to_numpy(dtype=np.float64)
+    order = np.lexsort((ts, employee))
+    return {
+        "employee_codes": np.asarray(employee_codes, dtype=object),
+        "employee": employee[order],
+        "ts": ts[order],
+        "lat": lat.to_numpy()[valid][order],
+        "lng": lng.to_numpy()[valid][order],
+        "stay": stay.to_numpy(dtype=np.float64)[valid][order]
+    }
+
+
+def _clock(seconds):
+    return pd.to_datetime(seconds, unit="s").strftime("%H:%M")
+
+
+def route_analytics(fixes, stop_radius_m=STOP_RADIUS_M, min_stop_seconds=MIN_STOP_SECONDS,
+                    cluster_cell_deg=CLUSTER_CELL_DEG):
+    """Distance, speed, stops and dwell clusters for every employee at once.
+
+    All per-fix work is done on whole arrays: consecutive-fix steps are one
+    vectorised haversine, per-employee totals are bincounts, and stops are
+    runs of short steps reduced with ufunc.reduceat.
+    Returns (summary, stops, clusters) DataFrames.
+    """
+    codes = fixes["employee_codes"]
+    employee, ts, lat, lng, stay = fixes["employee"], fixes["ts"], fixes["lat"], fixes["lng"], fixes["stay"]
+    count, n_employees = len(ts), len(codes)
+
+    # Steps between consecutive fixes; steps across an employee boundary count as nothing
+    same = employee[1:] == employee[:-1]
+    step = np.where(same, haversine_m_array(lat[:-1], lng[:-1], lat[1:], lng[1:]), 0.0)
+    dt = np.where(same, np.diff(ts), 0.0)
+    moving = same & (step >= stop_radius_m)
+    speed_kmh = np.where(moving & (dt > 0), step / np.where(dt > 0, dt, 1) * 3.6, 0.0)
+
+    distance_m = np.bincount(employee[1:], weights=step, minlength=n_employees)
+    moving_s = np.bincount(employee[1:], weights=np.where(moving, dt, 0.0), minlength=n_employees)
+    max_speed = np.zeros(n_employees)
+    np.maximum.at(max_speed, employee[1:], speed_kmh)
+
+    # Stops: maximal runs of fixes joined by short steps
+    run_starts = np.flatnonzero(np.r_[True, ~same | (step >= stop_radius_m)]) if count else np.array([], dtype=int)
+    run_sizes = np.diff(np.r_[run_starts, count])
+    if count:
+        run_end = np.maximum.reduceat(ts + stay, run_starts)
+        run_lat = np.add.reduceat(lat, run_starts) / run_sizes
+        run_lng = np.add.reduceat(lng, run_starts) / run_sizes
+    else:
+        run_end = run_lat = run_lng = np.array([], dtype=np.float64)
+    run_start = ts[run_starts]
+    run_employee = employee[run_starts]
+    run_duration = run_end - run_start
+    is_stop = run_duration >= min_stop_seconds
+
+    stop_count = np.bincount(run_employee[is_stop], minlength=n_employees)
+    dwell_s = np.bincount(run_employee[is_stop], weights=run_duration[is_stop], minlength=n_employees)
+    fix_count = np.bincount(employee, minlength=n_employees)
+    first_index = np.searchsorted(employee, np.arange(n_employees))
+    last_index = np.searchsorted(employee, np.arange(n_employees), side="right") - 1
+
+    summary = pd.DataFrame({
+        "Employee Code": codes,
+        "Fixes": fix_count,
+        "First Fix": _clock(ts[first_index]) if count else [],
+        "Last Fix": _clock(ts[last_index]) if count else [],
+        "Distance (km)": np.round(distance_m / 1000, 2),
+        "Moving Time (min)": np.round(moving_s / 60).astype(int),
+        "Avg Speed (km/h)": np.round(np.divide(distance_m, moving_s, out=np.zeros(n_employees), where=moving_s > 0) * 3.6, 1),
+        "Max Speed (km/h)": np.round(max_speed, 1),
+        "Stops": stop_count,
+        "Dwell Time (min)": np.round(dwell_s / 60).astype(int)
+    })
+
+    stops = pd.DataFrame({
+        "Employee Code": codes[run_employee[is_stop]],
+        "Start": _clock(run_start[is_stop]),
+        "End": _clock(run_end[is_stop]),
+        "Dwell (min)": np.round(run_duration[is_stop] / 60).astype(int),
+        "Fixes": run_sizes[is_stop],
+        "Latitude": np.round(run_lat[is_stop], 6),
+        "Longitude": np.round(run_lng[is_stop], 6)
+    })
+    stops["Google Maps Link"] = "https://maps.google.com/?q=" + stops["Latitude"].astype(str) + "," + stops["Longitude"].astype(str)
+
+    cells = pd.DataFrame({
+        "Employee Code": codes[run_employee[is_stop]],
+        "cell_lat": np.floor(run_lat[is_stop] / cluster_cell_deg),
+        "cell_lng": np.floor(run_lng[is_stop] / cluster_cell_deg),
+        "Latitude": run_lat[is_stop],
+        "Longitude": run_lng[is_stop],
+        "Dwell (min)": run_duration[is_stop] / 60
+    })
+    clusters = cells.groupby(["Employee Code", "cell_lat", "cell_lng"], as_index=False).agg(
+        Stops=("Dwell (min)", "size"),
+        **{
+            "Dwell (min)": ("Dwell (min)", "sum"),
+            "Latitude": ("Latitude", "mean"),
+            "Longitude": ("Longitude", "mean")
+        }
+    ).drop(columns=["cell_lat", "cell_lng"])
+    clusters["Dwell (min)"] = clusters["Dwell (min)"].round().astype(int)
+    clusters[["Latitude", "Longitude"]] = clusters[["Latitude", "Longitude"]].round(6)
+    clusters = clusters.sort_values(["Employee Code", "Dwell (min)"], ascending=[True, False], ignore_index=True)
+
+    return summary, stops, clusters
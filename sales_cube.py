@@ -0,0 +1,211 @@
+import sqlite3
+import threading
+
+import numpy as np
+import pandas as pd
+
+DIMENSIONS = ("employee", "product", "outlet", "day")
+DIMENSION_COLUMNS = {"employee": "Employee Code", "product": "Product ID", "outlet": "Outlet Name"}
+
+_EPOCH = np.datetime64("1970-01-01", "D")
+
+
+class SalesCube:
+    """Sparse Employee Code x Product ID x Outlet x Invoice Date (day) cube of
+    Grand Total, Quantity and line count.
+
+    Each dimension value is encoded once as a small integer and every
+    non-empty cell is one row of parallel NumPy arrays, so a dashboard query
+    reduces a few thousand cells instead of re-grouping every Sales row.
+
+    Lines are keyed by (Invoice Number, Product ID, occurrence), where the
+    occurrence numbers repeats of a product on one invoice, and counted
+    once, so re-adding whole invoices is harmless. Only new lines are
+    written to SQLite, so saving costs O(new lines); the cells are rebuilt
+    from the stored lines on start-up.
+    """
+
+    def __init__(self, path="sales_cube.sqlite3"):
+        self.path = path
+        self._lock = threading.Lock()
+        self.labels = {dim: [] for dim in DIMENSION_COLUMNS}
+        self._codes = {dim: {} for dim in DIMENSION_COLUMNS}
+        self._cells = {}
+        self._seen_lines = set()
+        self._fingerprint = None
+        self._size = 0
+        self._allocate(1024)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sales_cube_lines ("
+            "invoice_number TEXT NOT NULL, product_id TEXT NOT NULL, occurrence INTEGER NOT NULL, "
+            "employee_code TEXT, outlet_name TEXT, day INTEGER NOT NULL, grand_total REAL NOT NULL, quantity REAL NOT NULL, "
+            "PRIMARY KEY (invoice_number, product_id, occurrence))"
+        )
+        self._db.commit()
+        self._load()
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def version(self):
+        """Changes whenever new lines are folded in"""
+        return len(self._seen_lines)
+
+    def _allocate(self, capacity):
+        self._keys = np.zeros((capacity, len(DIMENSIONS)), dtype=np.int32)
+        self._values = np.zeros((capacity, 2), dtype=np.float64)
+        self._lines = np.zeros(capacity, dtype=np.int32)
+
+    def _grow(self):
+        keys, values, lines = self._keys, self._values, self._lines
+        self._allocate(len(keys) * 2)
+        self._keys[:self._size] = keys[:self._size]
+        self._values[:self._size] = values[:self._size]
+        self._lines[:self._size] = lines[:self._size]
+
+    def _code(self, dim, value):
+        code = self._codes[dim].get(value)
+        if code is None:
+            code = len(self.labels[dim])
+            self.labels[dim].append(value)
+            self._codes[dim][value] = code
+        return code
+
+    def _fold(self, line_key, employee, product, outlet, day, grand_total, quantity):
+        """Add one line to its cell unless it was seen before; returns whether it was new"""
+        if line_key in self._seen_lines:
+            return False
+        self._seen_lines.add(line_key)
+        key = (
+            self._code("employee", employee),
+            self._code("product", product),
+            self._code("outlet", outlet),
+            day
+        )
+        cell = self._cells.get(key)
+        if cell is None:
+            if self._size == len(self._keys):
+                self._grow()
+            cell = self._size
+            self._cells[key] = cell
+            self._keys[cell] = key
+            self._size += 1
+        self._values[cell, 0] += grand_total
+        self._values[cell, 1] += quantity
+        self._lines[cell] += 1
+        return True
+
+    def add_rows(self, sales_rows, save=True):
+        """Fold Sales sheet line rows into the cube; returns how many lines were new.
+
+        Pass whole invoices: a product's occurrence is counted within the
+        rows given, so part of an invoice would be numbered differently.
+        """
+        rows = sales_rows.dropna(how="all")
+        if rows.empty:
+            return 0
+        days = pd.to_datetime(rows["Invoice Date"], dayfirst=True, errors="coerce")
+        days = ((days - pd.Timestamp(0)) // pd.Timedelta(days=1)).to_numpy()
+        grand_total = pd.to_numeric(rows["Grand Total"], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+        quantity = pd.to_numeric(rows["Quantity"], errors="coerce").fillna(0).to_numpy(dtype=np.float64)
+        columns = {dim: rows[column].fillna("").astype(str).str.strip().tolist() for dim, column in DIMENSION_COLUMNS.items()}
+        invoices = rows["Invoice Number"].astype(str).tolist()
+        occurrences = pd.DataFrame({"invoice": invoices, "product": columns["product"]}).groupby(
+            ["invoice", "product"], sort=False
+        ).cumcount().tolist()
+
+        new_lines = []
+        with self._lock:
+            for i, line_key in enumerate(zip(invoices, columns["product"], occurrences)):
+                if pd.isna(days[i]):
+                    continue
+                line = (columns["employee"][i], columns["product"][i], columns["outlet"][i],
+                        int(days[i]), float(grand_total[i]), float(quantity[i]))
+                if self._fold(line_key, *line):
+                    new_lines.append(line_key + (line[0], line[2], line[3], line[4], line[5]))
+            if new_lines and save:
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO sales_cube_lines "
+                    "(invoice_number, product_id, occurrence, employee_code, outlet_name, day, grand_total, quantity) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    new_lines
+                )
+                self._db.commit()
+        return len(new_lines)
+
+    def refresh(self, sales, fingerprint):
+        """Fold in a whole Sales sheet read if its fingerprint changed since the
+        last one, e.g. invoices written by another app; returns how many lines were new"""
+        if fingerprint == self._fingerprint:
+            return 0
+        added = self.add_rows(sales)
+        self._fingerprint = fingerprint
+        return added
+
+    def query(self, group_by=("employee",), start_date=None, end_date=None, **filters):
+        """Aggregate the cube.
+
+        `group_by` is any of "employee", "product", "outlet", "day";
+        `start_date`/`end_date` bound the invoice day (inclusive) and keyword
+        filters restrict a dimension to one label or a collection of labels,
+        e.g. `employee="BSS1262"` or `product=["P1", "P2"]`.
+        Returns a DataFrame with the group columns plus Grand Total, Quantity
+        and Lines, sorted by Grand Total descending.
+        """
+        with self._lock:
+            keys = self._keys[:self._size].copy()
+            values = self._values[:self._size].copy()
+            lines = self._lines[:self._size].copy()
+            labels = {dim: np.array(self.labels[dim], dtype=object) for dim in DIMENSION_COLUMNS}
+            codes = {dim: dict(self._codes[dim]) for dim in DIMENSION_COLUMNS}
+
+        mask = np.ones(len(keys), dtype=bool)
+        day_axis = DIMENSIONS.index("day")
+        if start_date is not None:
+            mask &= keys[:, day_axis] >= (np.datetime64(start_date, "D") - _EPOCH).astype(int)
+        if end_date is not None:
+            mask &= keys[:, day_axis] <= (np.datetime64(end_date, "D") - _EPOCH).astype(int)
+        for dim, wanted in filters.items():
+            if wanted is None:
+                continue
+            wanted = [wanted] if isinstance(wanted, str) else list(wanted)
+            wanted_codes = [codes[dim][w] for w in wanted if w in codes[dim]]
+            mask &= np.isin(keys[:, DIMENSIONS.index(dim)], wanted_codes)
+
+        keys, values, lines = keys[mask], values[mask], lines[mask]
+        # Pack the grouped dimension codes into one int64 so grouping is a 1-D unique
+        group_keys = keys[:, [DIMENSIONS.index(dim) for dim in group_by]].astype(np.int64)
+        offsets = group_keys.min(axis=0) if len(group_keys) else np.zeros(len(group_by), dtype=np.int64)
+        group_keys -= offsets
+        radix = group_keys.max(axis=0) + 1 if len(group_keys) else np.ones(len(group_by), dtype=np.int64)
+        packed = np.zeros(len(keys), dtype=np.int64)
+        for position in range(len(group_by)):
+            packed = packed * radix[position] + group_keys[:, position]
+        groups, inverse = np.unique(packed, return_inverse=True)
+        count = len(groups)
+
+        result = {}
+        for position in reversed(range(len(group_by))):
+            dim = group_by[position]
+            column = groups % radix[position] + offsets[position]
+            groups = groups // radix[position]
+            if dim == "day":
+                result["Date"] = _EPOCH + column.astype("timedelta64[D]")
+            else:
+                result[DIMENSION_COLUMNS[dim]] = labels[dim][column]
+        result = {column: result[column] for column in reversed(list(result))}
+        result["Grand Total"] = np.round(np.bincount(inverse, weights=values[:, 0], minlength=count), 2)
+        result["Quantity"] = np.bincount(inverse, weights=values[:, 1], minlength=count)
+        result["Lines"] = np.bincount(inverse, weights=lines, minlength=count).astype(np.int64)
+        frame = pd.DataFrame(result)
+        return frame.sort_values("Grand Total", ascending=False, ignore_index=True)
+
+    def _load(self):
+        lines = self._db.execute(
+            "SELECT invoice_number, product_id, occurrence, employee_code, outlet_name, day, grand_total, quantity "
+            "FROM sales_cube_lines ORDER BY rowid"
+        )
+        for invoice, product, occurrence, employee, outlet, day, grand_total, quantity in lines:
+            self._fold((invoice, product, occurrence), employee, product, outlet, day, grand_total, quantity)
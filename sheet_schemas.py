@@ -0,0 +1,431 @@
+from typing import NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class SheetSchema:
+    """Maps a NamedTuple row type onto a worksheet's column headers.
+
+    Rows are immutable tuples (no per-row dict), fields are declared in sheet
+    column order, and a field missing from a row takes its default. `encode`
+    and `decode` convert one row to and from sheet cells by the field's type;
+    `to_frame` and `decode_frame` do the same a whole column at a time, so a
+    batch of rows becomes one DataFrame already in sheet order.
+    """
+
+    def __init__(self, record, columns):
+        if len(columns) != len(record._fields):
+            raise ValueError(f"{record.__name__} has {len(record._fields)} fields for {len(columns)} columns")
+        self.record = record
+        self.columns = list(columns)
+        self.fields = dict(zip(record._fields, columns))
+        self.types = {
+            field: _base_type(record.__annotations__[field]) for field in record._fields
+        }
+        self.defaults = {field: record._field_defaults.get(field) for field in record._fields}
+
+    def encode(self, row):
+        """One row as a list of sheet cells (blank for missing values)"""
+        return ["" if _missing(value) else value for value in row]
+
+    def decode(self, cells):
+        """Build a row from a mapping of column name to cell value"""
+        return self.record(*(
+            _convert(cells.get(column), self.types[field], self.defaults[field])
+            for field, column in self.fields.items()
+        ))
+
+    def to_frame(self, rows):
+        """A batch of rows as one DataFrame with the sheet's columns"""
+        rows = list(rows)
+        if not rows:
+            return pd.DataFrame(columns=self.columns)
+        return pd.DataFrame(dict(zip(self.columns, zip(*rows))), columns=self.columns)
+
+    def to_dicts(self, rows):
+        """Rows keyed by column name, for code that works with sheet records"""
+        return [dict(zip(self.columns, row)) for row in rows]
+
+    def decode_frame(self, frame):
+        """Conform a sheet read to the schema: columns in order, each cast to its field type"""
+        result = {}
+        for field, column in self.fields.items():
+            kind, default = self.types[field], self.defaults[field]
+            if column not in frame:
+                result[column] = pd.Series(default, index=frame.index, dtype=object if kind is str else None)
+                continue
+            values = frame[column]
+            if kind is str:
+                if values.dtype.kind == "f" and np.allclose(values.dropna() % 1, 0):
+                    # Whole numbers read back as floats (codes, phone numbers) keep their digits
+                    values = values.astype("Int64")
+                result[column] = values.astype(object).where(values.notna(), default or "").astype(str)
+            else:
+                values = pd.to_numeric(values, errors="coerce")
+                if default is not None:
+                    values = values.fillna(default)
+                    if kind is int:
+                        values = values.astype(np.int64)
+                result[column] = values
+        return pd.DataFrame(result, index=frame.index)
+
+    def from_frame(self, frame):
+        """Rows of a sheet read, decoded column-wise"""
+        frame = self.decode_frame(frame)
+        return [self.record(*values) for values in frame.itertuples(index=False, name=None)]
+
+
+def _base_type(annotation):
+    # Optional[X] -> X
+    args = getattr(annotation, "__args__", None)
+    if args:
+        return next(arg for arg in args if arg is not type(None))
+    return annotation
+
+
+def _missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def _convert(value, kind, default):
+    if _missing(value) or value == "":
+        return default
+    if kind is str:
+        return str(value)
+    try:
+        return kind(float(value)) if kind is int else kind(value)
+    except (TypeError, ValueError):
+        return default
+
+
+class SalesRow(NamedTuple):
+    invoice_number: str = ""
+    invoice_date: str = ""
+    employee_name: str = ""
+    employee_code: str = ""
+    designation: str = ""
+    discount_category: str = ""
+    transaction_type: str = ""
+    outlet_name: str = ""
+    outlet_contact: str = ""
+    outlet_address: str = ""
+    outlet_state: str = ""
+    outlet_city: str = ""
+    distributor_firm_name: str = ""
+    distributor_id: str = ""
+    distributor_contact_person: str = ""
+    distributor_contact_number: str = ""
+    distributor_email: str = ""
+    distributor_territory: str = ""
+    product_id: str = ""
+    product_name: str = ""
+    product_category: str = ""
+    quantity: int = 0
+    unit_price: float = 0.0
+    product_discount: float = 0.0
+    discounted_unit_price: float = 0.0
+    total_price: float = 0.0
+    gst_rate: str = ""
+    cgst_amount: float = 0.0
+    sgst_amount: float = 0.0
+    grand_total: float = 0.0
+    overall_discount: Optional[float] = None
+    amount_discount: Optional[float] = None
+    payment_status: str = ""
+    amount_paid: float = 0.0
+    payment_receipt_path: str = ""
+    employee_selfie_path: str = ""
+    invoice_pdf_path: str = ""
+    remarks: str = ""
+    delivery_status: str = "pending"
+
+
+SALES = SheetSchema(SalesRow, [
+    "Invoice Number",
+    "Invoice Date",
+    "Employee Name",
+    "Employee Code",
+    "Designation",
+    "Discount Category",
+    "Transaction Type",
+    "Outlet Name",
+    "Outlet Contact",
+    "Outlet Address",
+    "Outlet State",
+    "Outlet City",
+    "Distributor Firm Name",
+    "Distributor ID",
+    "Distributor Contact Person",
+    "Distributor Contact Number",
+    "Distributor Email",
+    "Distributor Territory",
+    "Product ID",
+    "Product Name",
+    "Product Category",
+    "Quantity",
+    "Unit Price",
+    "Product Discount (%)",
+    "Discounted Unit Price",
+    "Total Price",
+    "GST Rate",
+    "CGST Amount",
+    "SGST Amount",
+    "Grand Total",
+    "Overall Discount (%)",
+    "Amount Discount (INR)",
+    "Payment Status",
+    "Amount Paid",
+    "Payment Receipt Path",
+    "Employee Selfie Path",
+    "Invoice PDF Path",
+    "Remarks",
+    "Delivery Status"
+])
+
+
+class VisitRow(NamedTuple):
+    visit_id: str = ""
+    employee_name: str = ""
+    employee_code: str = ""
+    designation: str = ""
+    outlet_name: str = ""
+    outlet_contact: str = ""
+    outlet_address: str = ""
+    outlet_state: str = ""
+    outlet_city: str = ""
+    visit_date: str = ""
+    entry_time: str = ""
+    exit_time: str = ""
+    duration_minutes: float = 0.0
+    visit_purpose: str = ""
+    visit_notes: str = ""
+    visit_selfie_path: str = ""
+    visit_status: str = ""
+    remarks: str = ""
+
+
+VISITS = SheetSchema(VisitRow, [
+    "Visit ID",
+    "Employee Name",
+    "Employee Code",
+    "Designation",
+    "Outlet Name",
+    "Outlet Contact",
+    "Outlet Address",
+    "Outlet State",
+    "Outlet City",
+    "Visit Date",
+    "Entry Time",
+    "Exit Time",
+    "Visit Duration (minutes)",
+    "Visit Purpose",
+    "Visit Notes",
+    "Visit Selfie Path",
+    "Visit Status",
+    "Remarks"
+])
+
+
+class AttendanceRow(NamedTuple):
+    attendance_id: str = ""
+    employee_name: str = ""
+    employee_code: str = ""
+    designation: str = ""
+    date: str = ""
+    status: str = ""
+    location_link: str = ""
+    leave_reason: str = ""
+    check_in_time: str = ""
+    check_in_date_time: str = ""
+
+
+ATTENDANCE = SheetSchema(AttendanceRow, [
+    "Attendance ID",
+    "Employee Name",
+    "Employee Code",
+    "Designation",
+    "Date",
+    "Status",
+    "Location Link",
+    "Leave Reason",
+    "Check-in Time",
+    "Check-in Date Time"
+])
+
+
+class TicketRow(NamedTuple):
+    ticket_id: str = ""
+    employee_name: str = ""
+    employee_code: str = ""
+    designation: str = ""
+    email: str = ""
+    phone: str = ""
+    category: str = ""
+    subject: str = ""
+    details: str = ""
+    status: str = "Open"
+    date_raised: str = ""
+    time_raised: str = ""
+    resolution_notes: str = ""
+    date_resolved: str = ""
+    priority: str = ""
+
+
+TICKETS = SheetSchema(TicketRow, [
+    "Ticket ID",
+    "Raised By (Employee Name)",
+    "Raised By (Employee Code)",
+    "Raised By (Designation)",
+    "Raised By (Email)",
+    "Raised By (Phone)",
+    "Category",
+    "Subject",
+    "Details",
+    "Status",
+    "Date Raised",
+    "Time Raised",
+    "Resolution Notes",
+    "Date Resolved",
+    "Priority"
+])
+
+
+class TravelHotelRow(NamedTuple):
+    request_id: str = ""
+    request_type: str = ""
+    employee_name: str = ""
+    employee_code: str = ""
+    designation: str = ""
+    email: str = ""
+    phone: str = ""
+    adhara_number: str = ""
+    hotel_name: str = ""
+    check_in_date: str = ""
+    check_out_date: str = ""
+    travel_mode: str = ""
+    from_location: str = ""
+    to_location: str = ""
+    booking_date: str = ""
+    remarks: str = ""
+    status: str = "Pending"
+    date_requested: str = ""
+    time_requested: str = ""
+
+
+TRAVEL_HOTEL = SheetSchema(TravelHotelRow, [
+    "Request ID",
+    "Request Type",
+    "Employee Name",
+    "Employee Code",
+    "Designation",
+    "Email",
+    "Phone",
+    "Adhara Number",
+    "Hotel Name",
+    "Check In Date",
+    "Check Out Date",
+    "Travel Mode",
+    "From Location",
+    "To Location",
+    "Booking Date",
+    "Remarks",
+    "Status",
+    "Date Requested",
+    "Time Requested"
+])
+
+
+class DemoRow(NamedTuple):
+    demo_id: str = ""
+    employee_name: str = ""
+    employee_code: str = ""
+    designation: str = ""
+    partner_employee: str = ""
+    partner_employee_code: str = ""
+    outlet_name: str = ""
+    outlet_contact: str = ""
+    outlet_address: str = ""
+    outlet_state: str = ""
+    outlet_city: str = ""
+    demo_date: str = ""
+    check_in_time: str = ""
+    check_out_time: str = ""
+    check_in_date_time: str = ""
+    duration_minutes: float = 0.0
+    outlet_review: str = ""
+    remarks: str = ""
+    status: str = ""
+    products: str = ""
+    quantities: str = ""
+
+
+DEMOS = SheetSchema(DemoRow, [
+    "Demo ID",
+    "Employee Name",
+    "Employee Code",
+    "Designation",
+    "Partner Employee",
+    "Partner Employee Code",
+    "Outlet Name",
+    "Outlet Contact",
+    "Outlet Address",
+    "Outlet State",
+    "Outlet City",
+    "Demo Date",
+    "Check-in Time",
+    "Check-out Time",
+    "Check-in Date Time",
+    "Duration (minutes)",
+    "Outlet Review",
+    "Remarks",
+    "Status",
+    "Products",
+    "Quantities"
+])
+
+
+class LocationRow(NamedTuple):
+    timestamp: str = ""
+    employee_name: str = ""
+    employee_code: str = ""
+    designation: str = ""
+    latitude: float = 0.0
+    longitude: float = 0.0
+    accuracy: Optional[float] = None
+    location_type: str = ""
+    address: str = ""
+    city: str = ""
+    state: str = ""
+    country: str = ""
+    postal_code: str = ""
+
+
+LOCATIONS = SheetSchema(LocationRow, [
+    "Timestamp",
+    "Employee Name",
+    "Employee Code",
+    "Designation",
+    "Latitude",
+    "Longitude",
+    "Accuracy (meters)",
+    "Location Type",
+    "Address",
+    "City",
+    "State",
+    "Country",
+    "Postal Code"
+])
+
+
+class DemoLineRow(NamedTuple):
+    demo_id: str = ""
+    product_id: str = ""
+    quantity: int = 1
+
+
+DEMO_LINES = SheetSchema(DemoLineRow, [
+    "Demo ID",
+    "Product ID",
+    "Quantity"
+])
@@ -1,7 +1,6 @@
 import streamlit as st
 from streamlit_gsheets import GSheetsConnection
 import pandas as pd
-from fpdf import FPDF
 from datetime import datetime, time
 import os
 import uuid
@@ -16,65 +15,102 @@ from datetime import datetime
 import pytz
 import time
 import pandas as pd
-
-
-
-def log_location_history(conn, employee_name, lat, lng):
-    employee_code = Person[Person['Employee Name'] == employee_name]['Employee Code'].values[0]
-    designation = Person[Person['Employee Name'] == employee_name]['Designation'].values[0]
-    ist = pytz.timezone('Asia/Kolkata')
-    now = datetime.now(ist)
-    date_str = now.strftime("%d-%m-%Y")
-    time_str = now.strftime("%H:%M")
-    gmaps_link = f"https://maps.google.com/?q={lat},{lng}"
-    entry = {
-        "Employee Name": employee_name,
-        "Employee Code": employee_code,
-        "Designation": designation,
-        "Date": date_str,
-        "Time": time_str,
-        "Latitude": lat,
-        "Longitude": lng,
-        "Google Maps Link": gmaps_link
-    }
+from invoice_render import (
+    MERGED_CHUNK_INVOICES, InvoicePDFCache, RenderPool, RenderQueueFull, iter_rendered_invoices,
+    outlet_gst_numbers, render_invoice, render_invoice_cached, save_pdf_async, with_gst_number,
+    write_invoices_merged, write_invoices_zip
+)
+import tempfile
+from outlet_index import OutletIndex
+from territory import TerritoryIndex
+from gazetteer import Gazetteer
+from location_store import LocationBatchWriter, MovementFilter, append_sheet_rows, update_sheet_row
+from streamlit_autorefresh import st_autorefresh
+from route_analytics import load_fixes, route_analytics
+from attendance_rollup import AttendanceRollup
+from sales_cube import SalesCube
+from invoice_index import InvoiceIndex, sales_fingerprint
+from sheet_schemas import (
+    ATTENDANCE, DEMO_LINES, DEMOS, SALES, TICKETS, TRAVEL_HOTEL, VISITS,
+    AttendanceRow, DemoRow, SalesRow, TicketRow, TravelHotelRow, VisitRow
+)
+from demo_lines import DemoLineStore, demo_line_rows, demo_lines_from_demos
+from demo_conversion import DemoConversionEngine
+from ticket_queue import OPEN_STATUS, TicketStore
+from dashboard import build_dashboard
+import plotly.io as pio
+from geo_verification import (
+    OUTLET_COORDINATES_FILE, OutletSpatialIndex, attach_nearest_fixes, load_outlet_coordinates, parse_maps_links,
+    to_seconds, verify_locations
+)
+
+
+
+def log_location_history(conn, employee_name, lat, lng, accuracy=None, force=False):
+    """Pass a fix through the movement filter and buffer whatever it keeps for
+    LocationHistory; rows reach the sheet in batches. `force` keeps the fix
+    even if the employee has not moved (used at login).
+    """
     try:
-        existing = conn.read(worksheet="LocationHistory", usecols=list(range(len(LOCATION_HISTORY_COLUMNS))), ttl=5)
-        existing = existing.dropna(how="all")
-        new_df = pd.DataFrame([entry], columns=LOCATION_HISTORY_COLUMNS)
-        updated = pd.concat([existing, new_df], ignore_index=True)
-        conn.update(worksheet="LocationHistory", data=updated)
+        employee_code = Person[Person['Employee Name'] == employee_name]['Employee Code'].values[0]
+        records = get_movement_filter().observe(employee_name, time.time(), float(lat), float(lng), accuracy, force)
+        buffer_location_records(employee_code, records, accuracy)
         return True, None
     except Exception as e:
         return False, str(e)
 
 
+def buffer_location_records(employee_code, records, accuracy=None):
+    writer = get_location_history_writer()
+    for ts, lat, lng, dwell_seconds in records:
+        if dwell_seconds is None:
+            writer.append(employee_code, ts, lat, lng, accuracy)
+        else:
+            writer.append(employee_code, ts, lat, lng, extra={"Dwell Minutes": round(dwell_seconds / 60)})
+
+
+def close_location_history(employee_name):
+    """Store the employee's open dwell, if any, when they log out"""
+    employee_row = Person[Person['Employee Name'] == employee_name]
+    if employee_row.empty:
+        return
+    records = get_movement_filter().close(employee_name)
+    buffer_location_records(employee_row['Employee Code'].values[0], records)
+
+
 def hourly_location_auto_log(conn, selected_employee):
+    """Sample the browser location at the movement filter's current rate:
+    every few minutes while the employee is moving, rarely while they stay put.
+    """
     if not selected_employee:
         return
+    interval = get_movement_filter().interval(selected_employee)
+    # Rerun the page when the next sample is due, even if the user is idle
+    st_autorefresh(interval=interval * 1000, key="location_sampling_refresh")
+    slot = int(time.time() // interval)
     result = streamlit_js_eval(
         js_expressions="""
             new Promise((resolve) => {
                 if (navigator.geolocation) {
                     navigator.geolocation.getCurrentPosition(
-                        pos => resolve({latitude: pos.coords.latitude, longitude: pos.coords.longitude, ts: Date.now()}),
-                        err => resolve({latitude: null, longitude: null, ts: Date.now()})
+                        pos => resolve({latitude: pos.coords.latitude, longitude: pos.coords.longitude, accuracy: pos.coords.accuracy, ts: Date.now()}),
+                        err => resolve({latitude: null, longitude: null, accuracy: null, ts: Date.now()})
                     );
                 } else {
-                    resolve({latitude: null, longitude: null, ts: Date.now()});
+                    resolve({latitude: null, longitude: null, accuracy: null, ts: Date.now()});
                 }
             });
         """,
-        key=f"geo_hourly_{int(time.time() // 3600)}"
+        key=f"geo_sample_{interval}_{slot}"
     ) or {}
 
     lat = result.get("latitude")
     lng = result.get("longitude")
 
     if lat and lng:
-        current_hour = datetime.now(pytz.timezone('Asia/Kolkata')).strftime("%Y-%m-%d %H")
-        logged_key = f"hourly_logged_{selected_employee}_{current_hour}"
+        logged_key = f"location_logged_{selected_employee}_{interval}_{slot}"
         if not st.session_state.get(logged_key, False):
-            success, error = log_location_history(conn, selected_employee, lat, lng)
+            success, error = log_location_history(conn, selected_employee, lat, lng, result.get("accuracy"))
             if success:
                 st.session_state[logged_key] = True
 
@@ -197,47 +233,7 @@ def safe_sheet_operation(operation, *args, **kwargs):
             time.sleep(1 * (attempt + 1))  # Exponential backoff
 
 # Constants
-SALES_SHEET_COLUMNS = [
-    "Invoice Number",
-    "Invoice Date",
-    "Employee Name",
-    "Employee Code",
-    "Designation",
-    "Discount Category",
-    "Transaction Type",
-    "Outlet Name",
-    "Outlet Contact",
-    "Outlet Address",
-    "Outlet State",
-    "Outlet City",
-    "Distributor Firm Name",
-    "Distributor ID",
-    "Distributor Contact Person",
-    "Distributor Contact Number",
-    "Distributor Email",
-    "Distributor Territory",
-    "Product ID",
-    "Product Name",
-    "Product Category",
-    "Quantity",
-    "Unit Price",
-    "Product Discount (%)",
-    "Discounted Unit Price",
-    "Total Price",
-    "GST Rate",
-    "CGST Amount",
-    "SGST Amount",
-    "Grand Total",
-    "Overall Discount (%)",
-    "Amount Discount (INR)",
-    "Payment Status",
-    "Amount Paid",
-    "Payment Receipt Path",
-    "Employee Selfie Path",
-    "Invoice PDF Path",
-    "Remarks",
-    "Delivery Status"  # Added new column for delivery status
-]
+SALES_SHEET_COLUMNS = SALES.columns
 
 LOCATION_HISTORY_COLUMNS = [
     "Employee Name",
@@ -247,107 +243,25 @@ LOCATION_HISTORY_COLUMNS = [
     "Time",
     "Latitude",
     "Longitude",
-    "Google Maps Link"
+    "Google Maps Link",
+    "Dwell Minutes"
 ]
 
-VISIT_SHEET_COLUMNS = [
-    "Visit ID",
-    "Employee Name",
-    "Employee Code",
-    "Designation",
-    "Outlet Name",
-    "Outlet Contact",
-    "Outlet Address",
-    "Outlet State",
-    "Outlet City",
-    "Visit Date",
-    "Entry Time",
-    "Exit Time",
-    "Visit Duration (minutes)",
-    "Visit Purpose",
-    "Visit Notes",
-    "Visit Selfie Path",
-    "Visit Status",
-    "Remarks"
-]
+# Movement-aware location sampling
+LOCATION_MIN_DISTANCE_M = 100
+LOCATION_DWELL_MIN_SECONDS = 10 * 60
+LOCATION_MOVING_INTERVAL_SECONDS = 5 * 60
+LOCATION_STATIONARY_INTERVAL_SECONDS = 30 * 60
 
-ATTENDANCE_SHEET_COLUMNS = [
-    "Attendance ID",
-    "Employee Name",
-    "Employee Code",
-    "Designation",
-    "Date",
-    "Status",
-    "Location Link",
-    "Leave Reason",
-    "Check-in Time",
-    "Check-in Date Time"
-]
+VISIT_SHEET_COLUMNS = VISITS.columns
 
-# Add these constants at the top of app.py with other constants
-TICKET_SHEET_COLUMNS = [
-    "Ticket ID",
-    "Raised By (Employee Name)",
-    "Raised By (Employee Code)",
-    "Raised By (Designation)",
-    "Raised By (Email)",
-    "Raised By (Phone)",
-    "Category",
-    "Subject",
-    "Details",
-    "Status",
-    "Date Raised",
-    "Time Raised",
-    "Resolution Notes",
-    "Date Resolved",
-    "Priority"
-]
+ATTENDANCE_SHEET_COLUMNS = ATTENDANCE.columns
 
-TRAVEL_HOTEL_COLUMNS = [
-    "Request ID",
-    "Request Type",
-    "Employee Name",
-    "Employee Code",
-    "Designation",
-    "Email",
-    "Phone",
-    "Adhara Number",
-    "Hotel Name",
-    "Check In Date",
-    "Check Out Date",
-    "Travel Mode",
-    "From Location",
-    "To Location",
-    "Booking Date",
-    "Remarks",
-    "Status",
-    "Date Requested",
-    "Time Requested"
-]
+TICKET_SHEET_COLUMNS = TICKETS.columns
 
-DEMO_SHEET_COLUMNS = [
-    "Demo ID",
-    "Employee Name",
-    "Employee Code",
-    "Designation",
-    "Partner Employee",
-    "Partner Employee Code",
-    "Outlet Name",
-    "Outlet Contact",
-    "Outlet Address",
-    "Outlet State",
-    "Outlet City",
-    "Demo Date",
-    "Check-in Time",
-    "Check-out Time",
-    "Check-in Date Time",
-    "Duration (minutes)",
-    "Outlet Review",
-    "Remarks",
-    "Status",
-    "Products",
-    "Quantities"
-]
+TRAVEL_HOTEL_COLUMNS = TRAVEL_HOTEL.columns
+
+DEMO_SHEET_COLUMNS = DEMOS.columns
 
 
 TICKET_CATEGORIES = [
@@ -370,26 +284,15 @@ REQUEST_TYPES = ["Hotel", "Travel", "Travel & Hotel"]
 conn = st.connection("gsheets", type=GSheetsConnection)
 
 # Load data
+MASTER_DATA_FILES = ['Invoice - Products.csv', 'Invoice - Outlet.csv', 'Invoice - Person.csv', 'Invoice - Distributors.csv']
 Products = pd.read_csv('Invoice - Products.csv')
 Outlet = pd.read_csv('Invoice - Outlet.csv')
 Person = pd.read_csv('Invoice - Person.csv')
 Distributors = pd.read_csv('Invoice - Distributors.csv')
 
-# Company Details with ALLGEN TRADING logo
-company_name = "BIOLUME SKIN SCIENCE PRIVATE LIMITED"
-company_address = """Ground Floor Rampal Awana Complex,
-Rampal Awana Complex, Indra Market,
-Sector-27, Atta, Noida, Gautam Buddha Nagar,
-Uttar Pradesh 201301
-GSTIN/UIN: 09AALCB9426H1ZA
-State Name: Uttar Pradesh, Code: 09
-"""
-company_logo = 'ALLGEN TRADING logo.png'
-bank_details = """
-Disclaimer: This Proforma Invoice is for estimation purposes only and is not a demand for payment. 
-Prices, taxes, and availability are subject to change. Final billing may vary. 
-Goods/services will be delivered only after confirmation and payment. No legal obligation is created by this document.
-"""
+def master_data_version():
+    """Changes whenever a master CSV is replaced, so derived indexes get rebuilt"""
+    return tuple(os.path.getmtime(path) for path in MASTER_DATA_FILES)
 
 # Create directories for storing uploads
 os.makedirs("employee_selfies", exist_ok=True)
@@ -397,24 +300,29 @@ os.makedirs("payment_receipts", exist_ok=True)
 os.makedirs("invoices", exist_ok=True)
 os.makedirs("visit_selfies", exist_ok=True)
 
-# Custom PDF class
-class PDF(FPDF):
-    def header(self):
-        if company_logo:
-            try:
-                self.image(company_logo, 10, 8, 33)
-            except:
-                pass
-        
-        self.set_font('Arial', 'B', 16)
-        self.cell(0, 10, company_name, ln=True, align='C')
-        self.set_font('Arial', '', 10)
-        self.multi_cell(0, 5, company_address, align='C')
-        
-        self.set_font('Arial', 'B', 14)
-        self.cell(0, 10, 'Proforma Invoice', ln=True, align='C')
-        self.line(10, 50, 200, 50)
-        self.ln(1)
+@st.cache_resource
+def get_invoice_cache():
+    """Process-wide PDF cache shared by every session's Regenerate Invoice"""
+    return InvoicePDFCache()
+
+@st.cache_resource
+def get_render_pool():
+    """Process-wide bounded pool that every session's PDF rendering goes through"""
+    return RenderPool(max_workers=2, max_queue=16)
+
+def render_invoice_pooled(line_items, header):
+    """Render on the shared pool, showing the queue position while waiting"""
+    job = get_render_pool().submit(render_invoice, line_items, header)
+    status = st.empty()
+    while not job.done():
+        position = job.queue_position()
+        if position:
+            status.info(f"Waiting for the invoice renderer - position {position} in queue")
+        else:
+            status.info("Rendering invoice...")
+        job.wait(timeout=0.5)
+    status.empty()
+    return job.result()
 
 def generate_invoice_number():
     return f"INV-{get_ist_time().strftime('%Y%m%d')}-{str(uuid.uuid4())[:8].upper()}"
@@ -440,6 +348,278 @@ def save_uploaded_file(uploaded_file, folder):
         return file_path
     return None
 
+OUTLET_PICKER_LIMIT = 50
+
+@st.cache_resource
+def get_outlet_index(version):
+    """Search index over the Outlet master list, built once per master data version"""
+    return OutletIndex(Outlet)
+
+@st.cache_resource
+def get_territory_index(version):
+    """Zone -> outlet/distributor row positions, built once per master data version"""
+    return TerritoryIndex(Outlet, Distributors)
+
+def employee_territory(employee_name):
+    """Outlet and distributor row positions for the employee's Zone (None means everything)"""
+    zone = Person.loc[Person['Employee Name'] == employee_name, 'Zone'].iat[0]
+    territory_index = get_territory_index(master_data_version())
+    return territory_index.outlets_for(zone), territory_index.distributors_for(zone)
+
+def outlet_picker(key_prefix, select_key, scope=None):
+    """Searchable outlet selector that only sends the top matches to the browser.
+
+    Returns the selected Outlet row, or None when nothing matches.
+    """
+    outlet_index = get_outlet_index(master_data_version())
+    if scope is not None and st.checkbox("Show outlets outside my territory", key=f"{key_prefix}_all_territories"):
+        scope = None
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        query = st.text_input("Search Outlet", key=f"{key_prefix}_search", placeholder="Type part of the outlet name")
+    with col2:
+        state = st.selectbox("State", ["All States"] + outlet_index.states(scope), key=f"{key_prefix}_state_filter")
+
+    matches = outlet_index.search(
+        query,
+        limit=OUTLET_PICKER_LIMIT,
+        scope=scope,
+        state=None if state == "All States" else state
+    )
+    if not matches:
+        st.info("No outlets match your search")
+        return None
+
+    outlet_id = st.selectbox(
+        "Select Outlet",
+        matches,
+        format_func=outlet_index.label,
+        key=select_key,
+        help=f"Showing up to {OUTLET_PICKER_LIMIT} matches - type more of the name to narrow down"
+    )
+    return outlet_index.row(outlet_id)
+
+def location_history_rows(batch):
+    """Turn a buffered batch of fixes into LocationHistory rows"""
+    people = Person.drop_duplicates('Employee Code').set_index('Employee Code')
+    codes = pd.Series(batch['employee_code'])
+    stamps = pd.to_datetime(batch['ts'], unit='s', utc=True).tz_convert('Asia/Kolkata')
+    lat = pd.Series(batch['lat'])
+    lng = pd.Series(batch['lng'])
+    return pd.DataFrame({
+        "Employee Name": codes.map(people['Employee Name']),
+        "Employee Code": codes,
+        "Designation": codes.map(people['Designation']),
+        "Date": stamps.strftime("%d-%m-%Y"),
+        "Time": stamps.strftime("%H:%M"),
+        "Latitude": lat,
+        "Longitude": lng,
+        "Google Maps Link": "https://maps.google.com/?q=" + lat.astype(str) + "," + lng.astype(str),
+        "Dwell Minutes": [(extra or {}).get("Dwell Minutes", "") for extra in batch['extra']]
+    }, columns=LOCATION_HISTORY_COLUMNS)
+
+@st.cache_resource
+def get_location_history_writer():
+    """Process-wide buffer that appends LocationHistory fixes in batches"""
+    return LocationBatchWriter(
+        lambda batch: append_sheet_rows(conn, "LocationHistory", location_history_rows(batch), LOCATION_HISTORY_COLUMNS)
+    )
+
+@st.cache_resource
+def get_attendance_rollup():
+    """Daily attendance rollup persisted in attendance_rollup.sqlite3"""
+    return AttendanceRollup("attendance_rollup.sqlite3")
+
+def employee_zones():
+    return Person.drop_duplicates('Employee Code').set_index('Employee Code')['Zone'].to_dict()
+
+@st.cache_resource
+def get_sales_cube():
+    """Pre-aggregated sales cube persisted in sales_cube.sqlite3, kept current by sync_sales_sheet and every write"""
+    return SalesCube("sales_cube.sqlite3")
+
+@st.cache_resource
+def get_invoice_index():
+    """Invoice headers and line offsets persisted in invoice_index.sqlite3, built from the Sales sheet on first use"""
+    index = InvoiceIndex("invoice_index.sqlite3")
+    if not len(index):
+        try:
+            index.sync(conn.read(worksheet="Sales", ttl=5))
+        except Exception:
+            pass
+    return index
+
+@st.cache_data(ttl=300)
+def load_sales_data():
+    """The Sales sheet in sheet order, and its fingerprint for keeping the invoice index current.
+
+    Cleared after every write to the Sales sheet, so the next read is the
+    sheet the invoice index was just updated from.
+    """
+    try:
+        # ttl=0: a cleared load must not be served the read from before the write
+        sales_data = conn.read(worksheet="Sales", ttl=0)
+        sales_data = sales_data.dropna(how='all')
+        fingerprint = sales_fingerprint(sales_data)
+        
+        # Convert columns to their schema types in one columnar pass
+        sales_data = SALES.decode_frame(sales_data)
+        
+        # Convert Invoice Date properly
+        try:
+            sales_data['Invoice Date'] = pd.to_datetime(sales_data['Invoice Date'], dayfirst=True, errors='coerce')
+        except:
+            # Fallback if date parsing fails
+            sales_data['Invoice Date'] = pd.to_datetime(sales_data['Invoice Date'], errors='coerce')
+        
+        # Rows stay in sheet order: the invoice index addresses lines by position
+        return sales_data, fingerprint
+    except Exception as e:
+        st.error(f"Error loading sales data: {e}")
+        return pd.DataFrame(), None
+
+def sync_sales_sheet():
+    """The decoded Sales sheet, with the invoice index, sales cube and conversion
+    engine brought up to date with it (each a no-op when the sheet has not
+    changed), so invoices written by the other apps reach them too"""
+    sales_data, fingerprint = load_sales_data()
+    if fingerprint is None:
+        return sales_data, fingerprint
+    get_invoice_index().refresh(sales_data, fingerprint)
+    try:
+        get_sales_cube().refresh(sales_data, fingerprint)
+        get_demo_conversion_engine().refresh_sales(sales_data, fingerprint)
+    except Exception as e:
+        st.warning(f"Sales summary not updated: {e}")
+    return sales_data, fingerprint
+
+def gst_numbers_by_outlet():
+    return outlet_gst_numbers(Outlet)
+
+def product_ids_by_name():
+    return Products.drop_duplicates('Product Name').set_index('Product Name')['Product ID'].astype(str).to_dict()
+
+def product_names_by_id():
+    catalogue = Products.drop_duplicates('Product ID')
+    return catalogue.set_index(catalogue['Product ID'].astype(str))['Product Name']
+
+@st.cache_resource
+def get_demo_line_store():
+    """Demo product lines persisted in demo_lines.sqlite3, seeded from DemoLines and older Demos rows on first use"""
+    store = DemoLineStore("demo_lines.sqlite3")
+    if not len(store):
+        try:
+            store.add_frame(conn.read(worksheet="DemoLines", usecols=list(range(len(DEMO_LINES.columns))), ttl=5))
+        except Exception:
+            pass
+        try:
+            demos = conn.read(worksheet="Demos", usecols=list(range(len(DEMO_SHEET_COLUMNS))), ttl=5)
+            store.add(demo_lines_from_demos(demos, product_ids_by_name()))
+        except Exception:
+            pass
+    return store
+
+@st.cache_resource
+def get_demo_conversion_engine():
+    """Demo-to-sale conversion state, seeded from the Demos sheet; sales are folded in by sync_sales_sheet and every write"""
+    engine = DemoConversionEngine()
+    try:
+        demos = conn.read(worksheet="Demos", usecols=list(range(len(DEMO_SHEET_COLUMNS))), ttl=5)
+        engine.add_demos(demos, get_demo_line_store().frame())
+    except Exception:
+        pass
+    return engine
+
+@st.cache_resource
+def get_ticket_store():
+    """Process-wide ticket index and open-ticket queue"""
+    return TicketStore()
+
+def load_ticket_store():
+    """The ticket store, brought up to date with the Tickets sheet (a no-op when it has not changed)"""
+    store = get_ticket_store()
+    tickets = conn.read(worksheet="Tickets", usecols=list(range(len(TICKET_SHEET_COLUMNS))), ttl=5)
+    store.sync(tickets)
+    return store
+
+TICKETS_PER_PAGE = 10
+
+def ticket_page_number(total, key):
+    """Page selector for a ticket list; returns the offset of the chosen page"""
+    pages = max(1, -(-total // TICKETS_PER_PAGE))
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1, key=key)
+    return (page - 1) * TICKETS_PER_PAGE
+
+def sales_summary(employee_code):
+    """Revenue, product mix, outlet ranking and daily trend for one employee, from the sales cube"""
+    cube = get_sales_cube()
+    today = get_ist_time().date()
+    periods = {
+        "This Month": today.replace(day=1),
+        "Last 30 Days": today - timedelta(days=29),
+        "This Year": today.replace(month=1, day=1)
+    }
+    period = st.radio("Period", list(periods), horizontal=True, key="sales_summary_period")
+    start_date = periods[period]
+
+    totals = cube.query((), start_date, today, employee=str(employee_code))
+    if totals.empty:
+        st.info("No sales in this period")
+        return
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Revenue", f"₹{totals['Grand Total'].iloc[0]:,.2f}")
+    col2.metric("Units Sold", f"{totals['Quantity'].iloc[0]:,.0f}")
+    col3.metric("Invoice Lines", int(totals['Lines'].iloc[0]))
+
+    product_names = Products.drop_duplicates('Product ID').set_index('Product ID')['Product Name']
+    col1, col2 = st.columns(2)
+    with col1:
+        st.write("**Top Products**")
+        products = cube.query(("product",), start_date, today, employee=str(employee_code)).head(10)
+        products.insert(1, "Product Name", products["Product ID"].map(product_names))
+        st.dataframe(products, use_container_width=True, hide_index=True)
+    with col2:
+        st.write("**Top Outlets**")
+        outlets = cube.query(("outlet",), start_date, today, employee=str(employee_code)).head(10)
+        st.dataframe(outlets, use_container_width=True, hide_index=True)
+
+    trend = cube.query(("day",), start_date, today, employee=str(employee_code)).sort_values("Date")
+    st.line_chart(trend.set_index("Date")["Grand Total"])
+
+@st.cache_resource
+def get_movement_filter():
+    """Process-wide per-employee movement state for location sampling"""
+    return MovementFilter(
+        min_distance_m=LOCATION_MIN_DISTANCE_M,
+        dwell_min_seconds=LOCATION_DWELL_MIN_SECONDS,
+        moving_interval=LOCATION_MOVING_INTERVAL_SECONDS,
+        stationary_interval=LOCATION_STATIONARY_INTERVAL_SECONDS
+    )
+
+@st.cache_resource
+def get_gazetteer():
+    """City/state lookup loaded once from India City - State.csv"""
+    return Gazetteer('India City - State.csv')
+
+def state_city_inputs(state_label, city_label, state_key, city_key):
+    """Manual State/City inputs checked against the offline city list.
+
+    Returns the canonical spellings when the pair is recognised, otherwise
+    what was typed, with a hint shown under the inputs.
+    """
+    gazetteer = get_gazetteer()
+    state = st.text_input(state_label, "", key=state_key)
+    city = st.text_input(city_label, "", key=city_key)
+
+    if state and not gazetteer.canonical_state(state):
+        st.caption(f"'{state}' is not a recognised state. Known states: {', '.join(gazetteer.states())}")
+    if city:
+        canonical_state, canonical_city, message = gazetteer.validate(state, city)
+        if message:
+            st.caption(message)
+        else:
+            state, city = canonical_state, canonical_city
+    return state, city
 
 def demo_page():
     hourly_location_auto_log(conn, st.session_state.employee_name)
@@ -460,11 +640,13 @@ def demo_page():
         st.subheader("Outlet Details")
         outlet_option = st.radio("Outlet Selection", ["Enter manually", "Select from list"], key="demo_outlet_option")
         if outlet_option == "Select from list":
-            outlet_names = Outlet['Shop Name'].tolist()
-            selected_outlet = st.selectbox("Select Outlet", outlet_names, key="demo_outlet_select")
-            od = Outlet[Outlet['Shop Name'] == selected_outlet].iloc[0]
-            outlet_name, outlet_contact = selected_outlet, od['Contact']
-            outlet_address, outlet_state, outlet_city = od['Address'], od['State'], od['City']
+            territory_outlets, _ = employee_territory(selected_employee)
+            od = outlet_picker("demo_outlet", "demo_outlet_select", scope=territory_outlets)
+            if od is not None:
+                outlet_name, outlet_contact = od['Shop Name'], od['Contact']
+                outlet_address, outlet_state, outlet_city = od['Address'], od['State'], od['City']
+            else:
+                outlet_name = outlet_contact = outlet_address = outlet_state = outlet_city = ""
             st.text_input("Contact", value=outlet_contact, disabled=True, key="demo_outlet_contact_display")
             st.text_input("Address", value=outlet_address, disabled=True, key="demo_outlet_address_display")
             st.text_input("State", value=outlet_state, disabled=True, key="demo_outlet_state_display")
@@ -473,8 +655,7 @@ def demo_page():
             outlet_name    = st.text_input("Outlet Name", key="demo_outlet_name")
             outlet_contact = st.text_input("Outlet Contact", key="demo_outlet_contact")
             outlet_address = st.text_area("Outlet Address", key="demo_outlet_address")
-            outlet_state   = st.text_input("Outlet State", "", key="demo_outlet_state")
-            outlet_city    = st.text_input("Outlet City", "", key="demo_outlet_city")
+            outlet_state, outlet_city = state_city_inputs("Outlet State", "Outlet City", "demo_outlet_state", "demo_outlet_city")
 
         st.subheader("Demo Details")
         demo_date     = st.date_input("Demo Date", key="demo_date")
@@ -509,38 +690,51 @@ def demo_page():
                 duration = (co - ci).total_seconds() / 60.0
                 demo_id  = f"DEMO-{now.strftime('%Y%m%d')}-{uuid.uuid4().hex[:8].upper()}"
 
-                demo_data = {
-                    "Demo ID": demo_id,
-                    "Employee Name": selected_employee,
-                    "Employee Code": Person.loc[Person['Employee Name']==selected_employee,'Employee Code'].iat[0],
-                    "Designation": Person.loc[Person['Employee Name']==selected_employee,'Designation'].iat[0],
-                    "Partner Employee": partner_employee,
-                    "Partner Employee Code": Person.loc[Person['Employee Name']==partner_employee,'Employee Code'].iat[0],
-                    "Outlet Name": outlet_name,
-                    "Outlet Contact": outlet_contact,
-                    "Outlet Address": outlet_address,
-                    "Outlet State": outlet_state,
-                    "Outlet City": outlet_city,
-                    "Demo Date": demo_date.strftime("%d-%m-%Y"),
-                    "Check-in Time": ci.strftime("%H:%M:%S"),
-                    "Check-out Time": co.strftime("%H:%M:%S"),
-                    "Check-in Date Time": now.strftime("%d-%m-%Y %H:%M:%S"),
-                    "Duration (minutes)": round(duration, 2),
-                    "Outlet Review": outlet_review,
-                    "Remarks": remarks,
-                    "Status": "Completed",
-                    "Products": "|".join(selected_products),
-                    "Quantities": "|".join(quantities)
-                }
+                demo_data = DemoRow(
+                    demo_id=demo_id,
+                    employee_name=selected_employee,
+                    employee_code=Person.loc[Person['Employee Name']==selected_employee,'Employee Code'].iat[0],
+                    designation=Person.loc[Person['Employee Name']==selected_employee,'Designation'].iat[0],
+                    partner_employee=partner_employee,
+                    partner_employee_code=Person.loc[Person['Employee Name']==partner_employee,'Employee Code'].iat[0],
+                    outlet_name=outlet_name,
+                    outlet_contact=outlet_contact,
+                    outlet_address=outlet_address,
+                    outlet_state=outlet_state,
+                    outlet_city=outlet_city,
+                    demo_date=demo_date.strftime("%d-%m-%Y"),
+                    check_in_time=ci.strftime("%H:%M:%S"),
+                    check_out_time=co.strftime("%H:%M:%S"),
+                    check_in_date_time=now.strftime("%d-%m-%Y %H:%M:%S"),
+                    duration_minutes=round(duration, 2),
+                    outlet_review=outlet_review,
+                    remarks=remarks,
+                    status="Completed",
+                    products="|".join(selected_products),
+                    quantities="|".join(quantities)
+                )
 
                 try:
-                    existing = conn.read(worksheet="Demos", usecols=list(range(len(DEMO_SHEET_COLUMNS))), ttl=5).dropna(how="all")
-                    df_new   = pd.DataFrame([demo_data], columns=DEMO_SHEET_COLUMNS)
-                    conn.update(worksheet="Demos", data=pd.concat([existing, df_new], ignore_index=True))
-                    st.success(f"Demo {demo_id} recorded successfully!")
-                    st.balloons()
+                    df_new = DEMOS.to_frame([demo_data])
+                    append_sheet_rows(conn, "Demos", df_new, DEMO_SHEET_COLUMNS)
                 except Exception as e:
                     st.error(f"Failed to record demo: {e}")
+                else:
+                    st.success(f"Demo {demo_id} recorded successfully!")
+                    st.balloons()
+                    # The demo is saved: a DemoLines failure must not invite a resubmit,
+                    # as its lines can be rebuilt from the Demos row's Products/Quantities
+                    demo_lines = demo_line_rows(demo_id, selected_products, quantities, product_ids_by_name())
+                    try:
+                        # One DemoLines row per product, appended in a single batch
+                        append_sheet_rows(conn, "DemoLines", DEMO_LINES.to_frame(demo_lines), DEMO_LINES.columns)
+                    except Exception as e:
+                        st.warning(f"Demo products were not saved to DemoLines: {e}")
+                    try:
+                        get_demo_line_store().add(demo_lines)
+                        get_demo_conversion_engine().add_demos(df_new, DEMO_LINES.to_frame(demo_lines))
+                    except Exception as e:
+                        st.warning(f"Demo analytics not updated: {e}")
             else:
                 st.error("Please fill all required fields (Outlet + ≥1 product).")
 
@@ -619,16 +813,12 @@ def demo_page():
             st.metric("Review", details['Outlet Review'])
 
         st.subheader("Products Demonstrated")
-        prod_str = str(details.get('Products',''))
-        qty_str  = str(details.get('Quantities',''))
-        prods = prod_str.split("|") if prod_str else []
-        qtys  = qty_str.split("|")  if qty_str  else []
-        # pad lists
-        L = max(len(prods), len(qtys))
-        prods += [""]*(L-len(prods))
-        qtys  += [""]*(L-len(qtys))
-        df_pd = pd.DataFrame({"Product": prods, "Quantity": qtys})
-        st.dataframe(df_pd, use_container_width=True, hide_index=True)
+        df_pd = get_demo_line_store().lines(sel)
+        if df_pd.empty:
+            # Recorded before DemoLines existed: parse the demo's own row
+            df_pd = DEMO_LINES.to_frame(demo_lines_from_demos(filtered[filtered['Demo ID']==sel], product_ids_by_name()))
+        df_pd.insert(0, "Product", df_pd["Product ID"].map(product_names_by_id()).fillna(df_pd["Product ID"]))
+        st.dataframe(df_pd[["Product", "Product ID", "Quantity"]], use_container_width=True, hide_index=True)
 
         st.subheader("Remarks")
         st.write(details['Remarks'])
@@ -711,28 +901,29 @@ def support_ticket_page():
                         current_date = get_ist_time().strftime("%d-%m-%Y")
                         current_time = get_ist_time().strftime("%H:%M:%S")
                         
-                        ticket_data = {
-                            "Ticket ID": ticket_id,
-                            "Raised By (Employee Name)": selected_employee,
-                            "Raised By (Employee Code)": employee_code,
-                            "Raised By (Designation)": designation,
-                            "Raised By (Email)": employee_email.strip(),
-                            "Raised By (Phone)": employee_phone.strip(),
-                            "Category": category,
-                            "Subject": subject,
-                            "Details": details,
-                            "Status": "Open",
-                            "Date Raised": current_date,
-                            "Time Raised": current_time,
-                            "Resolution Notes": "",
-                            "Date Resolved": "",
-                            "Priority": priority
-                        }
+                        ticket_data = TicketRow(
+                            ticket_id=ticket_id,
+                            employee_name=selected_employee,
+                            employee_code=employee_code,
+                            designation=designation,
+                            email=employee_email.strip(),
+                            phone=employee_phone.strip(),
+                            category=category,
+                            subject=subject,
+                            details=details,
+                            status="Open",
+                            date_raised=current_date,
+                            time_raised=current_time,
+                            resolution_notes="",
+                            date_resolved="",
+                            priority=priority
+                        )
                         
-                        ticket_df = pd.DataFrame([ticket_data])
+                        ticket_df = TICKETS.to_frame([ticket_data])
                         success, error = log_ticket_to_gsheet(conn, ticket_df)
                         
                         if success:
+                            get_ticket_store().add(ticket_data)
                             st.success(f"""
                             Your ticket has been submitted successfully! 
                             We will update you within 48 hours regarding this matter.
@@ -747,100 +938,91 @@ def support_ticket_page():
     with tab2:
         st.subheader("My Support Tickets")
         try:
-            tickets_data = conn.read(worksheet="Tickets", usecols=list(range(len(TICKET_SHEET_COLUMNS))), ttl=5)
-            tickets_data = tickets_data.dropna(how="all")
+            ticket_store = load_ticket_store()
+            my_tickets = ticket_store.query(employee_code=str(employee_code))
             
-            if not tickets_data.empty:
-                my_tickets = tickets_data[
-                    tickets_data['Raised By (Employee Name)'] == selected_employee
-                ].sort_values(by="Date Raised", ascending=False)
+            if my_tickets:
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Total Tickets", len(my_tickets))
+                col2.metric("Open", len(ticket_store.query(employee_code=str(employee_code), status="Open")))
+                col3.metric("Resolved", len(ticket_store.query(employee_code=str(employee_code), status="Resolved")))
                 
-                if not my_tickets.empty:
-                    pending_count = len(my_tickets[my_tickets['Status'] == "Open"])
-                    resolved_count = len(my_tickets[my_tickets['Status'] == "Resolved"])
-                    
-                    col1, col2, col3 = st.columns(3)
-                    col1.metric("Total Tickets", len(my_tickets))
-                    col2.metric("Open", pending_count)
-                    col3.metric("Resolved", resolved_count)
-                    
-                    st.subheader("Filter Tickets")
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        status_filter = st.selectbox(
-                            "Status",
-                            ["All", "Open", "Resolved"],
-                            key="status_filter"
-                        )
-                    with col2:
-                        priority_filter = st.selectbox(
-                            "Priority",
-                            ["All"] + PRIORITY_LEVELS,
-                            key="priority_filter"
-                        )
-                    with col3:
-                        category_filter = st.selectbox(
-                            "Category",
-                            ["All"] + TICKET_CATEGORIES,
-                            key="category_filter"
-                        )
-                    
-                    filtered_tickets = my_tickets.copy()
-                    if status_filter != "All":
-                        filtered_tickets = filtered_tickets[filtered_tickets['Status'] == status_filter]
-                    if priority_filter != "All":
-                        filtered_tickets = filtered_tickets[filtered_tickets['Priority'] == priority_filter]
-                    if category_filter != "All":
-                        filtered_tickets = filtered_tickets[filtered_tickets['Category'] == category_filter]
-                    
-                    for _, row in filtered_tickets.iterrows():
-                        with st.expander(f"{row['Subject']} - {row['Status']} ({row['Priority']})"):
-                            status_color = "red" if row['Status'] == "Open" else "green"
-                            st.markdown(f"""
-                            <div style="display: flex; justify-content: space-between; align-items: center;">
-                                <div>
-                                    <strong>Ticket ID:</strong> {row['Ticket ID']}<br>
-                                    <strong>Date Raised:</strong> {row['Date Raised']} at {row['Time Raised']}
-                                </div>
-                                <div style="color: {status_color}; font-weight: bold;">
-                                    {row['Status']}
-                                </div>
+                st.subheader("Filter Tickets")
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    status_filter = st.selectbox(
+                        "Status",
+                        ["All", "Open", "Resolved"],
+                        key="status_filter"
+                    )
+                with col2:
+                    priority_filter = st.selectbox(
+                        "Priority",
+                        ["All"] + PRIORITY_LEVELS,
+                        key="priority_filter"
+                    )
+                with col3:
+                    category_filter = st.selectbox(
+                        "Category",
+                        ["All"] + TICKET_CATEGORIES,
+                        key="category_filter"
+                    )
+                
+                # Filters are lookups in the store's Status/Priority/Category indexes
+                filtered_tickets = ticket_store.query(
+                    employee_code=str(employee_code),
+                    status=None if status_filter == "All" else status_filter,
+                    priority=None if priority_filter == "All" else priority_filter,
+                    category=None if category_filter == "All" else category_filter
+                )
+                
+                offset = ticket_page_number(len(filtered_tickets), "my_tickets_page")
+                for ticket in filtered_tickets[offset:offset + TICKETS_PER_PAGE]:
+                    with st.expander(f"{ticket.subject} - {ticket.status} ({ticket.priority})"):
+                        status_color = "red" if ticket.status == "Open" else "green"
+                        st.markdown(f"""
+                        <div style="display: flex; justify-content: space-between; align-items: center;">
+                            <div>
+                                <strong>Ticket ID:</strong> {ticket.ticket_id}<br>
+                                <strong>Date Raised:</strong> {ticket.date_raised} at {ticket.time_raised}
                             </div>
-                            """, unsafe_allow_html=True)
-                            
-                            st.write("---")
-                            col1, col2 = st.columns(2)
-                            with col1:
-                                st.write(f"**Your Contact Email:** {row['Raised By (Email)']}")
-                                st.write(f"**Your Phone Number:** {row['Raised By (Phone)']}")
-                                st.write(f"**Category:** {row['Category']}")
-                            with col2:
-                                st.write(f"**Priority:** {row['Priority']}")
-                                if row['Date Resolved']:
-                                    st.write(f"**Date Resolved:** {row['Date Resolved']}")
-                            
+                            <div style="color: {status_color}; font-weight: bold;">
+                                {ticket.status}
+                            </div>
+                        </div>
+                        """, unsafe_allow_html=True)
+                        
+                        st.write("---")
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            st.write(f"**Your Contact Email:** {ticket.email}")
+                            st.write(f"**Your Phone Number:** {ticket.phone}")
+                            st.write(f"**Category:** {ticket.category}")
+                        with col2:
+                            st.write(f"**Priority:** {ticket.priority}")
+                            if ticket.date_resolved:
+                                st.write(f"**Date Resolved:** {ticket.date_resolved}")
+                        
+                        st.write("---")
+                        st.write("**Details:**")
+                        st.write(ticket.details)
+                        
+                        if ticket.status == "Resolved" and ticket.resolution_notes:
                             st.write("---")
-                            st.write("**Details:**")
-                            st.write(row['Details'])
-                            
-                            if row['Status'] == "Resolved" and row['Resolution Notes']:
-                                st.write("---")
-                                st.write("**Resolution Notes:**")
-                                st.write(row['Resolution Notes'])
-                    
-                    if not filtered_tickets.empty:
-                        csv = filtered_tickets.to_csv(index=False).encode('utf-8')
-                        st.download_button(
-                            "Download Tickets",
-                            csv,
-                            "my_support_tickets.csv",
-                            "text/csv",
-                            key='download-tickets-csv'
-                        )
-                else:
-                    st.info("You haven't raised any support tickets yet.")
+                            st.write("**Resolution Notes:**")
+                            st.write(ticket.resolution_notes)
+                
+                if filtered_tickets:
+                    csv = TICKETS.to_frame(filtered_tickets).to_csv(index=False).encode('utf-8')
+                    st.download_button(
+                        "Download Tickets",
+                        csv,
+                        "my_support_tickets.csv",
+                        "text/csv",
+                        key='download-tickets-csv'
+                    )
             else:
-                st.info("No support tickets found in the system.")
+                st.info("You haven't raised any support tickets yet.")
                 
         except Exception as e:
             st.error(f"Error retrieving support tickets: {str(e)}")
@@ -913,29 +1095,29 @@ def travel_hotel_page():
                         current_date = get_ist_time().strftime("%d-%m-%Y")
                         current_time = get_ist_time().strftime("%H:%M:%S")
                         
-                        request_data = {
-                            "Request ID": request_id,
-                            "Request Type": "Travel",
-                            "Employee Name": selected_employee,
-                            "Employee Code": employee_code,
-                            "Designation": designation,
-                            "Email": employee_email.strip(),
-                            "Phone": employee_phone.strip(),
-                            "Adhara Number": adhara_number.strip(),
-                            "Hotel Name": "",
-                            "Check In Date": "",
-                            "Check Out Date": "",
-                            "Travel Mode": travel_mode,
-                            "From Location": from_location,
-                            "To Location": to_location,
-                            "Booking Date": booking_date.strftime("%d-%m-%Y"),
-                            "Remarks": remarks,
-                            "Status": "Pending",
-                            "Date Requested": current_date,
-                            "Time Requested": current_time
-                        }
+                        request_data = TravelHotelRow(
+                            request_id=request_id,
+                            request_type="Travel",
+                            employee_name=selected_employee,
+                            employee_code=employee_code,
+                            designation=designation,
+                            email=employee_email.strip(),
+                            phone=employee_phone.strip(),
+                            adhara_number=adhara_number.strip(),
+                            hotel_name="",
+                            check_in_date="",
+                            check_out_date="",
+                            travel_mode=travel_mode,
+                            from_location=from_location,
+                            to_location=to_location,
+                            booking_date=booking_date.strftime("%d-%m-%Y"),
+                            remarks=remarks,
+                            status="Pending",
+                            date_requested=current_date,
+                            time_requested=current_time
+                        )
                         
-                        request_df = pd.DataFrame([request_data])
+                        request_df = TRAVEL_HOTEL.to_frame([request_data])
                         success, error = log_travel_hotel_request(conn, request_df)
                         
                         if success:
@@ -1005,29 +1187,29 @@ def travel_hotel_page():
                         current_date = get_ist_time().strftime("%d-%m-%Y")
                         current_time = get_ist_time().strftime("%H:%M:%S")
                         
-                        request_data = {
-                            "Request ID": request_id,
-                            "Request Type": "Hotel",
-                            "Employee Name": selected_employee,
-                            "Employee Code": employee_code,
-                            "Designation": designation,
-                            "Email": employee_email.strip(),
-                            "Phone": employee_phone.strip(),
-                            "Adhara Number": adhara_number.strip(),
-                            "Hotel Name": hotel_name,
-                            "Check In Date": check_in_date.strftime("%d-%m-%Y"),
-                            "Check Out Date": check_out_date.strftime("%d-%m-%Y"),
-                            "Travel Mode": "",
-                            "From Location": "",
-                            "To Location": "",
-                            "Booking Date": "",
-                            "Remarks": remarks,
-                            "Status": "Pending",
-                            "Date Requested": current_date,
-                            "Time Requested": current_time
-                        }
+                        request_data = TravelHotelRow(
+                            request_id=request_id,
+                            request_type="Hotel",
+                            employee_name=selected_employee,
+                            employee_code=employee_code,
+                            designation=designation,
+                            email=employee_email.strip(),
+                            phone=employee_phone.strip(),
+                            adhara_number=adhara_number.strip(),
+                            hotel_name=hotel_name,
+                            check_in_date=check_in_date.strftime("%d-%m-%Y"),
+                            check_out_date=check_out_date.strftime("%d-%m-%Y"),
+                            travel_mode="",
+                            from_location="",
+                            to_location="",
+                            booking_date="",
+                            remarks=remarks,
+                            status="Pending",
+                            date_requested=current_date,
+                            time_requested=current_time
+                        )
                         
-                        request_df = pd.DataFrame([request_data])
+                        request_df = TRAVEL_HOTEL.to_frame([request_data])
                         success, error = log_travel_hotel_request(conn, request_df)
                         
                         if success:
@@ -1143,43 +1325,55 @@ def travel_hotel_page():
 
 def log_ticket_to_gsheet(conn, ticket_data):
     try:
-        existing_data = conn.read(worksheet="Tickets", usecols=list(range(len(TICKET_SHEET_COLUMNS))), ttl=5)
-        existing_data = existing_data.dropna(how="all")
-        updated_data = pd.concat([existing_data, ticket_data], ignore_index=True)
-        conn.update(worksheet="Tickets", data=updated_data)
+        # New rows are appended; the rest of the sheet is not read back or rewritten
+        append_sheet_rows(conn, "Tickets", ticket_data, TICKET_SHEET_COLUMNS)
         return True, None
     except Exception as e:
         return False, str(e)
 
 def log_travel_hotel_request(conn, request_data):
     try:
-        existing_data = conn.read(worksheet="TravelHotelRequests", usecols=list(range(len(TRAVEL_HOTEL_COLUMNS))), ttl=5)
-        existing_data = existing_data.dropna(how="all")
-        updated_data = pd.concat([existing_data, request_data], ignore_index=True)
-        conn.update(worksheet="TravelHotelRequests", data=updated_data)
+        # New rows are appended; the rest of the sheet is not read back or rewritten
+        append_sheet_rows(conn, "TravelHotelRequests", request_data, TRAVEL_HOTEL_COLUMNS)
         return True, None
     except Exception as e:
         return False, str(e)
 
 def log_sales_to_gsheet(conn, sales_data):
+    numbers = sales_data["Invoice Number"].unique()
+    invoice_index = get_invoice_index()
+    relogged = any(invoice_index.header(number) is not None for number in numbers)
     try:
-        # Read all existing data first
-        existing_sales_data = conn.read(worksheet="Sales", ttl=5)
-        existing_sales_data = existing_sales_data.dropna(how="all")
-        
-        # Ensure columns match (in case sheet structure changes)
-        sales_data = sales_data.reindex(columns=SALES_SHEET_COLUMNS)
-        
-        # Concatenate and drop any potential duplicates
-        updated_sales_data = pd.concat([existing_sales_data, sales_data], ignore_index=True)
-        updated_sales_data = updated_sales_data.drop_duplicates(subset=["Invoice Number", "Product Name"], keep="last")
-        
-        # Write back all data
-        conn.update(worksheet="Sales", data=updated_sales_data)
+        if not relogged:
+            # A new invoice: append its lines without reading the sheet
+            append_sheet_rows(conn, "Sales", sales_data, SALES_SHEET_COLUMNS)
+        else:
+            # Re-logged: merge so the new lines replace the old ones
+            existing_sales_data = conn.read(worksheet="Sales", ttl=5)
+            existing_sales_data = existing_sales_data.dropna(how="all")
+            updated_sales_data = pd.concat([existing_sales_data, sales_data], ignore_index=True)
+            updated_sales_data = updated_sales_data.drop_duplicates(subset=["Invoice Number", "Product Name"], keep="last")
+            conn.update(worksheet="Sales", data=updated_sales_data)
         st.success("Sales data successfully logged to Google Sheets!")
     except Exception as e:
         st.error(f"Error logging sales data: {e}")
         st.stop()
+    load_sales_data.clear()
+    
+    # Keep the dashboard aggregates current without re-reading the sheet
+    try:
+        get_sales_cube().add_rows(sales_data)
+        get_demo_conversion_engine().add_sales(sales_data)
+    except Exception as e:
+        st.warning(f"Sales summary not updated: {e}")
+    
+    # Re-logged lines were dropped from earlier rows, so later offsets moved;
+    # appended invoices are indexed from the next Sales read (sync_sales_sheet)
+    if relogged:
+        try:
+            invoice_index.sync(updated_sales_data)
+        except Exception as e:
+            st.warning(f"Invoice list not updated: {e}")
 
 def update_delivery_status(conn, invoice_number, product_name, new_status):
     try:
@@ -1193,6 +1387,7 @@ def update_delivery_status(conn, invoice_number, product_name, new_status):
         
         # Write back the updated data
         conn.update(worksheet="Sales", data=sales_data)
+        load_sales_data.clear()
         return True
     except Exception as e:
         st.error(f"Error updating delivery status: {e}")
@@ -1200,15 +1395,8 @@ def update_delivery_status(conn, invoice_number, product_name, new_status):
 
 def log_visit_to_gsheet(conn, visit_data):
     try:
-        existing_visit_data = conn.read(worksheet="Visits", ttl=5)
-        existing_visit_data = existing_visit_data.dropna(how="all")
-        
-        visit_data = visit_data.reindex(columns=VISIT_SHEET_COLUMNS)
-        
-        updated_visit_data = pd.concat([existing_visit_data, visit_data], ignore_index=True)
-        updated_visit_data = updated_visit_data.drop_duplicates(subset=["Visit ID"], keep="last")
-        
-        conn.update(worksheet="Visits", data=updated_visit_data)
+        # Visit IDs are new on every visit, so the row is appended rather than merged
+        append_sheet_rows(conn, "Visits", visit_data, VISIT_SHEET_COLUMNS)
         st.success("Visit data successfully logged to Google Sheets!")
     except Exception as e:
         st.error(f"Error logging visit data: {e}")
@@ -1216,147 +1404,21 @@ def log_visit_to_gsheet(conn, visit_data):
 
 def log_attendance_to_gsheet(conn, attendance_data):
     try:
-        existing_data = conn.read(worksheet="Attendance", ttl=5)
-        existing_data = existing_data.dropna(how="all")
-        
-        attendance_data = attendance_data.reindex(columns=ATTENDANCE_SHEET_COLUMNS)
-        
-        updated_data = pd.concat([existing_data, attendance_data], ignore_index=True)
-        updated_data = updated_data.drop_duplicates(subset=["Attendance ID"], keep="last")
-        
-        conn.update(worksheet="Attendance", data=updated_data)
+        # New rows are appended; the rest of the sheet is not read back or rewritten
+        append_sheet_rows(conn, "Attendance", attendance_data, ATTENDANCE_SHEET_COLUMNS)
         return True, None
     except Exception as e:
         return False, str(e)
 
-
-def generate_invoice(customer_name, gst_number, contact_number, address, state, city, selected_products, quantities, product_discounts,
-                    discount_category, employee_name, payment_status, amount_paid, employee_selfie_path, payment_receipt_path, invoice_number,
-                    transaction_type, distributor_firm_name="", distributor_id="", distributor_contact_person="",
-                    distributor_contact_number="", distributor_email="", distributor_territory="", remarks="", invoice_date=None):
-    pdf = PDF()
-    pdf.alias_nb_pages()
-    pdf.add_page()
+def build_invoice_rows(customer_name, contact_number, address, state, city, selected_products, quantities, product_discounts,
+                       discount_category, employee_name, payment_status, amount_paid, employee_selfie_path, payment_receipt_path, invoice_number,
+                       transaction_type, distributor_firm_name="", distributor_id="", distributor_contact_person="",
+                       distributor_contact_number="", distributor_email="", distributor_territory="", remarks="", invoice_date=None):
+    """Price the selected products and build one Sales sheet row per line item"""
     current_date = invoice_date if invoice_date else get_ist_time().strftime("%d-%m-%Y")  # Use provided date or current date
-
-
-    # Transaction Type
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(0, 10, f"Transaction Type: {transaction_type.upper()}", ln=True)
-    
-    # Sales Person
-    pdf.ln(0)
-    pdf.set_font("Arial", 'B', 10)
-    pdf.cell(0, 10, f"Sales Person: {employee_name}", ln=True, align='L')
-    
-    # Distributor details if available
-    if distributor_firm_name:
-        pdf.cell(0, 10, f"Distributor: {distributor_firm_name} ({distributor_id})", ln=True, align='L')
-        pdf.cell(0, 10, f"Contact: {distributor_contact_person} | {distributor_contact_number}", ln=True, align='L')
-        pdf.cell(0, 10, f"Territory: {distributor_territory}", ln=True, align='L')
-    
-    pdf.ln(5)
-
-    # Customer details
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(0, 10, "Bill To:", ln=True)
-    pdf.set_font("Arial", '', 10)
-    pdf.cell(100, 6, f"Name: {customer_name}")
-    pdf.cell(90, 6, f"Date: {current_date}", ln=True, align='R')
-    pdf.cell(100, 6, f"GSTIN/UN: {gst_number}")
-    pdf.cell(90, 6, f"Contact: {contact_number}", ln=True, align='R')
-    pdf.cell(100, 6, "Address: ", ln=True)
-    pdf.multi_cell(0, 6, address)
-    pdf.ln(1)
-    
-    # Invoice number
-    pdf.set_font("Arial", 'B', 10)
-    pdf.cell(0, 10, f"Invoice Number: {invoice_number}", ln=True)
-    pdf.ln(5)
-    
-    # Table header
-    pdf.set_fill_color(200, 220, 255)
-    pdf.set_font("Arial", 'B', 10)
-    pdf.cell(10, 10, "S.No", border=1, align='C', fill=True)
-    pdf.cell(70, 10, "Product Name", border=1, align='C', fill=True)
-    pdf.cell(20, 10, "HSN/SAC", border=1, align='C', fill=True)
-    pdf.cell(20, 10, "Qty", border=1, align='C', fill=True)
-    pdf.cell(25, 10, "Rate (INR)", border=1, align='C', fill=True)
-    pdf.cell(25, 10, "Discount (%)", border=1, align='C', fill=True)
-    pdf.cell(25, 10, "Amount (INR)", border=1, align='C', fill=True)
-    pdf.ln()
-
-    # Table rows
-    pdf.set_font('Arial', '', 10)
     sales_data = []
     tax_rate = 0.18  # 18% GST
-    
-    # Calculate subtotal with product discounts
-    subtotal = 0
-    for idx, (product, quantity, prod_discount) in enumerate(zip(selected_products, quantities, product_discounts)):
-        product_data = Products[Products['Product Name'] == product].iloc[0]
-        
-        if discount_category in product_data:
-            unit_price = float(product_data[discount_category])
-        else:
-            unit_price = float(product_data['Price'])
-        
-        # Apply product discount
-        discounted_unit_price = unit_price * (1 - prod_discount/100)
-        item_total = discounted_unit_price * quantity
-        subtotal += item_total
-        
-        pdf.cell(10, 8, str(idx + 1), border=1)
-        pdf.cell(70, 8, product, border=1)
-        pdf.cell(20, 8, "3304", border=1, align='C')
-        pdf.cell(20, 8, str(quantity), border=1, align='C')
-        pdf.cell(25, 8, f"{unit_price:.2f}", border=1, align='R')
-        pdf.cell(25, 8, f"{prod_discount:.2f}%", border=1, align='R')
-        pdf.cell(25, 8, f"{item_total:.2f}", border=1, align='R')
-        pdf.ln()
-
-    # Calculate taxes
-    tax_amount = subtotal * tax_rate
-    cgst_amount = tax_amount / 2
-    sgst_amount = tax_amount / 2
-    grand_total = subtotal + tax_amount
-
-    # Display totals
-    pdf.ln(10)
-    pdf.set_font('Arial', 'B', 10)
-    pdf.cell(160, 10, "Subtotal", border=0, align='R')
-    pdf.cell(30, 10, f"{subtotal:.2f}", border=1, align='R')
-    pdf.ln()
-    
-    pdf.cell(160, 10, "Taxable Amount", border=0, align='R')
-    pdf.cell(30, 10, f"{subtotal:.2f}", border=1, align='R')
-    pdf.ln()
-    
-    pdf.cell(160, 10, "CGST (9%)", border=0, align='R')
-    pdf.cell(30, 10, f"{cgst_amount:.2f}", border=1, align='R')
-    pdf.ln()
-    
-    pdf.cell(160, 10, "SGST (9%)", border=0, align='R')
-    pdf.cell(30, 10, f"{sgst_amount:.2f}", border=1, align='R')
-    pdf.ln()
-    
-    pdf.cell(160, 10, "Grand Total", border=0, align='R')
-    pdf.cell(30, 10, f"{grand_total:.2f} INR", border=1, align='R', fill=True)
-    pdf.ln(10)
-    
-    # Payment Status
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(0, 10, f"Payment Status: {payment_status.upper()}", ln=True)
-    if payment_status == "paid":
-        pdf.cell(0, 10, f"Amount Paid: {amount_paid} INR", ln=True)
-    pdf.ln(10)
-    
-    # Details
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(0, 10, "Details:", ln=True)
-    pdf.set_font("Arial", '', 10)
-    pdf.multi_cell(0, 5, bank_details)
-    
+
     # Prepare sales data for logging
     for idx, (product, quantity, prod_discount) in enumerate(zip(selected_products, quantities, product_discounts)):
         product_data = Products[Products['Product Name'] == product].iloc[0]
@@ -1370,55 +1432,75 @@ def generate_invoice(customer_name, gst_number, contact_number, address, state,
         discounted_unit_price = unit_price * (1 - prod_discount/100)
         item_total = discounted_unit_price * quantity
         
-        sales_data.append({
-            "Invoice Number": invoice_number,
-            "Invoice Date": current_date,
-            "Employee Name": employee_name,
-            "Employee Code": Person[Person['Employee Name'] == employee_name]['Employee Code'].values[0],
-            "Designation": Person[Person['Employee Name'] == employee_name]['Designation'].values[0],
-            "Discount Category": discount_category,
-            "Transaction Type": transaction_type,
-            "Outlet Name": customer_name,
-            "Outlet Contact": contact_number,
-            "Outlet Address": address,
-            "Outlet State": state,
-            "Outlet City": city,
-            "Distributor Firm Name": distributor_firm_name,
-            "Distributor ID": distributor_id,
-            "Distributor Contact Person": distributor_contact_person,
-            "Distributor Contact Number": distributor_contact_number,
-            "Distributor Email": distributor_email,
-            "Distributor Territory": distributor_territory,
-            "Product ID": product_data['Product ID'],
-            "Product Name": product,
-            "Product Category": product_data['Product Category'],
-            "Quantity": quantity,
-            "Unit Price": unit_price,
-            "Product Discount (%)": prod_discount,
-            "Discounted Unit Price": discounted_unit_price,
-            "Total Price": item_total,
-            "GST Rate": "18%",
-            "CGST Amount": (item_total * tax_rate) / 2,
-            "SGST Amount": (item_total * tax_rate) / 2,
-            "Grand Total": item_total + (item_total * tax_rate),
-            "Payment Status": payment_status,
-            "Amount Paid": amount_paid if payment_status == "paid" else 0,
-            "Payment Receipt Path": payment_receipt_path if payment_status == "paid" else "",
-            "Employee Selfie Path": employee_selfie_path,
-            "Invoice PDF Path": f"invoices/{invoice_number}.pdf",
-            "Remarks": remarks,
-            "Delivery Status": "pending"  # Default status is pending
-        })
-
-    # Save the PDF
-    pdf_path = f"invoices/{invoice_number}.pdf"
-    pdf.output(pdf_path)
+        sales_data.append(SalesRow(
+            invoice_number=invoice_number,
+            invoice_date=current_date,
+            employee_name=employee_name,
+            employee_code=Person[Person['Employee Name'] == employee_name]['Employee Code'].values[0],
+            designation=Person[Person['Employee Name'] == employee_name]['Designation'].values[0],
+            discount_category=discount_category,
+            transaction_type=transaction_type,
+            outlet_name=customer_name,
+            outlet_contact=contact_number,
+            outlet_address=address,
+            outlet_state=state,
+            outlet_city=city,
+            distributor_firm_name=distributor_firm_name,
+            distributor_id=distributor_id,
+            distributor_contact_person=distributor_contact_person,
+            distributor_contact_number=distributor_contact_number,
+            distributor_email=distributor_email,
+            distributor_territory=distributor_territory,
+            product_id=product_data['Product ID'],
+            product_name=product,
+            product_category=product_data['Product Category'],
+            quantity=quantity,
+            unit_price=unit_price,
+            product_discount=prod_discount,
+            discounted_unit_price=discounted_unit_price,
+            total_price=item_total,
+            gst_rate="18%",
+            cgst_amount=(item_total * tax_rate) / 2,
+            sgst_amount=(item_total * tax_rate) / 2,
+            grand_total=item_total + (item_total * tax_rate),
+            payment_status=payment_status,
+            amount_paid=amount_paid if payment_status == "paid" else 0,
+            payment_receipt_path=payment_receipt_path if payment_status == "paid" else "",
+            employee_selfie_path=employee_selfie_path,
+            invoice_pdf_path=f"invoices/{invoice_number}.pdf",
+            remarks=remarks,
+            delivery_status="pending"  # Default status is pending
+        ))
+
+    return sales_data
+
+def save_invoice(sales_data, pdf_bytes, pdf_path=None):
+    """Persist a newly generated invoice: log its rows to the Sales sheet and,
+    if a path is given, queue a copy of the PDF for writing in the background"""
+    if pdf_path:
+        save_pdf_async(pdf_bytes, pdf_path)
     
     # Log sales data to Google Sheets
-    sales_df = pd.DataFrame(sales_data)
+    sales_df = SALES.to_frame(sales_data)
     log_sales_to_gsheet(conn, sales_df)
 
-    return pdf, pdf_path
+def generate_invoice(customer_name, gst_number, contact_number, address, state, city, selected_products, quantities, product_discounts,
+                    discount_category, employee_name, payment_status, amount_paid, employee_selfie_path, payment_receipt_path, invoice_number,
+                    transaction_type, distributor_firm_name="", distributor_id="", distributor_contact_person="",
+                    distributor_contact_number="", distributor_email="", distributor_territory="", remarks="", invoice_date=None,
+                    keep_pdf_copy=True):
+    sales_data = build_invoice_rows(
+        customer_name, contact_number, address, state, city, selected_products, quantities, product_discounts,
+        discount_category, employee_name, payment_status, amount_paid, employee_selfie_path, payment_receipt_path, invoice_number,
+        transaction_type, distributor_firm_name, distributor_id, distributor_contact_person,
+        distributor_contact_number, distributor_email, distributor_territory, remarks, invoice_date
+    )
+    line_items = SALES.to_dicts(sales_data)
+    pdf_bytes = render_invoice_pooled(line_items, {**line_items[0], "GST Number": gst_number})
+    pdf_path = f"invoices/{invoice_number}.pdf" if keep_pdf_copy else None
+    save_invoice(sales_data, pdf_bytes, pdf_path)
+
+    return pdf_bytes, pdf_path
 
 def record_visit(employee_name, outlet_name, outlet_contact, outlet_address, outlet_state, outlet_city, 
                  visit_purpose, visit_notes, visit_selfie_path, entry_time, exit_time, remarks=""):
@@ -1427,28 +1509,28 @@ def record_visit(employee_name, outlet_name, outlet_contact, outlet_address, out
     
     duration = (exit_time - entry_time).total_seconds() / 60
     
-    visit_data = {
-        "Visit ID": visit_id,
-        "Employee Name": employee_name,
-        "Employee Code": Person[Person['Employee Name'] == employee_name]['Employee Code'].values[0],
-        "Designation": Person[Person['Employee Name'] == employee_name]['Designation'].values[0],
-        "Outlet Name": outlet_name,
-        "Outlet Contact": outlet_contact,
-        "Outlet Address": outlet_address,
-        "Outlet State": outlet_state,
-        "Outlet City": outlet_city,
-        "Visit Date": visit_date,
-        "Entry Time": entry_time.strftime("%H:%M:%S"),
-        "Exit Time": exit_time.strftime("%H:%M:%S"),
-        "Visit Duration (minutes)": round(duration, 2),
-        "Visit Purpose": visit_purpose,
-        "Visit Notes": visit_notes,
-        "Visit Selfie Path": visit_selfie_path,
-        "Visit Status": "completed",
-        "Remarks": remarks
-    }
+    visit_data = VisitRow(
+        visit_id=visit_id,
+        employee_name=employee_name,
+        employee_code=Person[Person['Employee Name'] == employee_name]['Employee Code'].values[0],
+        designation=Person[Person['Employee Name'] == employee_name]['Designation'].values[0],
+        outlet_name=outlet_name,
+        outlet_contact=outlet_contact,
+        outlet_address=outlet_address,
+        outlet_state=outlet_state,
+        outlet_city=outlet_city,
+        visit_date=visit_date,
+        entry_time=entry_time.strftime("%H:%M:%S"),
+        exit_time=exit_time.strftime("%H:%M:%S"),
+        duration_minutes=round(duration, 2),
+        visit_purpose=visit_purpose,
+        visit_notes=visit_notes,
+        visit_selfie_path=visit_selfie_path,
+        visit_status="completed",
+        remarks=remarks
+    )
     
-    visit_df = pd.DataFrame([visit_data])
+    visit_df = VISITS.to_frame([visit_data])
     log_visit_to_gsheet(conn, visit_df)
     
     return visit_id
@@ -1463,24 +1545,25 @@ def record_attendance(employee_name, status, location_link="", leave_reason=""):
         
         attendance_id = generate_attendance_id()
         
-        attendance_data = {
-            "Attendance ID": attendance_id,
-            "Employee Name": employee_name,
-            "Employee Code": employee_code,
-            "Designation": designation,
-            "Date": current_date,
-            "Status": status,
-            "Location Link": location_link,
-            "Leave Reason": leave_reason,  # This now includes station type
-            "Check-in Time": check_in_time,
-            "Check-in Date Time": current_datetime
-        }
+        attendance_data = AttendanceRow(
+            attendance_id=attendance_id,
+            employee_name=employee_name,
+            employee_code=employee_code,
+            designation=designation,
+            date=current_date,
+            status=status,
+            location_link=location_link,
+            leave_reason=leave_reason,  # This now includes station type
+            check_in_time=check_in_time,
+            check_in_date_time=current_datetime
+        )
         
-        attendance_df = pd.DataFrame([attendance_data])
+        attendance_df = ATTENDANCE.to_frame([attendance_data])
         
         success, error = log_attendance_to_gsheet(conn, attendance_df)
         
         if success:
+            get_attendance_rollup().add(attendance_df, employee_zones())
             return attendance_id, None
         else:
             return None, error
@@ -1490,6 +1573,12 @@ def record_attendance(employee_name, status, location_link="", leave_reason=""):
 
 def check_existing_attendance(employee_name):
     try:
+        employee_code = Person[Person['Employee Name'] == employee_name]['Employee Code'].values[0]
+        rollup = get_attendance_rollup()
+        if rollup.has_record(employee_code, get_ist_time().date()):
+            return True
+        
+        # Not in the local rollup (e.g. marked from another instance): check the sheet
         existing_data = conn.read(worksheet="Attendance", usecols=list(range(len(ATTENDANCE_SHEET_COLUMNS))), ttl=5)
         existing_data = existing_data.dropna(how="all")
         
@@ -1497,12 +1586,12 @@ def check_existing_attendance(employee_name):
             return False
         
         current_date = get_ist_time().strftime("%d-%m-%Y")
-        employee_code = Person[Person['Employee Name'] == employee_name]['Employee Code'].values[0]
         
         existing_records = existing_data[
             (existing_data['Employee Code'] == employee_code) & 
             (existing_data['Date'] == current_date)
         ]
+        rollup.add(existing_records, employee_zones())
         
         return not existing_records.empty
         
@@ -1562,6 +1651,345 @@ def resources_page():
             
             st.markdown("---")  # Divider between resources
 
+def is_admin(employee_name):
+    """Admins are the Employee Codes listed under `admin_employee_codes` in the app secrets"""
+    try:
+        admin_codes = {str(code) for code in st.secrets.get("admin_employee_codes", [])}
+    except Exception:
+        return False
+    employee_row = Person[Person['Employee Name'] == employee_name]
+    return not employee_row.empty and str(employee_row['Employee Code'].values[0]) in admin_codes
+
+def route_analytics_page():
+    st.title("Route Analytics")
+    selected_date = st.date_input("Date", value=get_ist_time().date(), key="route_date")
+
+    try:
+        history = conn.read(worksheet="LocationHistory", ttl=300)
+    except Exception as e:
+        st.error(f"Error loading location history: {e}")
+        return
+
+    fixes = load_fixes(history, selected_date)
+    if not len(fixes["ts"]):
+        st.info("No location fixes recorded for this date")
+        return
+
+    summary, stops, clusters = route_analytics(fixes)
+    names = Person.drop_duplicates('Employee Code').set_index('Employee Code')['Employee Name']
+    for frame in (summary, stops, clusters):
+        frame.insert(0, "Employee Name", frame["Employee Code"].map(names))
+    summary = summary.sort_values("Distance (km)", ascending=False, ignore_index=True)
+
+    st.subheader("Distance and Dwell by Employee")
+    st.dataframe(summary, use_container_width=True, hide_index=True)
+
+    employee_options = ["All"] + summary["Employee Name"].fillna(summary["Employee Code"]).tolist()
+    selected_employee = st.selectbox("Employee", employee_options, key="route_employee")
+    if selected_employee != "All":
+        code = summary.loc[summary["Employee Name"].fillna(summary["Employee Code"]) == selected_employee, "Employee Code"].iloc[0]
+        stops = stops[stops["Employee Code"] == code]
+        clusters = clusters[clusters["Employee Code"] == code]
+        route = fixes["employee"] == list(fixes["employee_codes"]).index(code)
+        st.map(pd.DataFrame({"lat": fixes["lat"][route], "lon": fixes["lng"][route]}))
+
+    st.subheader("Stops")
+    st.dataframe(stops, use_container_width=True, hide_index=True)
+    st.subheader("Dwell Clusters")
+    st.dataframe(clusters, use_container_width=True, hide_index=True)
+
+    date_str = selected_date.strftime("%d-%m-%Y")
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.download_button("Download Summary", summary.to_csv(index=False), f"route_summary_{date_str}.csv", "text/csv", key="download-route-summary")
+    with col2:
+        st.download_button("Download Stops", stops.to_csv(index=False), f"route_stops_{date_str}.csv", "text/csv", key="download-route-stops")
+    with col3:
+        st.download_button("Download Clusters", clusters.to_csv(index=False), f"route_clusters_{date_str}.csv", "text/csv", key="download-route-clusters")
+
+@st.cache_resource
+def get_outlet_spatial_index(version):
+    """Grid index over Outlet Coordinates.csv, rebuilt whenever the file changes"""
+    return OutletSpatialIndex(load_outlet_coordinates(OUTLET_COORDINATES_FILE))
+
+def outlet_coordinates_version():
+    return os.path.getmtime(OUTLET_COORDINATES_FILE) if os.path.exists(OUTLET_COORDINATES_FILE) else None
+
+def visit_verification_page():
+    st.title("Visit Verification")
+    index = get_outlet_spatial_index(outlet_coordinates_version())
+    if not len(index):
+        st.warning("No outlet coordinates yet. Run geocode_outlets.py to build Outlet Coordinates.csv.")
+        return
+
+    col1, col2 = st.columns(2)
+    with col1:
+        start_date = st.date_input("From", value=get_ist_time().date() - timedelta(days=7), key="verify_start")
+    with col2:
+        end_date = st.date_input("To", value=get_ist_time().date(), key="verify_end")
+
+    try:
+        visits = conn.read(worksheet="Visits", ttl=300).dropna(how="all")
+        demos = conn.read(worksheet="Demos", usecols=list(range(len(DEMO_SHEET_COLUMNS))), ttl=300).dropna(how="all")
+        attendance = conn.read(worksheet="Attendance", usecols=list(range(len(ATTENDANCE_SHEET_COLUMNS))), ttl=300).dropna(how="all")
+        history = conn.read(worksheet="LocationHistory", ttl=300)
+    except Exception as e:
+        st.error(f"Error loading records: {e}")
+        return
+
+    # Visits and demos store no coordinates: take the employee's nearest-in-time location fix
+    events = pd.concat([
+        pd.DataFrame({
+            "Source": "Visit",
+            "Record ID": visits["Visit ID"],
+            "Employee Name": visits["Employee Name"],
+            "Employee Code": visits["Employee Code"],
+            "Outlet Name": visits["Outlet Name"],
+            "Outlet City": visits["Outlet City"],
+            "ts": to_seconds(visits["Visit Date"].astype(str) + " " + visits["Entry Time"].astype(str), "%d-%m-%Y %H:%M:%S")
+        }),
+        pd.DataFrame({
+            "Source": "Demo",
+            "Record ID": demos["Demo ID"],
+            "Employee Name": demos["Employee Name"],
+            "Employee Code": demos["Employee Code"],
+            "Outlet Name": demos["Outlet Name"],
+            "Outlet City": demos["Outlet City"],
+            "ts": to_seconds(demos["Check-in Date Time"], "%d-%m-%Y %H:%M:%S")
+        })
+    ], ignore_index=True)
+    events = attach_nearest_fixes(events, load_fixes(history))
+
+    attendance = attendance[attendance["Status"] != "Leave"]
+    attendance_lat, attendance_lng = parse_maps_links(attendance["Location Link"])
+    attendance_records = pd.DataFrame({
+        "Source": "Attendance",
+        "Record ID": attendance["Attendance ID"].to_numpy(),
+        "Employee Name": attendance["Employee Name"].to_numpy(),
+        "Employee Code": attendance["Employee Code"].to_numpy(),
+        "ts": to_seconds(attendance["Check-in Date Time"], "%d-%m-%Y %H:%M:%S"),
+        "Latitude": attendance_lat,
+        "Longitude": attendance_lng
+    })
+
+    records = pd.concat([events, attendance_records], ignore_index=True)
+    day_start = (pd.Timestamp(start_date) - pd.Timestamp(0)) / pd.Timedelta(seconds=1)
+    day_end = (pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timestamp(0)) / pd.Timedelta(seconds=1)
+    records = records[(records["ts"] >= day_start) & (records["ts"] < day_end)]
+    if records.empty:
+        st.info("No visits, demos or attendance in this period")
+        return
+
+    # One batched nearest-outlet query for every record
+    verified = verify_locations(records, index)
+    verified.insert(3, "Date Time", pd.to_datetime(verified["ts"], unit="s").dt.strftime("%d-%m-%Y %H:%M"))
+    verified = verified.drop(columns=["ts"])
+
+    flag_counts = verified["Flag"].value_counts()
+    metric_cols = st.columns(4)
+    for col, flag in zip(metric_cols, ["OK", "Away from claimed outlet", "No outlet nearby", "No location"]):
+        col.metric(flag, int(flag_counts.get(flag, 0)))
+
+    if st.checkbox("Show flagged records only", value=True, key="verify_flagged_only"):
+        verified = verified[verified["Flag"] != "OK"]
+    st.dataframe(verified, use_container_width=True, hide_index=True)
+    st.download_button(
+        "Download Verification Report",
+        verified.to_csv(index=False),
+        f"visit_verification_{start_date.strftime('%d-%m-%Y')}_{end_date.strftime('%d-%m-%Y')}.csv",
+        "text/csv",
+        key="download-visit-verification"
+    )
+
+def attendance_report_page():
+    st.title("Attendance Report")
+    rollup = get_attendance_rollup()
+
+    today = get_ist_time().date()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        year = st.selectbox("Year", list(range(today.year, today.year - 5, -1)), key="attendance_report_year")
+    with col2:
+        month = st.selectbox("Month", list(range(1, 13)), index=today.month - 1,
+                             format_func=lambda m: datetime(2000, m, 1).strftime("%B"), key="attendance_report_month")
+    with col3:
+        zones = sorted(Person['Zone'].dropna().unique().tolist()) + ["UNASSIGNED"]
+        zone = st.selectbox("Zone", ["All"] + zones, key="attendance_report_zone")
+    zone = None if zone == "All" else zone
+
+    if st.button("Sync from Attendance sheet", key="attendance_report_sync"):
+        with st.spinner("Reading Attendance sheet..."):
+            try:
+                attendance = conn.read(worksheet="Attendance", usecols=list(range(len(ATTENDANCE_SHEET_COLUMNS))), ttl=5)
+                added = rollup.add(attendance.dropna(how="all"), employee_zones())
+                st.success(f"Added {added} new attendance record(s) to the rollup")
+            except Exception as e:
+                st.error(f"Error syncing attendance: {e}")
+
+    start_date = datetime(year, month, 1).date()
+    end_date = (datetime(year + (month == 12), month % 12 + 1, 1) - timedelta(days=1)).date()
+    summary = rollup.summary(start_date, end_date, zone)
+    if summary.empty:
+        st.info("No attendance in the rollup for this month. Use 'Sync from Attendance sheet' to load existing records.")
+        return
+
+    names = Person.drop_duplicates('Employee Code').set_index('Employee Code')['Employee Name']
+    summary.insert(2, "Employee Name", summary["Employee Code"].map(names))
+
+    metric_cols = st.columns(3)
+    metric_cols[0].metric("Present", int(summary["Present"].sum()))
+    metric_cols[1].metric("Half Day", int(summary["Half Day"].sum()))
+    metric_cols[2].metric("Leave", int(summary["Leave"].sum()))
+
+    st.dataframe(summary, use_container_width=True, hide_index=True)
+
+    st.subheader("First Check-in by Hour")
+    distribution = rollup.check_in_distribution(start_date, end_date, zone)
+    if not distribution.empty:
+        st.bar_chart(distribution.set_index("hour")["employees"])
+
+    st.download_button(
+        "Download Attendance Report",
+        summary.to_csv(index=False),
+        f"attendance_{start_date.strftime('%m-%Y')}.csv",
+        "text/csv",
+        key="download-attendance-report"
+    )
+
+def ticket_triage_page():
+    st.title("Ticket Triage")
+    try:
+        store = load_ticket_store()
+    except Exception as e:
+        st.error(f"Error loading support tickets: {e}")
+        return
+
+    status_counts = store.counts("status")
+    metric_cols = st.columns(3)
+    metric_cols[0].metric("Total Tickets", len(store))
+    metric_cols[1].metric("Open", status_counts.get(OPEN_STATUS, 0))
+    metric_cols[2].metric("Resolved", status_counts.get("Resolved", 0))
+
+    col1, col2 = st.columns(2)
+    with col1:
+        priority = st.selectbox("Priority", ["All"] + PRIORITY_LEVELS[::-1], key="triage_priority")
+    with col2:
+        category = st.selectbox("Category", ["All"] + TICKET_CATEGORIES, key="triage_category")
+    priority = None if priority == "All" else priority
+    category = None if category == "All" else category
+
+    open_count = store.open_count(priority, category)
+    if not open_count:
+        st.info("No open tickets.")
+        return
+
+    # Open tickets come off the priority queue: most urgent, then oldest, first
+    offset = ticket_page_number(open_count, "triage_page")
+    st.caption(f"{open_count} open ticket(s)")
+    for ticket in store.open_queue(offset, TICKETS_PER_PAGE, priority, category):
+        with st.expander(f"[{ticket.priority}] {ticket.subject} - {ticket.employee_name} ({ticket.date_raised})"):
+            col1, col2 = st.columns(2)
+            with col1:
+                st.write(f"**Ticket ID:** {ticket.ticket_id}")
+                st.write(f"**Raised By:** {ticket.employee_name} ({ticket.employee_code})")
+                st.write(f"**Category:** {ticket.category}")
+            with col2:
+                st.write(f"**Raised:** {ticket.date_raised} at {ticket.time_raised}")
+                st.write(f"**Email:** {ticket.email}")
+                st.write(f"**Phone:** {ticket.phone}")
+            st.write("**Details:**")
+            st.write(ticket.details)
+
+            with st.form(f"triage_{ticket.ticket_id}"):
+                status = st.selectbox("Status", ["Open", "Resolved"], key=f"triage_status_{ticket.ticket_id}")
+                notes = st.text_area("Resolution Notes", value=ticket.resolution_notes, key=f"triage_notes_{ticket.ticket_id}")
+                if st.form_submit_button("Update Ticket"):
+                    changes = {"status": status, "resolution_notes": notes}
+                    if status == "Resolved":
+                        changes["date_resolved"] = get_ist_time().strftime("%d-%m-%Y")
+                    # Only the changed cells of this ticket's row are written back, once
+                    # the sheet confirms which row holds the ticket
+                    try:
+                        cells = store.changes(ticket.ticket_id, **changes)
+                        if cells:
+                            position = update_sheet_row(
+                                conn, "Tickets", TICKET_SHEET_COLUMNS, "Ticket ID", ticket.ticket_id, cells,
+                                position=store.position(ticket.ticket_id)
+                            )
+                            store.set_position(ticket.ticket_id, position)
+                        store.update(ticket.ticket_id, **changes)
+                        st.success(f"Ticket {ticket.ticket_id} updated")
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"Failed to update ticket: {e}")
+
+@st.cache_data(max_entries=32)
+def dashboard_figures(sales_version, attendance_version, conversion_version, start_date, end_date):
+    """Analytics figures as plotly JSON, built once per data version and shared by every session"""
+    conversions = get_demo_conversion_engine().employee_rates(start_date, end_date)
+    names = Person.drop_duplicates('Employee Code').set_index('Employee Code')['Employee Name']
+    return build_dashboard(
+        get_sales_cube(), get_attendance_rollup(), conversions, Products, employee_zones(), names, start_date, end_date
+    )
+
+def analytics_page():
+    st.title("Management Analytics")
+    today = get_ist_time().date()
+    periods = {
+        "Last 30 Days": today - timedelta(days=29),
+        "Last 90 Days": today - timedelta(days=89),
+        "This Year": today.replace(month=1, day=1)
+    }
+    period = st.radio("Period", list(periods), horizontal=True, key="analytics_period")
+    start_date = periods[period]
+
+    conversion_engine = get_demo_conversion_engine()
+    with st.spinner("Loading analytics..."):
+        sync_sales_sheet()
+        figures = dashboard_figures(
+            get_sales_cube().version, get_attendance_rollup().version(), conversion_engine.version, start_date, today
+        )
+    if not figures:
+        st.info("No sales, demo or attendance data for this period")
+        return
+
+    def show(name):
+        if name in figures:
+            st.plotly_chart(pio.from_json(figures[name]), use_container_width=True)
+
+    show("sales_trend")
+    col1, col2 = st.columns(2)
+    with col1:
+        show("zone_leaderboard")
+    with col2:
+        show("product_mix")
+    show("demo_conversion")
+    show("attendance_heatmap")
+
+    st.subheader("Products Demonstrated")
+    product_totals = get_demo_line_store().product_totals()
+    if product_totals.empty:
+        st.info("No demo products recorded yet")
+    else:
+        product_totals.insert(1, "Product Name", product_totals["Product ID"].map(product_names_by_id()))
+        st.dataframe(product_totals, use_container_width=True, hide_index=True)
+
+    st.subheader("Demo Conversion")
+    st.caption("A demo converts when its outlet buys within 30 days; a product converts when that product is bought.")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.write("**By Employee**")
+        employee_rates = conversion_engine.employee_rates(start_date, today)
+        employee_rates.insert(1, "Employee Name", employee_rates["Employee Code"].map(
+            Person.drop_duplicates('Employee Code').set_index('Employee Code')['Employee Name']
+        ))
+        st.dataframe(employee_rates, use_container_width=True, hide_index=True)
+    with col2:
+        st.write("**By Product**")
+        product_rates = conversion_engine.product_rates(start_date, today)
+        product_rates.insert(1, "Product Name", product_rates["Product ID"].map(product_names_by_id()))
+        st.dataframe(product_rates, use_container_width=True, hide_index=True)
+
 def add_back_button():
     st.markdown("""
     <style>
@@ -1575,6 +2003,7 @@ def add_back_button():
     """, unsafe_allow_html=True)
     
     if st.button("← logout", key="back_button"):
+        close_location_history(st.session_state.employee_name)
         st.session_state.authenticated = False
         st.session_state.selected_mode = None
         st.rerun()
@@ -1637,7 +2066,7 @@ def main():
                         lat = result.get("latitude")
                         lng = result.get("longitude")
                         if lat and lng:
-                            log_location_history(conn, employee_name, lat, lng)
+                            log_location_history(conn, employee_name, lat, lng, force=True)
                             gmaps_link = f"https://maps.google.com/?q={lat},{lng}"
                             st.success(f"Login location logged: [View on Google Maps]({gmaps_link})")
                             # Brief pause for user to see the message
@@ -1687,6 +2116,29 @@ def main():
                 st.session_state.selected_mode = "Demo"
                 st.rerun()
 
+        if is_admin(st.session_state.employee_name):
+            admin_col1, admin_col2, admin_col3, admin_col4, admin_col5 = st.columns(5)
+            with admin_col1:
+                if st.button("Route Analytics", use_container_width=True, key="route_analytics_mode"):
+                    st.session_state.selected_mode = "Route Analytics"
+                    st.rerun()
+            with admin_col2:
+                if st.button("Visit Verification", use_container_width=True, key="visit_verification_mode"):
+                    st.session_state.selected_mode = "Visit Verification"
+                    st.rerun()
+            with admin_col3:
+                if st.button("Attendance Report", use_container_width=True, key="attendance_report_mode"):
+                    st.session_state.selected_mode = "Attendance Report"
+                    st.rerun()
+            with admin_col4:
+                if st.button("Analytics", use_container_width=True, key="analytics_mode"):
+                    st.session_state.selected_mode = "Analytics"
+                    st.rerun()
+            with admin_col5:
+                if st.button("Ticket Triage", use_container_width=True, key="ticket_triage_mode"):
+                    st.session_state.selected_mode = "Ticket Triage"
+                    st.rerun()
+
         if st.session_state.selected_mode:
             add_back_button()
 
@@ -1704,6 +2156,16 @@ def main():
                 travel_hotel_page()
             elif st.session_state.selected_mode == "Demo":
                 demo_page()
+            elif st.session_state.selected_mode == "Route Analytics" and is_admin(st.session_state.employee_name):
+                route_analytics_page()
+            elif st.session_state.selected_mode == "Visit Verification" and is_admin(st.session_state.employee_name):
+                visit_verification_page()
+            elif st.session_state.selected_mode == "Attendance Report" and is_admin(st.session_state.employee_name):
+                attendance_report_page()
+            elif st.session_state.selected_mode == "Analytics" and is_admin(st.session_state.employee_name):
+                analytics_page()
+            elif st.session_state.selected_mode == "Ticket Triage" and is_admin(st.session_state.employee_name):
+                ticket_triage_page()
 
 
 def sales_page():
@@ -1715,6 +2177,7 @@ def sales_page():
     
     with tab1:
         discount_category = Person[Person['Employee Name'] == selected_employee]['Discount Category'].values[0]
+        territory_outlets, territory_distributors = employee_territory(selected_employee)
     
         st.subheader("Transaction Details")
         transaction_type = st.selectbox(
@@ -1814,10 +2277,17 @@ def sales_page():
         distributor_contact_number = distributor_email = distributor_territory = ""
     
         if distributor_option == "Select from list":
-            distributor_names = Distributors['Firm Name'].tolist()
-            selected_distributor = st.selectbox("Select Distributor", distributor_names, key="distributor_select")
-            dd = Distributors[Distributors['Firm Name'] == selected_distributor].iloc[0]
-            distributor_firm_name      = selected_distributor
+            distributor_ids = territory_distributors
+            if distributor_ids is None or st.checkbox("Show distributors outside my territory", key="distributor_all_territories"):
+                distributor_ids = range(len(Distributors))
+            selected_distributor = st.selectbox(
+                "Select Distributor",
+                list(distributor_ids),
+                format_func=lambda i: Distributors['Firm Name'].iat[i],
+                key="distributor_select"
+            )
+            dd = Distributors.iloc[selected_distributor]
+            distributor_firm_name      = dd['Firm Name']
             distributor_id             = dd['Distributor ID']
             distributor_contact_person = dd['Contact Person']
             distributor_contact_number = dd['Contact Number']
@@ -1833,12 +2303,13 @@ def sales_page():
         st.subheader("Outlet Details")
         outlet_option = st.radio("Outlet Selection", ["Enter manually", "Select from list"], key="outlet_option")
         if outlet_option == "Select from list":
-            outlet_names = Outlet['Shop Name'].tolist()
-            chosen_outlet = st.selectbox("Select Outlet", outlet_names, key="outlet_select")
-            od = Outlet[Outlet['Shop Name'] == chosen_outlet].iloc[0]
-            customer_name, gst_number = chosen_outlet, od['GST']
-            contact_number, address = od['Contact'], od['Address']
-            state, city = od['State'], od['City']
+            od = outlet_picker("sales_outlet", "outlet_select", scope=territory_outlets)
+            if od is not None:
+                customer_name, gst_number = od['Shop Name'], od['GST']
+                contact_number, address = od['Contact'], od['Address']
+                state, city = od['State'], od['City']
+            else:
+                customer_name = gst_number = contact_number = address = state = city = ""
     
             st.text_input("GST Number", value=gst_number, disabled=True, key="outlet_gst_display")
             st.text_input("Contact Number", value=contact_number, disabled=True, key="outlet_contact_display")
@@ -1850,77 +2321,69 @@ def sales_page():
             gst_number    = st.text_input("GST Number", key="manual_gst_number")
             contact_number = st.text_input("Contact Number", key="manual_contact_number")
             address        = st.text_area("Address", key="manual_address")
-            state          = st.text_input("State", "", key="manual_state")
-            city           = st.text_input("City", "", key="manual_city")
+            state, city    = state_city_inputs("State", "City", "manual_state", "manual_city")
     
         if st.button("Generate Invoice", key="generate_invoice_button"):
             if selected_products and customer_name:
                 invoice_number = generate_invoice_number()
-                pdf, pdf_path = generate_invoice(
-                    customer_name, gst_number, contact_number, address, state, city,
-                    selected_products, quantities, product_discounts, discount_category,
-                    selected_employee, payment_status, amount_paid, None, None,
-                    invoice_number, transaction_type,
-                    distributor_firm_name, distributor_id, distributor_contact_person,
-                    distributor_contact_number, distributor_email, distributor_territory,
-                    "",  # remarks
-                )
-                with open(pdf_path, "rb") as f:
+                try:
+                    pdf_bytes, pdf_path = generate_invoice(
+                        customer_name, gst_number, contact_number, address, state, city,
+                        selected_products, quantities, product_discounts, discount_category,
+                        selected_employee, payment_status, amount_paid, None, None,
+                        invoice_number, transaction_type,
+                        distributor_firm_name, distributor_id, distributor_contact_person,
+                        distributor_contact_number, distributor_email, distributor_territory,
+                        "",  # remarks
+                    )
+                except RenderQueueFull as e:
+                    st.warning(str(e))
+                else:
                     st.download_button(
                         "Download Invoice",
-                        f,
+                        pdf_bytes,
                         file_name=f"{invoice_number}.pdf",
                         mime="application/pdf",
                         key=f"download_{invoice_number}"
                     )
-                st.success(f"Invoice {invoice_number} generated successfully!")
-                st.balloons()
+                    st.success(f"Invoice {invoice_number} generated successfully!")
+                    st.balloons()
             else:
                 st.error("Please fill all required fields and select products.")
 
     
     with tab2:
+        # Invoices written or edited by the other apps change the sheet's
+        # fingerprint, which folds them in before the summary and list are shown
+        sync_sales_sheet()
+        
+        with st.expander("📊 Sales Summary", expanded=False):
+            sales_summary(Person[Person['Employee Name'] == st.session_state.employee_name]['Employee Code'].values[0])
+        
         st.subheader("Your Sales History")
         
-        @st.cache_data(ttl=300)
-        def load_sales_data():
-            try:
-                sales_data = conn.read(worksheet="Sales", ttl=5)
-                sales_data = sales_data.dropna(how='all')
-                
-                # Convert columns to proper types
-                sales_data = sales_data.copy()
-                sales_data['Outlet Name'] = sales_data['Outlet Name'].astype(str)
-                sales_data['Invoice Number'] = sales_data['Invoice Number'].astype(str)
-                
-                # Convert Invoice Date properly
-                try:
-                    sales_data['Invoice Date'] = pd.to_datetime(sales_data['Invoice Date'], dayfirst=True, errors='coerce')
-                except:
-                    # Fallback if date parsing fails
-                    sales_data['Invoice Date'] = pd.to_datetime(sales_data['Invoice Date'], errors='coerce')
-                
-                # Convert numeric columns properly
-                numeric_cols = ['Grand Total', 'Unit Price', 'Total Price', 'Product Discount (%)', 'Quantity']
-                for col in numeric_cols:
-                    if col in sales_data.columns:
-                        sales_data[col] = pd.to_numeric(sales_data[col], errors='coerce')
-                
-                # Filter for current employee
-                employee_code = Person[Person['Employee Name'] == st.session_state.employee_name]['Employee Code'].values[0]
-                filtered_data = sales_data[sales_data['Employee Code'] == employee_code]
-                
-                # Ensure we have valid dates
-                filtered_data = filtered_data[filtered_data['Invoice Date'].notna()]
-                
-                return filtered_data
-            except Exception as e:
-                st.error(f"Error loading sales data: {e}")
-                return pd.DataFrame()
-    
-        sales_data = load_sales_data()
+        employee_code = Person[Person['Employee Name'] == st.session_state.employee_name]['Employee Code'].values[0]
+        invoice_index = get_invoice_index()
+        
+        def load_invoice_lines(invoice_numbers):
+            """Sales rows and the invoices' line items, fetched by offset from the invoice index"""
+            sales_data, fingerprint = load_sales_data()
+            if sales_data.empty:
+                return sales_data, sales_data
+            invoice_lines = invoice_index.lines(sales_data, invoice_numbers)
+            if invoice_lines is None:
+                # The cached sheet predates a write made in this app
+                load_sales_data.clear()
+                sales_data, fingerprint = load_sales_data()
+                invoice_index.refresh(sales_data, fingerprint)
+                invoice_lines = invoice_index.lines(sales_data, invoice_numbers)
+                if invoice_lines is None:
+                    invoice_index.sync(sales_data, fingerprint)
+                    invoice_lines = invoice_index.lines(sales_data, invoice_numbers)
+            return sales_data, invoice_lines
         
-        if sales_data.empty:
+        
+        if invoice_index.headers(employee_code).empty:
             st.warning("No sales records found for your account")
             return
             
@@ -1936,46 +2399,24 @@ def sales_page():
             if st.button("Apply Filters", key="search_sales_button"):
                 st.rerun()
         
-        filtered_data = sales_data.copy()
-        
-        # Apply filters
-        if invoice_number_search:
-            filtered_data = filtered_data[
-                filtered_data['Invoice Number'].str.contains(invoice_number_search, case=False, na=False)
-            ]
-        
-        if invoice_date_search:
-            date_str = invoice_date_search.strftime("%d-%m-%Y")
-            filtered_data = filtered_data[
-                filtered_data['Invoice Date'].dt.strftime('%d-%m-%Y') == date_str
-            ]
-        
-        if outlet_name_search:
-            filtered_data = filtered_data[
-                filtered_data['Outlet Name'].str.contains(outlet_name_search, case=False, na=False)
-            ]
+        # One row per invoice, maintained when invoices are written
+        invoice_summary = invoice_index.headers(
+            employee_code,
+            invoice_number=invoice_number_search,
+            invoice_date=invoice_date_search,
+            outlet_name=outlet_name_search
+        )
+        invoice_summary = invoice_summary[invoice_summary['Invoice Date'].notna()]
         
-        if filtered_data.empty:
+        if invoice_summary.empty:
             st.warning("No matching records found")
             return
-            
-        # Calculate correct grand total by invoice
-        invoice_summary = filtered_data.groupby('Invoice Number').agg({
-            'Invoice Date': 'first',
-            'Outlet Name': 'first',
-            'Grand Total': 'sum',
-            'Payment Status': 'first',
-            'Delivery Status': 'first'
-        }).reset_index()
-        
-        # Sort by date descending
-        invoice_summary = invoice_summary.sort_values('Invoice Date', ascending=False)
         
         st.write(f"📄 Showing {len(invoice_summary)} of your invoices")
         
         # Display the summary table
         st.dataframe(
-            invoice_summary,
+            invoice_summary[['Invoice Number', 'Invoice Date', 'Outlet Name', 'Grand Total', 'Payment Status', 'Delivery Status']],
             column_config={
                 "Grand Total": st.column_config.NumberColumn(
                     format="₹%.2f",
@@ -1990,23 +2431,82 @@ def sales_page():
             hide_index=True
         )
         
+        with st.expander("📦 Export Invoices"):
+            st.caption("Exports every invoice matching the filters above.")
+            export_col1, export_col2 = st.columns(2)
+            with export_col1:
+                export_prefix = st.text_input("Invoice Number Prefix", key="export_prefix")
+            with export_col2:
+                export_format = st.radio("Format", ["ZIP of PDFs", "Single merged PDF"], key="export_format")
+            
+            if st.button("Prepare Export", key="prepare_export_button"):
+                invoice_cache = get_invoice_cache()
+                export_numbers = invoice_summary['Invoice Number']
+                if export_prefix:
+                    export_numbers = export_numbers[export_numbers.str.upper().str.startswith(export_prefix.strip().upper())]
+                export_numbers = export_numbers.tolist()
+                sales_data, _ = load_invoice_lines(export_numbers)
+                invoice_groups = invoice_index.iter_invoices(sales_data, export_numbers, gst_numbers_by_outlet())
+                rendered_invoices = iter_rendered_invoices(
+                    invoice_groups,
+                    renderer=lambda line_items, header: render_invoice_cached(
+                        line_items, header, invoice_cache, renderer=render_invoice_pooled
+                    )
+                )
+                
+                # Rendered invoices are spooled to disk as they arrive; the finished
+                # file is then read once for the download button, which keeps it in memory
+                export_data = None
+                with tempfile.TemporaryFile() as export_file:
+                    try:
+                        with st.spinner("Rendering invoices..."):
+                            if export_format == "ZIP of PDFs":
+                                exported = write_invoices_zip(rendered_invoices, export_file)
+                                file_name, mime = "invoices.zip", "application/zip"
+                            else:
+                                exported, parts = write_invoices_merged(rendered_invoices, export_file)
+                                if parts > 1:
+                                    file_name, mime = "invoices_merged.zip", "application/zip"
+                                else:
+                                    file_name, mime = "invoices.pdf", "application/pdf"
+                    except RenderQueueFull as e:
+                        st.warning(str(e))
+                    else:
+                        export_file.seek(0)
+                        export_data = export_file.read()
+                
+                if export_data is not None:
+                    if exported:
+                        if export_format != "ZIP of PDFs" and parts > 1:
+                            st.caption(f"Large exports are split into {parts} merged PDFs of up to {MERGED_CHUNK_INVOICES} invoices each.")
+                        st.download_button(
+                            f"📥 Download {exported} Invoices",
+                            export_data,
+                            file_name=file_name,
+                            mime=mime,
+                            key="download_invoice_export"
+                        )
+                    else:
+                        st.warning("No invoices match the export filters")
+        
         selected_invoice = st.selectbox(
             "Select invoice to view details",
             invoice_summary['Invoice Number'],
             key="invoice_selection"
         )
+        invoice_header = invoice_summary.set_index('Invoice Number').loc[selected_invoice]
         
         # Delivery Status Section
         st.subheader("Delivery Status Management")
         
-        # Get all products for the selected invoice
-        invoice_details = filtered_data[filtered_data['Invoice Number'] == selected_invoice]
+        # Get all products for the selected invoice by their offsets into the Sales sheet
+        _, invoice_details = load_invoice_lines([selected_invoice])
         
         if not invoice_details.empty:
             # Create a form for delivery status updates
             with st.form(key='delivery_status_form'):
                 # Get current status for the invoice
-                current_status = invoice_details.iloc[0].get('Delivery Status', 'Pending')
+                current_status = invoice_header['Delivery Status'] or 'Pending'
                 
                 status_options = ["Pending", "Order Done", "Delivery Done", "Cancelled"]
                 new_status = st.selectbox(
@@ -2033,6 +2533,7 @@ def sales_page():
                             
                             # Write back the updated data
                             conn.update(worksheet="Sales", data=all_sales_data)
+                            invoice_index.set_delivery_status(selected_invoice, new_status)
                             
                             st.success(f"Delivery status updated to '{new_status}' for invoice {selected_invoice}!")
                             st.rerun()
@@ -2042,20 +2543,19 @@ def sales_page():
         # Display invoice details
         if not invoice_details.empty:
             invoice_data = invoice_details.iloc[0]
-            original_invoice_date = invoice_data['Invoice Date'].strftime('%d-%m-%Y')
+            original_invoice_date = invoice_header['Invoice Date'].strftime('%d-%m-%Y')
             
             st.subheader(f"Invoice {selected_invoice}")
             col1, col2 = st.columns(2)
             with col1:
                 st.metric("Date", original_invoice_date)
-                st.metric("Outlet", str(invoice_data['Outlet Name']))
+                st.metric("Outlet", str(invoice_header['Outlet Name']))
                 st.metric("Contact", str(invoice_data['Outlet Contact']))
             with col2:
-                # Calculate correct total for this invoice
-                invoice_total = invoice_details['Grand Total'].sum()
-                st.metric("Total Amount", f"₹{invoice_total:.2f}")
-                st.metric("Payment Status", str(invoice_data['Payment Status']).capitalize())
-                st.metric("Delivery Status", str(invoice_data.get('Delivery Status', 'Pending')).capitalize())
+                # Invoice total is kept on the header when the invoice is written
+                st.metric("Total Amount", f"₹{invoice_header['Grand Total']:.2f}")
+                st.metric("Payment Status", str(invoice_header['Payment Status']).capitalize())
+                st.metric("Delivery Status", str(invoice_header['Delivery Status'] or 'Pending').capitalize())
             
             st.subheader("Products")
             product_display = invoice_details[[
@@ -2085,44 +2585,23 @@ def sales_page():
             if st.button("🔄 Regenerate Invoice", key=f"regenerate_btn_{selected_invoice}"):
                 with st.spinner("Regenerating invoice..."):
                     try:
-                        pdf, pdf_path = generate_invoice(
-                            str(invoice_data['Outlet Name']),
-                            str(invoice_data.get('GST Number', '')),
-                            str(invoice_data['Outlet Contact']),
-                            str(invoice_data['Outlet Address']),
-                            str(invoice_data['Outlet State']),
-                            str(invoice_data['Outlet City']),
-                            invoice_details['Product Name'].astype(str).tolist(),
-                            invoice_details['Quantity'].tolist(),
-                            invoice_details['Product Discount (%)'].tolist(),
-                            str(invoice_data['Discount Category']),
-                            str(invoice_data['Employee Name']),
-                            str(invoice_data['Payment Status']),
-                            float(invoice_data['Amount Paid']),
-                            None,
-                            None,
-                            str(selected_invoice),
-                            str(invoice_data['Transaction Type']),
-                            str(invoice_data.get('Distributor Firm Name', '')),
-                            str(invoice_data.get('Distributor ID', '')),
-                            str(invoice_data.get('Distributor Contact Person', '')),
-                            str(invoice_data.get('Distributor Contact Number', '')),
-                            str(invoice_data.get('Distributor Email', '')),
-                            str(invoice_data.get('Distributor Territory', '')),
-                            str(invoice_data.get('Remarks', '')),
-                            original_invoice_date 
-                        )
+                        # Render from the stored line items only; the Sales sheet is left untouched
+                        header = with_gst_number(invoice_data.to_dict(), gst_numbers_by_outlet())
+                        header['Invoice Date'] = original_invoice_date
+                        invoice_cache = get_invoice_cache()
+                        pdf_bytes = render_invoice_cached(invoice_details.to_dict('records'), header, invoice_cache, renderer=render_invoice_pooled)
                         
-                        with open(pdf_path, "rb") as f:
-                            st.download_button(
-                                "📥 Download Regenerated Invoice", 
-                                f, 
-                                file_name=f"{selected_invoice}.pdf",
-                                mime="application/pdf",
-                                key=f"download_regenerated_{selected_invoice}"
-                            )
+                        st.download_button(
+                            "📥 Download Regenerated Invoice", 
+                            pdf_bytes, 
+                            file_name=f"{selected_invoice}.pdf",
+                            mime="application/pdf",
+                            key=f"download_regenerated_{selected_invoice}"
+                        )
                         
                         st.success("Invoice regenerated successfully with original date!")
+                        cache_stats = invoice_cache.stats()
+                        st.caption(f"PDF cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
                         st.balloons()
                     except Exception as e:
                         st.error(f"Error regenerating invoice: {e}")
@@ -2142,15 +2621,16 @@ def visit_page():
         outlet_option = st.radio("Outlet Selection", ["Enter manually", "Select from list"], key="visit_outlet_option")
         
         if outlet_option == "Select from list":
-            outlet_names = Outlet['Shop Name'].tolist()
-            selected_outlet = st.selectbox("Select Outlet", outlet_names, key="visit_outlet_select")
-            outlet_details = Outlet[Outlet['Shop Name'] == selected_outlet].iloc[0]
-            
-            outlet_name = selected_outlet
-            outlet_contact = outlet_details['Contact']
-            outlet_address = outlet_details['Address']
-            outlet_state = outlet_details['State']
-            outlet_city = outlet_details['City']
+            territory_outlets, _ = employee_territory(selected_employee)
+            outlet_details = outlet_picker("visit_outlet", "visit_outlet_select", scope=territory_outlets)
+            if outlet_details is not None:
+                outlet_name = outlet_details['Shop Name']
+                outlet_contact = outlet_details['Contact']
+                outlet_address = outlet_details['Address']
+                outlet_state = outlet_details['State']
+                outlet_city = outlet_details['City']
+            else:
+                outlet_name = outlet_contact = outlet_address = outlet_state = outlet_city = ""
             
             # Show outlet details like distributor details
             st.text_input("Outlet Contact", value=outlet_contact, disabled=True, key="outlet_contact_display")
@@ -2161,8 +2641,7 @@ def visit_page():
             outlet_name = st.text_input("Outlet Name", key="visit_outlet_name")
             outlet_contact = st.text_input("Outlet Contact", key="visit_outlet_contact")
             outlet_address = st.text_area("Outlet Address", key="visit_outlet_address")
-            outlet_state = st.text_input("Outlet State", "", key="visit_outlet_state")
-            outlet_city = st.text_input("Outlet City", "", key="visit_outlet_city")
+            outlet_state, outlet_city = state_city_inputs("Outlet State", "Outlet City", "visit_outlet_state", "visit_outlet_city")
 
         st.subheader("Visit Details")
         visit_purpose = st.selectbox("Visit Purpose", ["Sales", "Demo", "Product Demonstration", "Relationship Building", "Issue Resolution", "Other"], key="visit_purpose")
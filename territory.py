@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+# States covered by each employee Zone in the Person master
+ZONE_STATES = {
+    "NORTH ZONE": [
+        "Delhi", "Haryana", "Punjab", "Chandigarh", "Uttar Pradesh", "Uttarakhand",
+        "Himachal Pradesh", "Jammu & Kashmir", "Ladakh", "Rajasthan"
+    ],
+    "EAST ZONE": [
+        "West Bengal", "Odisha", "Jharkhand", "Bihar", "Assam", "Meghalaya", "Tripura",
+        "Arunachal Pradesh", "Manipur", "Mizoram", "Nagaland", "Sikkim",
+        "Andaman and Nicobar Islands"
+    ],
+    "WEST ZONE": ["Maharashtra", "Gujarat", "Goa", "Dadra and Nagar Haveli and Daman and Diu"],
+    "SOUTH ZONE": ["Tamil Nadu", "Kerala", "Karnataka", "Telangana", "Andhra Pradesh", "Puducherry", "Lakshadweep"],
+    "CENTRAL ZONE": ["Madhya Pradesh", "Chhattisgarh"]
+}
+
+# Spellings used in the Outlet/Distributor masters that differ from ZONE_STATES
+STATE_ALIASES = {
+    "up west": "Uttar Pradesh",
+    "up east": "Uttar Pradesh",
+    "delhi ncr": "Delhi",
+    "tamilnadu": "Tamil Nadu",
+    "uttrakhand": "Uttarakhand",
+    "himachal": "Himachal Pradesh",
+    "chattishgarh": "Chhattisgarh",
+    "orissa": "Odisha",
+    "jammu and kashmir": "Jammu & Kashmir"
+}
+
+STATE_ZONE = {state.lower(): zone for zone, states in ZONE_STATES.items() for state in states}
+
+
+def zone_for_state(state):
+    """Map a free-form State value to its employee Zone, or None if unknown"""
+    if not isinstance(state, str):
+        return None
+    key = " ".join(state.strip().lower().split())
+    key = STATE_ALIASES.get(key, key).lower()
+    return STATE_ZONE.get(key)
+
+
+class TerritoryIndex:
+    """Per-Zone outlet and distributor subsets stored as row-position arrays.
+
+    Build it from the current master frames; rebuild it whenever they are
+    reloaded so the positions stay valid.
+    """
+
+    def __init__(self, outlets, distributors):
+        self.outlet_ids = self._group_by_zone(outlets['State'])
+        self.distributor_ids = self._group_by_zone(distributors['State'])
+
+    @staticmethod
+    def _group_by_zone(states):
+        zones = pd.Series([zone_for_state(s) for s in states], dtype=object)
+        # Rows without a recognised state (e.g. the "Primary" outlet) stay visible in every zone
+        unmapped = zones.isna().to_numpy()
+        return {
+            zone: np.flatnonzero((zones == zone).to_numpy() | unmapped)
+            for zone in ZONE_STATES
+        }
+
+    def outlets_for(self, zone):
+        """Outlet row positions for a Zone, or None when the Zone is not territorial"""
+        return self.outlet_ids.get(str(zone).strip().upper()) if isinstance(zone, str) else None
+
+    def distributors_for(self, zone):
+        """Distributor row positions for a Zone, or None when the Zone is not territorial"""
+        return self.distributor_ids.get(str(zone).strip().upper()) if isinstance(zone, str) else None
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+
+from location_store import update_sheet_row
+from sheet_schemas import TICKETS
+
+
+class ReadOnlyConnection:
+    """A connection without a gspread worksheet, so writes take the read + update fallback"""
+
+    client = object()
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.written = None
+
+    def read(self, **kwargs):
+        return self.frame.copy()
+
+    def update(self, worksheet, data):
+        self.written = data
+
+
+def test_update_sheet_row_fallback_fills_blank_columns():
+    # Open tickets have no Resolution Notes or Date Resolved, so those columns read as all-NaN float64
+    frame = TICKETS.to_frame([
+        TICKETS.record(ticket_id="T1", subject="Login"),
+        TICKETS.record(ticket_id="T2", subject="Printer")
+    ])
+    frame["Resolution Notes"] = np.nan
+    frame["Date Resolved"] = np.nan
+    conn = ReadOnlyConnection(frame)
+
+    position = update_sheet_row(
+        conn, "Tickets", TICKETS.columns, "Ticket ID", "T2",
+        {"Status": "Resolved", "Resolution Notes": "Replaced toner", "Date Resolved": "19-10-2026"}
+    )
+
+    assert position == 1
+    written = conn.written.set_index("Ticket ID")
+    assert written.loc["T2", "Status"] == "Resolved"
+    assert written.loc["T2", "Resolution Notes"] == "Replaced toner"
+    assert written.loc["T2", "Date Resolved"] == "19-10-2026"
+    assert pd.isna(written.loc["T1", "Date Resolved"])
@@ -0,0 +1,225 @@
+import heapq
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import pandas as pd
+
+from sheet_schemas import TICKETS
+
+PRIORITY_ORDER = ["Critical", "High", "Medium", "Low"]
+OPEN_STATUS = "Open"
+
+# Fields the store indexes, as TicketRow attribute names
+INDEXED_FIELDS = ("status", "priority", "category", "employee_code")
+
+# A ticket changed here is not overwritten from a sheet read for this long,
+# so a cached read taken just before the write cannot undo it
+LOCAL_WRITE_GRACE_SECONDS = 120
+
+
+def _raised_key(row):
+    try:
+        return datetime.strptime(f"{row.date_raised} {row.time_raised}".strip(), "%d-%m-%Y %H:%M:%S").timestamp()
+    except ValueError:
+        return float("inf")
+
+
+def _priority_rank(priority):
+    return PRIORITY_ORDER.index(priority) if priority in PRIORITY_ORDER else len(PRIORITY_ORDER)
+
+
+def _walk(heap, key):
+    """Yield (entry, key) for a heap's entries in sorted order without popping them.
+
+    A small frontier heap holds the next candidates (a node's children only
+    become candidates once the node is yielded), so the k-th entry costs
+    O(log k) and nothing past the last one asked for is visited.
+    """
+    frontier = [(heap[0], 0)] if heap else []
+    while frontier:
+        entry, i = heapq.heappop(frontier)
+        yield entry, key
+        for child in (2 * i + 1, 2 * i + 2):
+            if child < len(heap):
+                heapq.heappush(frontier, (heap[child], child))
+
+
+class TicketStore:
+    """Tickets indexed by Status, Priority, Category and Employee Code, with
+    queues of open tickets ordered by Priority, then oldest Date Raised first.
+
+    Open tickets are kept in one heap per (Priority, Category), so a queue
+    filtered by either is a walk over a few heaps in order: each ticket on a
+    page costs O(log n) and pages are read without sorting the whole queue.
+    Closed or re-prioritised tickets are dropped from the heaps lazily
+    (stale entries are skipped and a heap is compacted when they outnumber
+    live ones); per-queue counts are kept as tickets open and close.
+
+    Each ticket also remembers the sheet row it was last read from, but only
+    as a hint: a ticket added here has none until a sheet read confirms it,
+    and writers must check the row still holds the ticket before using it.
+    """
+
+    def __init__(self, grace_seconds=LOCAL_WRITE_GRACE_SECONDS):
+        self.grace_seconds = grace_seconds
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._positions = {}
+        self._index = {field: defaultdict(set) for field in INDEXED_FIELDS}
+        self._heaps = defaultdict(list)
+        self._queued = {}
+        self._open_counts = Counter()
+        self._touched = {}
+        self._fingerprint = None
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _unindex(self, row):
+        for field in INDEXED_FIELDS:
+            self._index[field][getattr(row, field)].discard(row.ticket_id)
+
+    def _dequeue(self, ticket_id):
+        queued = self._queued.pop(ticket_id, None)
+        if queued is not None:
+            self._open_counts[queued[0]] -= 1
+
+    def _put(self, row):
+        old = self._rows.get(row.ticket_id)
+        if old is not None:
+            self._unindex(old)
+        self._rows[row.ticket_id] = row
+        for field in INDEXED_FIELDS:
+            self._index[field][getattr(row, field)].add(row.ticket_id)
+
+        if row.status != OPEN_STATUS:
+            self._dequeue(row.ticket_id)
+            return
+        key = (_priority_rank(row.priority), row.category)
+        queued = (key, (_raised_key(row), row.ticket_id))
+        if self._queued.get(row.ticket_id) == queued:
+            return
+        self._dequeue(row.ticket_id)
+        self._queued[row.ticket_id] = queued
+        self._open_counts[key] += 1
+        heap = self._heaps[key]
+        heapq.heappush(heap, queued[1])
+        if len(heap) > 2 * self._open_counts[key] + 64:
+            heap[:] = [entry for k, entry in self._queued.values() if k == key]
+            heapq.heapify(heap)
+
+    def sync(self, frame):
+        """Fold a Tickets sheet read in: new tickets are added, changed ones
+        updated (unless changed here within the grace period) and every
+        ticket's row position refreshed.
+
+        Positions count every row of the read, blank ones included, so they
+        line up with the sheet as long as the read did not drop rows.
+        """
+        fingerprint = (len(frame), int(pd.util.hash_pandas_object(frame.astype(str), index=False).sum()))
+        if fingerprint == self._fingerprint:
+            return len(self._rows)
+        rows = TICKETS.from_frame(frame)
+        now = time.monotonic()
+        with self._lock:
+            self._fingerprint = fingerprint
+            self._positions = {}
+            for position, row in enumerate(rows):
+                if not row.ticket_id:
+                    continue
+                self._positions[row.ticket_id] = position
+                if now - self._touched.get(row.ticket_id, -self.grace_seconds) < self.grace_seconds:
+                    continue
+                if self._rows.get(row.ticket_id) != row:
+                    self._put(row)
+        return len(self._rows)
+
+    def add(self, row):
+        """Index a ticket just appended to the sheet; its row is unknown until the next sync"""
+        with self._lock:
+            self._touched[row.ticket_id] = time.monotonic()
+            self._put(row)
+
+    def changes(self, ticket_id, **changes):
+        """The {column: value} cells that `changes` would alter on a ticket's row"""
+        row = self._rows[ticket_id]
+        return {
+            TICKETS.fields[field]: value
+            for field, value in changes.items() if getattr(row, field) != value
+        }
+
+    def update(self, ticket_id, **changes):
+        """Apply changes already written to the sheet"""
+        with self._lock:
+            self._touched[ticket_id] = time.monotonic()
+            self._put(self._rows[ticket_id]._replace(**changes))
+
+    def position(self, ticket_id):
+        """Row the ticket was last read from (0 = first row under the header), or None"""
+        return self._positions.get(ticket_id)
+
+    def set_position(self, ticket_id, position):
+        with self._lock:
+            self._positions[ticket_id] = position
+
+    def get(self, ticket_id):
+        return self._rows.get(ticket_id)
+
+    def counts(self, field):
+        """Number of tickets per value of an indexed field"""
+        with self._lock:
+            return {value: len(ids) for value, ids in self._index[field].items() if ids}
+
+    def query(self, **criteria):
+        """Tickets matching every given indexed field, newest first, e.g.
+        `query(status="Open", category="Accounts")`"""
+        with self._lock:
+            ids = None
+            for field, value in criteria.items():
+                if value is None:
+                    continue
+                matched = self._index[field].get(value, set())
+                ids = set(matched) if ids is None else ids & matched
+            rows = list(self._rows.values()) if ids is None else [self._rows[i] for i in ids]
+        return sorted(rows, key=_raised_key, reverse=True)
+
+    def _queue_keys(self, priority, category):
+        """Heap keys of a filtered queue, grouped by priority rank in queue order"""
+        ranks = range(len(PRIORITY_ORDER) + 1) if priority is None else [_priority_rank(priority)]
+        for rank in ranks:
+            yield [key for key in self._heaps if key[0] == rank and (category is None or key[1] == category)]
+
+    def _iter_open(self, priority, category):
+        seen = set()
+        for keys in self._queue_keys(priority, category):
+            # Within one priority the categories' heaps are merged by Date Raised
+            walks = [_walk(self._heaps[key], key) for key in keys]
+            for entry, key in heapq.merge(*walks):
+                ticket_id = entry[1]
+                # Skip entries left behind when a ticket closed or changed queue
+                if ticket_id in seen or self._queued.get(ticket_id) != (key, entry):
+                    continue
+                seen.add(ticket_id)
+                yield self._rows[ticket_id]
+
+    def next_open(self):
+        """The most urgent open ticket, or None"""
+        page = self.open_queue(0, 1)
+        return page[0] if page else None
+
+    def open_queue(self, offset=0, limit=20, priority=None, category=None):
+        """One page of open tickets in queue order (Priority, then oldest first)"""
+        with self._lock:
+            tickets = self._iter_open(priority, category)
+            for _ in zip(range(offset), tickets):
+                pass
+            return [ticket for _, ticket in zip(range(limit), tickets)]
+
+    def open_count(self, priority=None, category=None):
+        """Open tickets in a filtered queue, from the per-queue counts"""
+        with self._lock:
+            return sum(
+                self._open_counts[key] for keys in self._queue_keys(priority, category) for key in keys
+            )